@@ -11,9 +11,14 @@ import time
 from datetime import datetime
 
 # Import eigener Module
+import config
 from config import *
 from database import *
-from relay_controller import RelayController
+from relay_daemon import RelayClient, ensure_relay_daemon, stop_relay_daemon
+from relay_layout import RELAY_LAYOUT, TOTAL_RELAYS
+from bus_metrics import render_prometheus
+from log_buffer import dump_log
+from config_store import watch_config
 from exam_utils import *
 from group_manager import *
 from settings_manager import *
@@ -27,26 +32,39 @@ from network_manager import (
     connect_to_wifi, get_current_connection, get_network_info,
     get_ethernet_info
 )
-from gpio_monitor import init_gpio_monitor, get_gpio_status, cleanup_gpio
+from gpio_monitor import (init_gpio_monitor, get_gpio_status, wait_for_gpio_status,
+                          gpio_status_stream, add_notaus_callback, cleanup_gpio)
 
 # Flask App initialisieren
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
 app.jinja_loader = FileSystemLoader('templates', encoding='utf-8')
 
+
+@app.context_processor
+def inject_relay_layout():
+    """Relais-Anzahl und Module für alle Templates (aus MODBUS_MODULES abgeleitet)"""
+    return {
+        'relay_count': RELAY_LAYOUT.relay_count,
+        'relay_modules': RELAY_LAYOUT.modules,
+    }
+
 # Logging-Filter für GPIO-Status API
 import logging
 class NoGPIOStatusFilter(logging.Filter):
     def filter(self, record):
-        # Filtere /api/gpio/status Requests heraus
-        return '/api/gpio/status' not in record.getMessage()
+        # Filtere /api/gpio/status Requests (Fallback-Polling ohne EventSource)
+        # und regelmäßige /metrics-Abfragen heraus
+        message = record.getMessage()
+        return '/api/gpio/status' not in message and 'GET /metrics' not in message
 
 # Füge Filter zu Werkzeug-Logger hinzu
 werkzeug_logger = logging.getLogger('werkzeug')
 werkzeug_logger.addFilter(NoGPIOStatusFilter())
 
 # Globale Instanzen
-relay_controller = RelayController()
+# Der Bus gehört dem Relais-Daemon; jeder Worker spricht ihn nur über den Unix-Socket an
+relay_controller = RelayClient()
 exam_active = False
 
 # GPIO-Monitor initialisieren (Standard: GPIO 17 und 27)
@@ -121,9 +139,8 @@ def start_exam():
     exam_number = request.json.get('exam_number')
     selected_relays = select_random_relays()
     
-    # Relais aktivieren (Gruppen werden automatisch zusammen geschaltet)
-    for relay_id in selected_relays:
-        relay_controller.set_relay(relay_id, True)
+    # Komplette Fehler-Szene auf einmal schalten (ein FC15 pro Modul, Gruppen inklusive)
+    relay_controller.apply_scene(selected_relays)
     
     # In Datenbank speichern (wird automatisch normalisiert)
     save_examination(exam_number, selected_relays)
@@ -173,7 +190,7 @@ def manual_mode():
 
         # Finde alle Relais mit diesem Stromkreis
         relais_in_stromkreis = []
-        for relay_num in range(64):
+        for relay_num in RELAY_LAYOUT.relays():
             relay_data = relais_config.get(relay_num, {})
             if relay_data.get('stromkreis') == sk_data['name']:
                 relais_in_stromkreis.append(relay_num)
@@ -228,34 +245,21 @@ def set_manual_errors():
         if not errors:
             return jsonify({'success': False, 'error': 'Keine Fehler ausgewählt'})
         
-        # Alle Relais zurücksetzen
-        relay_controller.reset_all_relays()
-        
         # Sammle nur eindeutige Repräsentanten (bei Gruppen)
         unique_relays = set()
         for stromkreis_key, relay_id in errors.items():
             try:
                 relay_id = int(relay_id)
-                if 0 <= relay_id <= 63:
-                    # Normalisiere zu Gruppen-Repräsentant
-                    representative = relay_controller.normalize_relay_to_group_representative(relay_id)
+                if RELAY_LAYOUT.is_valid(relay_id):
+                    # Normalisiere zu Gruppen-Repräsentant (lokal, ohne Umweg über den Daemon)
+                    representative = normalize_relay_to_representative(relay_id)
                     unique_relays.add(representative)
             except ValueError:
                 pass
         
-        activated_count = 0
-        activated_relays = []
-        failed_relays = []
-        
-        # Aktiviere eindeutige Relais/Gruppen
-        for relay_id in unique_relays:
-            if relay_controller.set_relay(relay_id, True):
-                activated_count += 1
-                activated_relays.append(relay_id)
-                print(f"✅ Relay/Group {relay_id} activated")
-            else:
-                failed_relays.append(relay_id)
-                print(f"❌ Failed to activate relay {relay_id}")
+        # Szene schalten: nur die gewählten Relais/Gruppen an, alle anderen aus
+        activated_relays, failed_relays = relay_controller.apply_scene(sorted(unique_relays))
+        activated_count = len(activated_relays)
         
         return jsonify({
             'success': activated_count > 0,
@@ -296,26 +300,46 @@ def relay_status_page():
 
 @app.route('/api/relay_status', methods=['GET'])
 def api_relay_status():
-    """API Endpoint zum Auslesen aller Relay-Status"""
+    """
+    API Endpoint zum Auslesen aller Relay-Status
+    Liefert den Hardware-Snapshot des Relais-Daemons, der Bus wird nur gelesen,
+    wenn der Snapshot älter als ?max_age=<Sekunden> ist (Standard: RELAY_SNAPSHOT_MAX_AGE).
+    ?format=hex liefert statt des ausführlichen Dictionaries nur die Bitmaske als Hex-String
+    """
     try:
-        relay_status = relay_controller.read_all_relay_status()
+        try:
+            max_age = max(0.0, float(request.args.get('max_age', RELAY_SNAPSHOT_MAX_AGE)))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Ungültiger Wert für max_age'}), 400
 
-        if relay_status is None:
+        snapshot = relay_controller.get_relay_snapshot(max_age)
+
+        if snapshot is None:
             return jsonify({
                 'success': False,
                 'error': 'Konnte Relais-Status nicht auslesen'
             })
 
-        # Zähle aktive Relais
-        active_count = sum(1 for state in relay_status.values() if state)
-        active_relays = [num for num, state in relay_status.items() if state]
+        hardware_state, timestamp, age = snapshot
+
+        if request.args.get('format') == 'hex':
+            return jsonify({
+                'success': True,
+                'mask': hardware_state.to_hex(TOTAL_RELAYS),
+                'active_count': hardware_state.count(),
+                'total_count': RELAY_LAYOUT.relay_count,
+                'timestamp': timestamp,
+                'age': age
+            })
 
         return jsonify({
             'success': True,
-            'relays': relay_status,
-            'active_count': active_count,
-            'total_count': len(relay_status),
-            'active_relays': active_relays
+            'relays': {relay: relay in hardware_state for relay in RELAY_LAYOUT.relays()},
+            'active_count': hardware_state.count(),
+            'total_count': RELAY_LAYOUT.relay_count,
+            'active_relays': hardware_state.to_list(),
+            'timestamp': timestamp,
+            'age': age
         })
     except Exception as e:
         print(f"ERROR in api_relay_status: {e}")
@@ -337,81 +361,105 @@ def test_mode():
 
 @app.route('/run_test', methods=['POST'])
 def run_test():
-    """Führt einen vollständigen Relais-Test durch"""
-    try:
-        success = relay_controller.test_all_relays()
-        return jsonify({'success': success})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+    """Startet den Relais-Test als Hintergrund-Job im Relais-Daemon (kehrt sofort zurück)"""
+    job, error, _ = relay_controller.submit_job('relay_test')
+    if job is None:
+        return jsonify({'success': False, 'error': error})
+    return jsonify({'success': True, 'job_id': job['id']})
 
 
 @app.route('/run_test_stream')
 def run_test_stream():
-    """Führt Relais-Test mit Live-Updates via Server-Sent Events durch"""
-    def generate():
-        try:
-            yield f"data: {json.dumps({'type': 'start', 'total': 64})}\n\n"
-
-            failed_relays = []
-
-            for relay in range(64):
-                # Relais einschalten
-                yield f"data: {json.dumps({'type': 'testing', 'relay': relay, 'action': 'on'})}\n\n"
-
-                if not relay_controller.set_relay(relay, True):
-                    failed_relays.append({'relay': relay, 'error': 'Konnte nicht einschalten'})
-                    yield f"data: {json.dumps({'type': 'error', 'relay': relay, 'error': 'Einschalten fehlgeschlagen'})}\n\n"
-                    continue
-
-                time.sleep(1.0)
-
-                # Modbus-Readback prüfen ob Relais AN ist
-                status = relay_controller.read_all_relay_status()
-                modbus_ok = status and status.get(relay, False) == True
-
-                yield f"data: {json.dumps({'type': 'status', 'relay': relay, 'modbus_ok': modbus_ok, 'state': 'on'})}\n\n"
-
-                if not modbus_ok:
-                    failed_relays.append({'relay': relay, 'error': 'Modbus: Relais nicht AN'})
-
-                time.sleep(1.5)  # Grüne Anzeige länger sichtbar
-
-                # Relais ausschalten
-                yield f"data: {json.dumps({'type': 'testing', 'relay': relay, 'action': 'off'})}\n\n"
-
-                if not relay_controller.set_relay(relay, False):
-                    failed_relays.append({'relay': relay, 'error': 'Konnte nicht ausschalten'})
-
-                time.sleep(0.5)
-
-                # Modbus-Readback prüfen ob ALLE Relais AUS sind
-                status = relay_controller.read_all_relay_status()
-                any_on = False
-                active_relays = []
-                if status:
-                    for r, state in status.items():
-                        if state:
-                            any_on = True
-                            active_relays.append(r)
-
-                all_off_ok = not any_on
-                yield f"data: {json.dumps({'type': 'all_off', 'modbus_ok': all_off_ok, 'active_relays': active_relays})}\n\n"
-
-                if not all_off_ok:
-                    failed_relays.append({'relay': relay, 'error': f'Modbus: Relais noch aktiv: {active_relays}'})
-
-                time.sleep(1.5)  # Blaue Anzeige länger sichtbar
-
-                # Fortschritt
-                yield f"data: {json.dumps({'type': 'progress', 'relay': relay, 'done': relay + 1, 'total': 64})}\n\n"
-
-            # Test abgeschlossen
-            yield f"data: {json.dumps({'type': 'complete', 'success': len(failed_relays) == 0, 'failed': failed_relays})}\n\n"
-
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
-
-    return Response(generate(), mimetype='text/event-stream')
+    """
+    Ereignisse eines laufenden Relais-Tests via Server-Sent Events (?job_id=<ID>)
+    Startet selbst keinen Job - erst POST /api/jobs bzw. /run_test. EventSource verbindet
+    sich nach jedem Abbruch automatisch neu und würde sonst jedes Mal einen Test starten.
+    """
+    job_id = request.args.get('job_id')
+    if not job_id:
+        def failed():
+            yield f"data: {json.dumps({'type': 'error', 'error': 'job_id fehlt - Job zuerst mit POST /api/jobs starten'})}\n\n"
+        # Kein 200: EventSource gibt auf statt neu zu verbinden
+        return Response(failed(), status=400, mimetype='text/event-stream')
+
+    return api_job_stream(job_id)
+
+
+def job_event_stream(job_id, since=0):
+    """
+    Generator für Server-Sent Events eines Jobs (Long-Poll im Daemon)
+    Endet, wenn der Job beendet und alle Ereignisse gesendet sind.
+    """
+    while True:
+        job = relay_controller.wait_job(job_id, since, JOB_STREAM_KEEPALIVE)
+        if job is None:
+            yield f"data: {json.dumps({'type': 'error', 'error': 'Job nicht gefunden'})}\n\n"
+            return
+
+        for offset, event in enumerate(job['events']):
+            yield f"id: {since + offset + 1}\ndata: {json.dumps(event)}\n\n"
+        if not job['events']:
+            yield ": keepalive\n\n"
+        since = job['next']
+
+        if job['state'] in ('done', 'failed', 'cancelled'):
+            return
+
+
+# ==================== HINTERGRUND-JOBS ====================
+
+@app.route('/api/jobs', methods=['GET'])
+def api_list_jobs():
+    """API: Laufende und zuletzt beendete Jobs"""
+    return jsonify({'success': True, 'jobs': relay_controller.list_jobs()})
+
+
+# HTTP-Status je Fehlerart beim Starten eines Jobs (siehe RelayClient.submit_job)
+JOB_ERROR_STATUS = {
+    'unknown_type': 400,
+    'unreachable': 503,
+    'busy': 409,
+}
+
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    """API: Job starten, z.B. {"type": "relay_test"} - liefert sofort die Job-ID"""
+    data = request.get_json(silent=True) or {}
+    job, error, code = relay_controller.submit_job(data.get('type', 'relay_test'), data.get('params'))
+    if job is None:
+        return jsonify({'success': False, 'error': error}), JOB_ERROR_STATUS.get(code, 500)
+    return jsonify({'success': True, 'job_id': job['id'], 'job': job})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job_status(job_id):
+    """API: Job-Status inkl. Ereignissen ab ?since=<Index>"""
+    since = request.args.get('since', 0, type=int)
+    job = relay_controller.get_job(job_id, since)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job nicht gefunden'}), 404
+    return jsonify({'success': True, 'job': job})
+
+
+@app.route('/api/jobs/<job_id>/stream')
+def api_job_stream(job_id):
+    """API: Job-Ereignisse als Server-Sent Events (setzt nach Reconnect bei Last-Event-ID fort)"""
+    since = request.headers.get('Last-Event-ID', request.args.get('since', 0), type=int)
+    if relay_controller.get_job(job_id, since) is None:
+        # Kein 200: EventSource verbindet sich nicht endlos neu
+        return Response(f"data: {json.dumps({'type': 'error', 'error': 'Job nicht gefunden'})}\n\n",
+                        status=404, mimetype='text/event-stream')
+    return Response(job_event_stream(job_id, since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def api_cancel_job(job_id):
+    """API: Laufenden Job abbrechen (der Job schaltet dabei alle Relais aus)"""
+    if not relay_controller.cancel_job(job_id):
+        return jsonify({'success': False, 'error': 'Job nicht gefunden oder bereits beendet'}), 404
+    return jsonify({'success': True})
 
 
 @app.route('/test_single_relay/<int:relay_id>')
@@ -473,16 +521,30 @@ def admin_panel():
 
 
 
+def _rebuild_relay_config():
+    """Baut RELAY_GROUPS, RELAY_NAMES und STROMKREISE in config aus den Dateien neu auf"""
+    config.RELAY_GROUPS = get_all_groups()
+    config.RELAY_NAMES = get_all_relay_names()
+    config.STROMKREISE = get_all_stromkreise()
+
+
+# Pro Worker: baut die Modul-Globalen nur neu auf, wenn irgendein Worker Konfiguration geändert hat
+_relay_config_watcher = watch_config(_rebuild_relay_config)
+
+
+@app.before_request
+def refresh_relay_config():
+    """Vor jeder Anfrage: nur Generationsvergleich, Neuaufbau nur nach Änderungen"""
+    try:
+        _relay_config_watcher.refresh()
+    except Exception as e:
+        print(f"Error reloading config: {e}")
+
+
 def reload_relay_config():
     """Lädt RELAY_GROUPS und RELAY_NAMES aus Dateien neu"""
-    global RELAY_GROUPS
     try:
-        # Update config mit neuen Daten
-        import config
-        config.RELAY_GROUPS = get_all_groups()
-        config.RELAY_NAMES = get_all_relay_names()
-        config.STROMKREISE = get_all_stromkreise()
-
+        _relay_config_watcher.refresh()
         print("✓ Relay configuration reloaded")
         return True
     except Exception as e:
@@ -1050,17 +1112,8 @@ def api_activate_training():
         })
 
     try:
-        # Alle Relais zurücksetzen
-        relay_controller.reset_all_relays()
-
-        # Aktiviere konfigurierte Relais (mit Gruppen-Normalisierung)
-        activated = []
-        for relay_num in relais_list:
-            # Normalisiere zu Gruppen-Repräsentant
-            representative = normalize_relay_to_representative(relay_num)
-
-            if relay_controller.set_relay(representative, True):
-                activated.append(relay_num)
+        # Szene schalten: konfigurierte Relais (inkl. Gruppen) an, alle anderen aus
+        activated, failed = relay_controller.apply_scene(relais_list)
 
         return jsonify({
             'success': True,
@@ -1295,6 +1348,106 @@ def api_gpio_status():
         })
 
 
+@app.route('/api/gpio/stream')
+def api_gpio_stream():
+    """
+    API: GPIO-Status als Server-Sent Events
+    Sendet sofort den aktuellen Status, danach nur noch Änderungen (Notaus, Countdown-Sekunden)
+    """
+    def generate():
+        seq = None
+        # Worker-Prozess: Änderungen des Monitor-Prozesses kommen nur, solange der Stream offen ist
+        with gpio_status_stream():
+            while True:
+                new_seq, status = wait_for_gpio_status(seq, timeout=GPIO_STREAM_KEEPALIVE)
+                if new_seq == seq:
+                    # Keine Änderung - Kommentarzeile hält die Verbindung offen
+                    yield ": keepalive\n\n"
+                    continue
+                seq = new_seq
+                yield f"id: {seq}\ndata: {json.dumps({'success': True, 'gpio_status': status})}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/emergency/status', methods=['GET'])
+def api_emergency_status():
+    """API: Notaus-Sperre der Relais und gemessene Flanke-zu-Bus-Latenzen"""
+    return jsonify({
+        'success': True,
+        'emergency': relay_controller.get_emergency_status()
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Modbus-Busmetriken im Prometheus-Textformat"""
+    snapshot = relay_controller.get_bus_metrics()
+    if snapshot is None:
+        return Response('# Relais-Daemon nicht erreichbar\n', status=503,
+                        mimetype='text/plain; version=0.0.4')
+    return Response(render_prometheus(snapshot), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/admin/bus_metrics', methods=['GET'])
+def api_bus_metrics():
+    """API: Modbus-Zähler und Latenz-Perzentile pro Slave und Funktionscode"""
+    snapshot = relay_controller.get_bus_metrics()
+    if snapshot is None:
+        return jsonify({'success': False, 'message': 'Relais-Daemon nicht erreichbar'}), 503
+    return jsonify({'success': True, 'metrics': snapshot})
+
+
+@app.route('/api/admin/bus_metrics/reset', methods=['POST'])
+def api_bus_metrics_reset():
+    """API: Busmetriken zurücksetzen (z.B. vor einer Messreihe)"""
+    success = relay_controller.reset_bus_metrics()
+    return jsonify({'success': bool(success)})
+
+
+@app.route('/api/admin/logs', methods=['GET'])
+def api_admin_logs():
+    """
+    API: Log-Ringpuffer ausgeben (inkl. TX/RX-Traces des Busses)
+
+    Query-Parameter:
+        limit: Einträge pro Quelle (Standard 200)
+        level: Mindest-Level, z.B. DEBUG, INFO, WARNING (Standard DEBUG)
+        logger: Namenspräfix, z.B. vde.modbus_controller
+        source: all, daemon oder app (dieser Worker)
+        format: json (Standard) oder text
+    """
+    limit = request.args.get('limit', 200, type=int)
+    level = request.args.get('level', 'DEBUG')
+    logger = request.args.get('logger') or None
+    source = request.args.get('source', 'all')
+
+    entries = []
+    if source in ('all', 'app'):
+        entries += [dict(entry, source=f'app:{os.getpid()}') for entry in dump_log(limit, level, logger)]
+    if source in ('all', 'daemon'):
+        daemon_entries = relay_controller.get_daemon_log(limit, level, logger) or []
+        entries += [dict(entry, source='daemon') for entry in daemon_entries]
+    entries.sort(key=lambda entry: entry['time'])
+
+    if request.args.get('format') == 'text':
+        lines = [f"{datetime.fromtimestamp(entry['time']).strftime('%H:%M:%S.%f')[:-3]} "
+                 f"{entry['level']:8s} {entry['source']:10s} {entry['logger']}: {entry['message']}"
+                 for entry in entries]
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; charset=utf-8')
+
+    return jsonify({'success': True, 'entries': entries})
+
+
+def on_notaus_changed(active, edge_time):
+    """Notaus-Flanke (Monitor-Thread): Relais sofort aus bzw. Sperre wieder aufheben"""
+    if active:
+        relay_controller.emergency_off(edge_time)
+    else:
+        relay_controller.emergency_release()
+
+
 @app.route('/admin_settings')
 def admin_settings():
     """Admin-Einstellungen"""
@@ -1414,10 +1567,11 @@ def debug_status():
     return jsonify({
         'serial_available': SERIAL_AVAILABLE,
         'active_relays': relay_controller.active_relays,
-        'relay_states_module_0': relay_controller.relay_states[0][:10],
-        'relay_states_module_1': relay_controller.relay_states[1][:10],
-        'stromkreise': {k: v['name'] for k, v in STROMKREISE.items()},
-        'modbus_modules': MODBUS_MODULES
+        **{f'relay_states_module_{module_idx}': states[:10]
+           for module_idx, states in relay_controller.relay_states.items()},
+        'stromkreise': {k: v['name'] for k, v in config.STROMKREISE.items()},
+        'modbus_modules': MODBUS_MODULES,
+        'relay_layout': RELAY_LAYOUT.to_dict()
     })
 
 
@@ -1427,21 +1581,25 @@ def initialize_app(skip_gpio_check=False):
     """Initialisiert die App einmalig"""
     init_db()
 
-    # Lade dynamische Gruppen und Namen beim Start
-    import config
-    config.RELAY_GROUPS = get_all_groups()
-    config.RELAY_NAMES = get_all_relay_names()
+    # Lade dynamische Gruppen, Namen und Stromkreise beim Start
+    _relay_config_watcher.refresh()
 
     # Initialisiere GPIO-Monitor
     import os
     gpio_pin1 = getattr(config, 'GPIO_MONITOR_PIN1', 17)
     gpio_pin2 = getattr(config, 'GPIO_MONITOR_PIN2', 27)
     gpio_shutdown_timeout = getattr(config, 'GPIO_SHUTDOWN_TIMEOUT', 120)
+    gpio_debounce_ms = getattr(config, 'GPIO_DEBOUNCE_MS', 20)
 
     # Bei Flask dev server: nur im Reloader
     # Bei Gunicorn: skip_gpio_check=True (wird vom Hook aufgerufen)
     if skip_gpio_check or os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not DEBUG:
-        init_gpio_monitor(pin1=gpio_pin1, pin2=gpio_pin2, shutdown_timeout=gpio_shutdown_timeout)
+        init_gpio_monitor(pin1=gpio_pin1, pin2=gpio_pin2, shutdown_timeout=gpio_shutdown_timeout,
+                          debounce_ms=gpio_debounce_ms)
+        # Bus-Owner-Prozess vor den Workern starten (einzige Modbus-Verbindung)
+        ensure_relay_daemon()
+        # Notaus schaltet alle Relais direkt über den Daemon ab
+        add_notaus_callback(on_notaus_changed)
     else:
         print("⏭️ GPIO-Monitor wird im Reloader-Prozess übersprungen")
 
@@ -1453,13 +1611,15 @@ def initialize_app(skip_gpio_check=False):
     print(f"Serial Port: {SERIAL_PORT}")
     print(f"Baud Rate: {BAUD_RATE}")
     print(f"Serial Status: {'✅ Hardware Ready' if SERIAL_AVAILABLE else '🔧 Dummy Mode'}")
+    print(f"Relais-Daemon: {RELAY_DAEMON_SOCKET}")
     print(f"\nGPIO-Monitor: Pin {gpio_pin1} und {gpio_pin2}")
     print(f"Warnung: 'Notaus betätigt' bei geschlossenem Schließer")
-    print(f"\nRelais: 0-63 (64 Stück)")
+    print(f"\nRelais: 0-{TOTAL_RELAYS - 1} ({RELAY_LAYOUT.relay_count} Stück auf {len(RELAY_LAYOUT.modules)} Modulen, "
+          f"{len(RELAY_LAYOUT.buses)} Bus{'se' if len(RELAY_LAYOUT.buses) != 1 else ''})")
     print(f"Relais-Gruppen: {len(config.RELAY_GROUPS)} definiert")
     print(f"Benannte Relais: {len(config.RELAY_NAMES)} definiert")
     print(f"Stromkreise für UI-Gruppierung:")
-    for sk_num, sk_data in STROMKREISE.items():
+    for sk_num, sk_data in config.STROMKREISE.items():
         print(f"  {sk_num}. {sk_data['name']}")
     print("=" * 60)
 
@@ -1468,6 +1628,7 @@ def initialize_app(skip_gpio_check=False):
     finally:
         # Cleanup beim Beenden
         cleanup_gpio()
+        stop_relay_daemon()
 
 
 # ==================== GUNICORN HOOKS ====================
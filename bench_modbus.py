@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+VDE Messwand - Benchmarks für den Modbus-Pfad
+Micro-Benchmark: alte bitweise CRC-Berechnung gegen Tabellen-CRC und Frame-Cache.
+Ende-zu-Ende (--e2e): RelayController gegen simulierte Relais-Module (modbus_simulator.py)
+mit echter Zeichenzeit und optional eingestreuten Busfehlern.
+
+Aufruf:
+    python3 bench_modbus.py [--seconds 1.0]
+    python3 bench_modbus.py --e2e [--iterations 50] [--modules 2] [--buses 1] [--crc 0.01] [--slow 0.02]
+    python3 bench_modbus.py --e2e --port /dev/pts/N     # gegen modbus_simulator.py (pty) oder Hardware
+    python3 bench_modbus.py --emergency [--iterations 50] # Notaus: Aufruf bis erster Frame gesendet
+    python3 bench_modbus.py --fast-test                   # Dauer des Schnelltests (relay_test_fast)
+    python3 bench_modbus.py --dead-slave [--iterations 20] # letztes Modul antwortet nicht: fixed vs. adaptive
+
+Micro-Benchmark: pro Durchlauf das, was im Hot-Path pro Relais-Befehl anfällt:
+FC05-Frame erzeugen (TX) und die 8-Byte-Antwort per CRC prüfen (RX).
+"""
+import argparse
+import random
+import statistics
+import struct
+import threading
+import time
+
+from config import MODBUS_CIRCUIT_FAILURES, MODBUS_CIRCUIT_COOLDOWN
+from modbus_controller import crc16, ModbusTiming
+
+
+def crc16_bitwise(data):
+    """Bisherige Implementierung: 8 Bit-Schritte pro Byte"""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 0x0001 else crc >> 1
+    return crc
+
+
+def frames_per_second(func, seconds):
+    """Ruft func so oft wie möglich auf und gibt Aufrufe pro Sekunde zurück"""
+    count = 0
+    batch = 1000
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        for _ in range(batch):
+            func()
+        count += batch
+    return count / (time.perf_counter() - start)
+
+
+def latency_summary(samples):
+    """Mittelwert, p50, p99 und Operationen/s aus Latenzen in Sekunden"""
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return (f"Ø {statistics.mean(ordered) * 1000:7.1f} ms  p50 {statistics.median(ordered) * 1000:7.1f} ms  "
+            f"p99 {p99 * 1000:7.1f} ms  {len(ordered) / sum(ordered):6.1f} Op/s")
+
+
+def millis_summary(samples):
+    """Mittelwert, p50, p99 und Maximum aus Zeiten in Sekunden"""
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return (f"Ø {statistics.mean(ordered) * 1000:7.2f} ms  p50 {statistics.median(ordered) * 1000:7.2f} ms  "
+            f"p99 {p99 * 1000:7.2f} ms  max {ordered[-1] * 1000:7.2f} ms")
+
+
+def create_controller(args):
+    """RelayController über simulierte Busse (bzw. --port) - (controller, layout, ports)"""
+    from relay_controller import RelayController
+    from relay_layout import RelayLayout
+
+    if args.port:
+        # Externe Schnittstelle (pty-Simulator, Hardware): ein Bus, Fehler stellt der Simulator ein
+        ports = [args.port]
+        args.buses = 1
+    else:
+        faults = (f'?crc={args.crc}&drop={args.drop}&silent={args.silent}&slow={args.slow}'
+                  f'&slow_delay={args.slow_delay}&seed={args.seed}')
+        ports = [f'sim://bench{bus}{faults}' for bus in range(args.buses)]
+    modules = {}
+    for index in range(args.modules):
+        bus = index % args.buses
+        modules[index] = {'slave_id': index // args.buses + 1, 'base_addr': index * 32, 'num_coils': 32,
+                          'port': ports[bus], 'baud_rate': args.baud}
+
+    layout = RelayLayout(modules)
+    return RelayController(layout), layout, ports
+
+
+def print_bus_summary(args, controller, ports):
+    from modbus_simulator import get_simulator
+
+    snapshot = controller.buses.metrics_snapshot()
+    retries = sum(entry['retries'] for entry in snapshot['slaves'])
+    failed = sum(entry['failures'] for entry in snapshot['slaves'])
+    print(f"Bus: {retries} Wiederholungen, {failed} fehlgeschlagene Anfragen")
+    for port in ports:
+        if not args.port:
+            print(f"Simulator {port.split('?')[0]}: {dict(get_simulator(port).stats)}")
+
+
+def bench_controller(args):
+    """Ende-zu-Ende-Latenz und Durchsatz des RelayControllers über simulierte Busse"""
+    controller, layout, ports = create_controller(args)
+    relays = layout.relays()
+
+    def measure(operation, iterations):
+        samples = []
+        failures = 0
+        for i in range(iterations):
+            start = time.perf_counter()
+            if not operation(i):
+                failures += 1
+            samples.append(time.perf_counter() - start)
+        return samples, failures
+
+    results = [
+        ('Einzelrelais (set_relay)', *measure(
+            lambda i: controller.set_relay(relays[i % len(relays)], i % 2 == 0), args.iterations)),
+        ('Szene (alle Module, FC15)', *measure(
+            lambda i: not controller.write_relay_mask(((0x5A5A5A5A5A5A5A5A * (i + 1)) & layout.all_mask) ^ i),
+            args.iterations)),
+        ('Komplett-Lesung (FC01)', *measure(
+            lambda i: controller.read_relay_state() is not None, args.iterations)),
+    ]
+
+    print("=" * 78)
+    print(f"RelayController Ende-zu-Ende: {args.modules} Module auf {args.buses} Bus(sen), {args.baud} Baud")
+    if args.port:
+        print(f"Schnittstelle: {args.port}")
+    else:
+        print(f"Fehler: crc={args.crc} drop={args.drop} silent={args.silent} slow={args.slow}")
+    print("=" * 78)
+    for name, samples, failures in results:
+        print(f"{name:28s} {latency_summary(samples)}  Fehler {failures}")
+    print("-" * 78)
+    # Untergrenze eines FC05 (8 Byte hin, 8 Byte Echo) ohne Bearbeitungszeit des Slaves
+    timing = ModbusTiming(args.baud)
+    print(f"FC05 auf dem Bus: {timing.frame_time(16) * 1000:.1f} ms (TX + RX) + t3.5 {timing.t3_5 * 1000:.1f} ms "
+          f"+ Bearbeitungszeit des Slaves")
+    print_bus_summary(args, controller, ports)
+    controller.buses.close()
+
+
+def bench_emergency(args):
+    """
+    Notaus-Latenz: RelayController.emergency_off() bis der erste Alle-AUS-Frame gesendet ist
+    bzw. bis alle Module bestätigt haben - bei freiem Bus und während ein anderer Thread
+    Szenen (FC15) schreibt
+    """
+    controller, layout, ports = create_controller(args)
+    rng = random.Random(args.seed)
+
+    def trigger():
+        edge = time.monotonic()
+        success, first_tx_time, done_time = controller.emergency_off()
+        controller.emergency_release()
+        return first_tx_time - edge, done_time - edge, success
+
+    def idle_trigger():
+        # Abstand zur letzten Auslösung, damit keine t3.5-Busruhe mehr aussteht
+        time.sleep(rng.uniform(0.01, 0.05))
+        return trigger()
+
+    idle = [idle_trigger() for _ in range(args.iterations)]
+
+    # Schreiblast: ununterbrochen Szenen, der Notaus trifft zufällig in eine laufende Transaktion
+    stop = threading.Event()
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            # Wie der Daemon: während des Notaus keine Schaltbefehle
+            if any(bus.modbus.emergency.is_set() for bus in controller.buses.buses):
+                time.sleep(0.001)
+                continue
+            controller.write_relay_mask(((0x5A5A5A5A5A5A5A5A * (i + 1)) & layout.all_mask) ^ i)
+            i += 1
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    busy = []
+    for _ in range(args.iterations):
+        time.sleep(rng.uniform(0.01, 0.05))
+        busy.append(trigger())
+    stop.set()
+    thread.join()
+
+    print("=" * 78)
+    print(f"Notaus: {args.modules} Module auf {args.buses} Bus(sen), {args.baud} Baud, {args.iterations} Auslösungen")
+    frame_length = len(next(iter(controller.buses.buses[0].modbus.emergency_frames.values())))
+    print(f"Alle-AUS-Frame: {frame_length} Byte = {ModbusTiming(args.baud).frame_time(frame_length) * 1000:.1f} ms "
+          f"auf dem Bus")
+    print("=" * 78)
+    for name, samples in (('Bus frei', idle), ('Während FC15-Schreiben', busy)):
+        print(f"{name}:")
+        print(f"  bis Frame gesendet     {millis_summary([sample[0] for sample in samples])}")
+        print(f"  bis alle bestätigt     {millis_summary([sample[1] for sample in samples])}")
+        print(f"  ohne Bestätigung       {sum(1 for sample in samples if not sample[2])}")
+    print("-" * 78)
+    print_bus_summary(args, controller, ports)
+    controller.buses.close()
+
+
+def bench_fast_test(args):
+    """Dauer des Schnelltests (relay_jobs.run_fast_relay_test) für die Module aus MODBUS_MODULES"""
+    from relay_jobs import Job, run_fast_relay_test
+    from relay_layout import RELAY_LAYOUT
+
+    # Der Schnelltest nimmt die Testmuster aus RELAY_LAYOUT - gleiche Module simulieren
+    args.modules = len(RELAY_LAYOUT.modules)
+    controller, layout, ports = create_controller(args)
+
+    def bus_call(cmd, *call_args):
+        if cmd == 'read_relay_mask':
+            state = controller.read_relay_state()
+            return state.mask if state is not None else None
+        return getattr(controller, cmd)(*call_args)
+
+    durations = []
+    for _ in range(args.runs):
+        job = Job('relay_test_fast', {}, threading.Condition())
+        result = run_fast_relay_test(job, bus_call)
+        durations.append(result['report']['duration'])
+    patterns = sum(1 for event in job.events if event['type'] == 'pattern')
+
+    print("=" * 78)
+    print(f"Schnelltest: {args.modules} Module auf {args.buses} Bus(sen), {args.baud} Baud, {patterns} Muster")
+    print("=" * 78)
+    print(f"Dauer: Ø {statistics.mean(durations):.2f} s  min {min(durations):.2f} s  max {max(durations):.2f} s "
+          f"({args.runs} Läufe)")
+    print(f"Ergebnis letzter Lauf: {'OK' if result['success'] else result['failed']}")
+    print("-" * 78)
+    print_bus_summary(args, controller, ports)
+    controller.buses.close()
+
+
+def bench_dead_slave(args):
+    """
+    Letztes Modul antwortet nicht (abgesteckt): Dauer von set_relay auf diesem und einem
+    gesunden Modul, je einmal mit FixedRetryPolicy und AdaptiveRetryPolicy
+    """
+    from modbus_simulator import get_simulator
+    from retry_policy import create_retry_policy
+
+    print("=" * 78)
+    print(f"Totes Modul: {args.modules} Module auf {args.buses} Bus(sen), {args.baud} Baud, "
+          f"{args.iterations} Anfragen je Modul")
+    print("=" * 78)
+    for policy_name in ('fixed', 'adaptive'):
+        controller, layout, ports = create_controller(args)
+        dead_module = layout.modules[-1]
+        healthy_module = layout.modules[0]
+        if args.port:
+            print(f"Hinweis: Slave {dead_module.slave_id} muss im Simulator fehlen (--slaves)")
+        else:
+            get_simulator(dead_module.port).modules.pop(dead_module.slave_id, None)
+        for bus in controller.buses.buses:
+            bus.modbus.retry_policy = create_retry_policy(policy_name)
+
+        dead, healthy = [], []
+        start = time.perf_counter()
+        for i in range(args.iterations):
+            for module, samples in ((dead_module, dead), (healthy_module, healthy)):
+                relay = module.base_addr + i % module.num_coils
+                request_start = time.perf_counter()
+                controller.set_relay(relay, i % 2 == 0)
+                samples.append(time.perf_counter() - request_start)
+        total = time.perf_counter() - start
+
+        first = min(MODBUS_CIRCUIT_FAILURES, len(dead))
+        print(f"{policy_name}:")
+        print(f"  totes Modul, erste {first}   {millis_summary(dead[:first])}")
+        if dead[first:]:
+            print(f"  totes Modul, danach    {millis_summary(dead[first:])}")
+        print(f"  gesundes Modul         {millis_summary(healthy)}")
+        print(f"  gesamt                 {total:.2f} s")
+        controller.buses.close()
+    print("-" * 78)
+    print(f"Circuit Breaker: gesperrt nach {MODBUS_CIRCUIT_FAILURES} Fehlern in Folge, "
+          f"Probe nach {MODBUS_CIRCUIT_COOLDOWN:.0f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Modbus Frame/CRC Micro-Benchmark')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Messdauer pro Variante')
+    parser.add_argument('--e2e', action='store_true', help='RelayController gegen den Simulator messen')
+    parser.add_argument('--emergency', action='store_true', help='Notaus-Latenz gegen den Simulator messen')
+    parser.add_argument('--fast-test', action='store_true', help='Dauer des Relais-Schnelltests messen')
+    parser.add_argument('--runs', type=int, default=3, help='Durchläufe des Schnelltests (--fast-test)')
+    parser.add_argument('--dead-slave', action='store_true',
+                        help='Letztes Modul antwortet nicht: Retry-Strategien vergleichen')
+    parser.add_argument('--iterations', type=int, default=50, help='Durchläufe pro Operation (--e2e)')
+    parser.add_argument('--modules', type=int, default=2, help='Simulierte Module à 32 Relais (--e2e)')
+    parser.add_argument('--buses', type=int, default=1, help='Module auf so viele Busse verteilen (--e2e)')
+    parser.add_argument('--baud', type=int, default=9600, help='Baudrate (--e2e)')
+    parser.add_argument('--port', help='Schnittstelle statt sim://, z.B. pty von modbus_simulator.py (--e2e)')
+    parser.add_argument('--crc', type=float, default=0.0, help='Anteil Antworten mit falscher CRC (--e2e)')
+    parser.add_argument('--drop', type=float, default=0.0, help='Anteil abgeschnittener Antworten (--e2e)')
+    parser.add_argument('--silent', type=float, default=0.0, help='Anteil fehlender Antworten (--e2e)')
+    parser.add_argument('--slow', type=float, default=0.0, help='Anteil verspäteter Antworten (--e2e)')
+    parser.add_argument('--slow-delay', type=float, default=0.3, help='Verspätung in Sekunden (--e2e)')
+    parser.add_argument('--seed', type=int, default=1, help='Zufalls-Startwert der Fehler (--e2e)')
+    args = parser.parse_args()
+
+    if args.e2e:
+        bench_controller(args)
+        return
+    if args.emergency:
+        bench_emergency(args)
+        return
+    if args.fast_test:
+        bench_fast_test(args)
+        return
+    if args.dead_slave:
+        bench_dead_slave(args)
+        return
+
+    response = bytearray(b'\x01\x05\x00\x03\xff\x00')
+    response += struct.pack('<H', crc16(response))
+    response = bytes(response)
+
+    def legacy():
+        # Frame bauen + CRC (bitweise), Antwort-CRC prüfen (bitweise)
+        frame = struct.pack('>BBH', 1, 0x05, 3) + struct.pack('>H', 0xFF00)
+        frame += struct.pack('<H', crc16_bitwise(frame))
+        return crc16_bitwise(response[:-2]) == (response[-2] | (response[-1] << 8))
+
+    def table():
+        frame = struct.pack('>BBH', 1, 0x05, 3) + b'\xff\x00'
+        frame += struct.pack('<H', crc16(frame))
+        return crc16(response[:-2]) == (response[-2] | (response[-1] << 8))
+
+    cache = {}
+    for slave_id in (1, 2):
+        for coil in range(32):
+            for state in (True, False):
+                frame = struct.pack('>BBHH', slave_id, 0x05, coil, 0xFF00 if state else 0)
+                cache[(slave_id, coil, state)] = frame + struct.pack('<H', crc16(frame))
+
+    def cached():
+        # FC05-Antwort ist das Echo des Frames - geprüft wird der Frame aus dem Cache
+        frame = cache[(1, 3, True)]
+        return crc16(frame[:-2]) == (frame[-2] | (frame[-1] << 8))
+
+    results = [
+        ('Bitweise CRC (alt)', frames_per_second(legacy, args.seconds)),
+        ('Tabellen-CRC', frames_per_second(table, args.seconds)),
+        ('Frame-Cache + Tabellen-CRC', frames_per_second(cached, args.seconds)),
+    ]
+
+    # Vergleich mit der Busgrenze: so viele FC05-Transaktionen schafft der Bus maximal
+    timing = ModbusTiming(9600)
+    bus_limit = 1.0 / (timing.frame_time(16) + 2 * timing.t3_5)
+
+    print("=" * 60)
+    print("Modbus Frame-Benchmark (FC05 TX + RX-CRC pro Durchlauf)")
+    print("=" * 60)
+    baseline = results[0][1]
+    for name, rate in results:
+        print(f"{name:30s} {rate:12,.0f} Frames/s  {1e6 / rate:7.2f} µs/Frame  x{rate / baseline:.1f}")
+    print("-" * 60)
+    print(f"Busgrenze bei 9600 Baud: {bus_limit:,.0f} Transaktionen/s")
+    print("Hinweis: Ein Raspberry Pi ist pro Kern grob 5-10x langsamer als ein Desktop-CPU,")
+    print("die µs/Frame-Werte entsprechend hochrechnen.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+VDE Messwand - Modbus-Busmetriken
+Zähler und Latenz-Histogramme pro Slave und Funktionscode.
+Erfasst wird im Bus-Owner-Prozess (Relais-Daemon), abgefragt über /metrics und
+/api/admin/bus_metrics. Pro Transaktion fallen nur ein paar Integer-Additionen
+und eine Bucket-Suche (bisect) an, daher bleibt die Erfassung immer aktiv.
+"""
+import bisect
+import threading
+import time
+
+# Obergrenzen der Latenz-Buckets in Millisekunden (Round-Trip: Frame senden bis Antwort gelesen).
+# Bei 9600 Baud dauert eine FC05-Transaktion ca. 20 ms, ein Timeout bis zu SERIAL_TIMEOUT.
+LATENCY_BUCKETS_MS = (2, 5, 10, 15, 20, 25, 30, 40, 50, 75, 100, 150, 250, 500, 1000)
+
+# Ergebnis eines Sendeversuchs: Antwort gültig, unvollständig/keine Antwort, CRC falsch,
+# falscher Slave, Modbus-Exception-Antwort, Fehler der seriellen Schnittstelle
+OUTCOMES = ('ok', 'timeout', 'crc_error', 'wrong_slave', 'exception', 'error')
+
+FUNCTION_NAMES = {
+    0x01: 'read_coils',
+    0x05: 'write_single_coil',
+    0x0F: 'write_multiple_coils',
+}
+
+# Ausgegebene Perzentile
+PERCENTILES = (50, 90, 99)
+
+
+class SlaveMetrics:
+    """Zähler und Latenz-Histogramm für eine Kombination aus Slave und Funktionscode"""
+
+    __slots__ = ('requests', 'attempts', 'retries', 'failures', 'rejected', 'outcomes',
+                 'bytes_out', 'bytes_in', 'latency_buckets', 'latency_sum', 'latency_max')
+
+    def __init__(self):
+        self.requests = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        # Ohne Senden abgelehnt, weil der Slave gesperrt ist (Circuit Breaker)
+        self.rejected = 0
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.bytes_out = 0
+        self.bytes_in = 0
+        # Letzter Bucket = größer als LATENCY_BUCKETS_MS[-1]
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def percentile(self, p):
+        """
+        Perzentil der Round-Trip-Zeit aus dem Histogramm (linear im Bucket interpoliert)
+
+        Returns:
+            Millisekunden oder None ohne Messwerte
+        """
+        total = self.attempts
+        if total == 0:
+            return None
+
+        rank = total * p / 100.0
+        cumulative = 0
+        lower = 0.0
+        for index, count in enumerate(self.latency_buckets):
+            upper = LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.latency_max
+            if count and cumulative + count >= rank:
+                fraction = (rank - cumulative) / count
+                # Nicht über den tatsächlich gemessenen Höchstwert hinaus interpolieren
+                return round(min(lower + (upper - lower) * fraction, self.latency_max), 2)
+            cumulative += count
+            lower = upper
+        return round(self.latency_max, 2)
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'attempts': self.attempts,
+            'retries': self.retries,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'outcomes': dict(self.outcomes),
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            'latency_ms': {
+                'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS_MS] + ['+Inf'], self.latency_buckets)),
+                'sum': round(self.latency_sum, 3),
+                'max': round(self.latency_max, 3),
+                'avg': round(self.latency_sum / self.attempts, 3) if self.attempts else None,
+                **{f'p{p}': self.percentile(p) for p in PERCENTILES},
+            },
+        }
+
+
+class BusMetrics:
+    """Sammelt SlaveMetrics je (slave_id, function_code)"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.started = time.time()
+        # Kurzer Lock: Erfassung aus Worker- und Notaus-Thread, Abfrage aus Verbindungs-Threads
+        self.lock = threading.Lock()
+
+    def _get(self, slave_id, function_code):
+        key = (slave_id, function_code)
+        entry = self.metrics.get(key)
+        if entry is None:
+            entry = self.metrics[key] = SlaveMetrics()
+        return entry
+
+    def record_attempt(self, slave_id, function_code, attempt, outcome, rtt, bytes_out, bytes_in):
+        """
+        Erfasst einen Sendeversuch
+
+        Args:
+            slave_id: Modbus Slave ID
+            function_code: Modbus-Funktionscode
+            attempt: Nummer des Versuchs (0 = erster Versuch einer Anfrage)
+            outcome: Eines von OUTCOMES
+            rtt: Round-Trip-Zeit in Sekunden
+            bytes_out: Gesendete Bytes
+            bytes_in: Empfangene Bytes
+        """
+        rtt_ms = rtt * 1000.0
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, rtt_ms)
+        with self.lock:
+            entry = self._get(slave_id, function_code)
+            if attempt == 0:
+                entry.requests += 1
+            else:
+                entry.retries += 1
+            entry.attempts += 1
+            entry.outcomes[outcome] += 1
+            entry.bytes_out += bytes_out
+            entry.bytes_in += bytes_in
+            entry.latency_buckets[bucket] += 1
+            entry.latency_sum += rtt_ms
+            if rtt_ms > entry.latency_max:
+                entry.latency_max = rtt_ms
+
+    def record_failure(self, slave_id, function_code):
+        """Erfasst eine Anfrage, die nach allen Versuchen fehlgeschlagen ist"""
+        with self.lock:
+            self._get(slave_id, function_code).failures += 1
+
+    def record_rejected(self, slave_id, function_code):
+        """Erfasst eine Anfrage, die wegen gesperrtem Slave nicht gesendet wurde"""
+        with self.lock:
+            self._get(slave_id, function_code).rejected += 1
+
+    def reset(self):
+        with self.lock:
+            self.metrics = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        """
+        Alle Metriken als JSON-serialisierbares Dictionary
+
+        Returns:
+            {'started', 'uptime', 'slaves': [{'slave_id', 'function_code', 'function', ...}]}
+        """
+        slaves = []
+        with self.lock:
+            entries = [(key, entry.to_dict()) for key, entry in sorted(self.metrics.items())]
+        for (slave_id, function_code), data in entries:
+            data['slave_id'] = slave_id
+            data['function_code'] = function_code
+            data['function'] = FUNCTION_NAMES.get(function_code, f'fc{function_code:02d}')
+            slaves.append(data)
+        return {
+            'started': self.started,
+            'uptime': round(time.time() - self.started, 1),
+            'slaves': slaves,
+        }
+
+
+def render_prometheus(snapshot):
+    """
+    Textformat für /metrics (Prometheus Exposition Format)
+
+    Args:
+        snapshot: Ergebnis von BusMetrics.snapshot() bzw. BusPool.metrics_snapshot()
+    """
+    counters = (
+        ('requests', 'Modbus-Anfragen (erster Versuch)'),
+        ('attempts', 'Gesendete Frames inkl. Wiederholungen'),
+        ('retries', 'Wiederholte Frames'),
+        ('failures', 'Anfragen, die nach allen Versuchen fehlgeschlagen sind'),
+        ('rejected', 'Anfragen ohne Senden abgelehnt (Slave gesperrt)'),
+        ('bytes_out', 'Gesendete Bytes'),
+        ('bytes_in', 'Empfangene Bytes'),
+    )
+
+    lines = []
+    for name, help_text in counters:
+        lines.append(f'# HELP modbus_{name}_total {help_text}')
+        lines.append(f'# TYPE modbus_{name}_total counter')
+        for entry in snapshot['slaves']:
+            lines.append(f'modbus_{name}_total{{{_labels(entry)}}} {entry[name]}')
+
+    lines.append('# HELP modbus_responses_total Sendeversuche nach Ergebnis')
+    lines.append('# TYPE modbus_responses_total counter')
+    for entry in snapshot['slaves']:
+        for outcome, count in entry['outcomes'].items():
+            lines.append(f'modbus_responses_total{{{_labels(entry)},outcome="{outcome}"}} {count}')
+
+    lines.append('# HELP modbus_rtt_milliseconds Round-Trip-Zeit pro Sendeversuch')
+    lines.append('# TYPE modbus_rtt_milliseconds histogram')
+    for entry in snapshot['slaves']:
+        latency = entry['latency_ms']
+        cumulative = 0
+        for bound, count in latency['buckets'].items():
+            cumulative += count
+            lines.append(f'modbus_rtt_milliseconds_bucket{{{_labels(entry)},le="{bound}"}} {cumulative}')
+        lines.append(f'modbus_rtt_milliseconds_sum{{{_labels(entry)}}} {latency["sum"]}')
+        lines.append(f'modbus_rtt_milliseconds_count{{{_labels(entry)}}} {entry["attempts"]}')
+
+    health = snapshot.get('health', {}).get('slaves', [])
+    if health:
+        lines.append('# HELP modbus_circuit_open Slave gesperrt (1) nach wiederholten Fehlern')
+        lines.append('# TYPE modbus_circuit_open gauge')
+        for entry in health:
+            lines.append(f'modbus_circuit_open{{{_slave_labels(entry)}}} {int(entry["state"] != "closed")}')
+        lines.append('# HELP modbus_error_rate Anteil fehlgeschlagener Sendeversuche im Beobachtungsfenster')
+        lines.append('# TYPE modbus_error_rate gauge')
+        for entry in health:
+            lines.append(f'modbus_error_rate{{{_slave_labels(entry)}}} {entry["error_rate"]}')
+
+    lines.append('# HELP modbus_metrics_uptime_seconds Sekunden seit Start bzw. Reset der Metriken')
+    lines.append('# TYPE modbus_metrics_uptime_seconds gauge')
+    lines.append(f'modbus_metrics_uptime_seconds {snapshot["uptime"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _slave_labels(entry):
+    if 'port' in entry:
+        return f'port="{entry["port"]}",slave="{entry["slave_id"]}"'
+    return f'slave="{entry["slave_id"]}"'
+
+
+def _labels(entry):
+    return f'{_slave_labels(entry)},function="{entry["function"]}"'
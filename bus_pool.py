@@ -0,0 +1,153 @@
+"""
+VDE Messwand - Mehrere Modbus-Busse
+Jede serielle Schnittstelle aus MODBUS_MODULES ist ein eigener Bus mit eigener
+ModbusRTU-Instanz, eigenen Metriken/Retry-Zustand und eigenem Worker-Thread (Queue).
+Aufträge für denselben Bus laufen nacheinander, verschiedene Busse arbeiten parallel:
+Szenen und Komplett-Lesungen dauern so lange wie der langsamste Bus, nicht die Summe.
+"""
+import concurrent.futures
+import os
+import threading
+
+from modbus_controller import ModbusRTU
+from config import SERIAL_TIMEOUT
+from log_buffer import get_logger
+
+log = get_logger(__name__)
+
+
+class Bus:
+    """Eine serielle Schnittstelle mit ihren Modulen"""
+
+    def __init__(self, port, baudrate, modules, timeout=SERIAL_TIMEOUT):
+        self.port = port
+        self.modules = modules
+        self.slave_ids = [module.slave_id for module in modules]
+        self.modbus = ModbusRTU(port, baudrate, timeout)
+        self.modbus.prebuild_frames([(module.slave_id, module.num_coils) for module in modules])
+        # Ein Worker-Thread pro Bus, die Queue des Executors serialisiert die Aufträge.
+        # Wird erst bei der ersten parallelen Ausführung gestartet (ein einzelner Bus braucht ihn nie).
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Stellt fn(bus, *args) in die Queue dieses Busses"""
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f'bus-{os.path.basename(self.port)}')
+        return self.executor.submit(fn, self, *args)
+
+    def close(self):
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+        self.modbus.close()
+
+
+class BusPool:
+    """Alle Busse des Relais-Layouts"""
+
+    def __init__(self, layout, timeout=SERIAL_TIMEOUT):
+        self.buses = [Bus(port, modules[0].baud_rate, modules, timeout)
+                      for port, modules in layout.buses.items()]
+        self.by_module = {module.index: bus for bus in self.buses for module in bus.modules}
+        if len(self.buses) > 1:
+            log.info(f"🔀 {len(self.buses)} Modbus-Busse: " +
+                     ', '.join(f'{bus.port} ({len(bus.modules)} Module)' for bus in self.buses))
+
+    def bus_of(self, module_idx):
+        return self.by_module[module_idx]
+
+    def run(self, fn, *args):
+        """
+        Führt fn(bus, *args) für jeden Bus aus - bei mehreren Bussen parallel in den Bus-Workern,
+        bei nur einem Bus direkt im aufrufenden Thread.
+
+        Returns:
+            Liste der Ergebnisse in Bus-Reihenfolge
+
+        Raises:
+            Die erste Exception eines Busses, nachdem alle Busse fertig sind
+        """
+        if len(self.buses) == 1:
+            return [fn(self.buses[0], *args)]
+
+        futures = [bus.submit(fn, *args) for bus in self.buses]
+        concurrent.futures.wait(futures)
+        return [future.result() for future in futures]
+
+    def emergency_off(self, broadcast=False):
+        """
+        Notaus auf allen Bussen gleichzeitig. Alle Busse werden zuerst gesperrt, dann sendet
+        jeder Bus in einem eigenen Thread - an den Bus-Queues vorbei, damit ein wartender
+        Auftrag den Notaus nicht verzögert.
+
+        Returns:
+            (success, first_tx_time, done_time) - erster gesendeter Frame, letzter Bus fertig
+        """
+        for bus in self.buses:
+            bus.modbus.emergency.set()
+
+        results = [None] * len(self.buses)
+
+        def send(index, bus):
+            try:
+                results[index] = bus.modbus.send_emergency_off(bus.slave_ids, broadcast=broadcast)
+            except Exception as e:
+                log.error(f"❌ Notaus auf {bus.port} fehlgeschlagen: {e}")
+                results[index] = (False, None, None)
+
+        threads = [threading.Thread(target=send, args=(index, bus), name=f'emergency-{index}', daemon=True)
+                   for index, bus in enumerate(self.buses[1:], 1)]
+        for thread in threads:
+            thread.start()
+        send(0, self.buses[0])
+        for thread in threads:
+            thread.join()
+
+        success = all(result[0] for result in results)
+        tx_times = [result[1] for result in results if result[1] is not None]
+        done_times = [result[2] for result in results if result[2] is not None]
+        return success, min(tx_times, default=None), max(done_times, default=None)
+
+    def release_emergency(self):
+        for bus in self.buses:
+            bus.modbus.release_emergency()
+
+    def metrics_snapshot(self):
+        """
+        Busmetriken und Slave-Zustand aller Busse zusammengeführt (Einträge mit 'port')
+
+        Returns:
+            {'started', 'uptime', 'slaves': [...], 'health': {'policy', 'slaves': [...]}}
+        """
+        merged = {'started': None, 'uptime': 0.0, 'slaves': [], 'health': {'policy': None, 'slaves': []}}
+        for bus in self.buses:
+            snapshot = bus.modbus.metrics.snapshot()
+            if merged['started'] is None or snapshot['started'] < merged['started']:
+                merged['started'] = snapshot['started']
+            merged['uptime'] = max(merged['uptime'], snapshot['uptime'])
+            for entry in snapshot['slaves']:
+                entry['port'] = bus.port
+                merged['slaves'].append(entry)
+
+            health = bus.modbus.retry_policy.snapshot()
+            merged['health']['policy'] = health['policy']
+            for slave_id, entry in health['slaves'].items():
+                entry['slave_id'] = slave_id
+                entry['port'] = bus.port
+                merged['health']['slaves'].append(entry)
+        return merged
+
+    def reset_metrics(self):
+        for bus in self.buses:
+            bus.modbus.metrics.reset()
+
+    def close(self):
+        for bus in self.buses:
+            try:
+                bus.close()
+            except Exception as e:
+                log.warning(f"⚠️ Fehler beim Schließen von {bus.port}: {e}")
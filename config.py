@@ -11,18 +11,80 @@ DEBUG = True  # Für Produktion auf False, für Entwicklung auf True
 
 # Datenbank
 DATABASE_PATH = 'vde_messwand.db'
+# Relais-, Stromkreis-, Kategorien- und Übungs-Konfiguration liegen als Tabellen in
+# DATABASE_PATH (config_db.py); so lange wartet ein Schreiber auf einen anderen Worker (Sekunden)
+CONFIG_DB_TIMEOUT = 5.0
 
 # Serial/Modbus Konfiguration
-SERIAL_PORT = '/dev/ttyACM0' if os.path.exists('/dev/ttyACM0') else \
+# VDE_SERIAL_PORT überschreibt die Erkennung (z.B. für eine pty-Simulation ohne Hardware)
+SERIAL_PORT = os.environ.get('VDE_SERIAL_PORT') or (
+              '/dev/ttyACM0' if os.path.exists('/dev/ttyACM0') else \
               '/dev/ttyACM1' if os.path.exists('/dev/ttyACM1') else \
-              '/dev/ttyACM0'
+              '/dev/ttyACM0')
 BAUD_RATE = 9600
-SERIAL_TIMEOUT = 1.0
+# Schnittstellen mit diesem Präfix sind simulierte Busse (modbus_simulator.py), z.B. VDE_SERIAL_PORT=sim://bus1
+SIMULATOR_PORT_PREFIX = 'sim://'
+SERIAL_TIMEOUT = 1.0  # Obergrenze für eine Antwort
+# Maximale Bearbeitungszeit eines Slaves zwischen Anfrage und Antwort (Sekunden).
+# Antwort-Deadline = Sendedauer + t3.5 + dieser Wert + Empfangsdauer (aus BAUD_RATE berechnet)
+MODBUS_TURNAROUND_TIMEOUT = 0.1
+
+# Retry-Strategie (retry_policy.py): 'adaptive' passt Timeouts/Pausen an die Fehlerrate pro
+# Slave an und sperrt nicht erreichbare Module kurzzeitig (Circuit Breaker), 'fixed' = bisher
+MODBUS_RETRY_POLICY = 'adaptive'
+MODBUS_RETRY_ATTEMPTS = 3         # Versuche pro Anfrage
+MODBUS_HEALTH_WINDOW = 20         # Letzte Sendeversuche pro Slave für die Fehlerrate
+MODBUS_TURNAROUND_MAX = 0.5       # Bearbeitungszeit-Obergrenze bei gehäuften Fehlern (Sekunden)
+MODBUS_RETRY_BACKOFF_MIN = 0.02   # Pause vor Wiederholung bei gesundem Bus (x Versuch)
+MODBUS_RETRY_BACKOFF_MAX = 0.3    # Pause vor Wiederholung bei gehäuften Fehlern (x Versuch)
+MODBUS_CIRCUIT_FAILURES = 3       # Fehlgeschlagene Anfragen in Folge, bis ein Slave gesperrt wird
+MODBUS_CIRCUIT_COOLDOWN = 10.0    # Sekunden bis zum nächsten Probe-Versuch eines gesperrten Slaves
+
+# Notaus: alle Module mit einem Modbus-Broadcast (Slave 0) statt einem FC15 pro Modul ausschalten.
+# Nur aktivieren, wenn alle Module Broadcast-Schreibbefehle ausführen (keine Bestätigung möglich)
+MODBUS_EMERGENCY_BROADCAST = False
+
+# Relais-Daemon (Bus-Owner-Prozess)
+# Nur der Daemon öffnet die serielle Schnittstelle, alle Worker senden über diesen Socket
+RELAY_DAEMON_SOCKET = os.environ.get('VDE_RELAY_SOCKET', '/tmp/vde_relay_daemon.sock')
+RELAY_DAEMON_TIMEOUT = 30.0  # Sekunden pro Befehl (Relais-Test hat eigenes Timeout)
+
+# Hardware-Snapshot für /api/relay_status
+# Der Daemon liest die Module im Hintergrund, Status-Abfragen bekommen den letzten Snapshot
+RELAY_SNAPSHOT_INTERVAL = 2.0  # Sekunden zwischen zwei Hintergrund-Lesungen (0 = aus)
+RELAY_SNAPSHOT_MAX_AGE = 5.0   # Standard-Höchstalter, ältere Snapshots werden neu gelesen
+
+# Logging (log_buffer.py)
+# Alles ab DEBUG (inkl. TX/RX jedes Frames) landet in einem Ringpuffer im Speicher,
+# abrufbar unter /api/admin/logs. Auf stdout/journald geht nur ab LOG_CONSOLE_LEVEL.
+LOG_BUFFER_SIZE = 2000  # Einträge pro Prozess (App-Worker bzw. Relais-Daemon)
+LOG_CONSOLE_LEVEL = os.environ.get('VDE_LOG_LEVEL', 'WARNING')
+
+# Konfigurationsdateien (config_store.py): Änderungen werden gesammelt und erst nach
+# CONFIG_WRITE_DELAY Sekunden Ruhe geschrieben (spätestens nach CONFIG_WRITE_MAX_DELAY),
+# atomar über tmp-Datei + fsync + rename. Bis dahin hält der Prozess die Dateisperre:
+# andere Worker warten mit ihren Änderungen derselben Datei höchstens CONFIG_WRITE_MAX_DELAY
+CONFIG_WRITE_DELAY = 0.5
+CONFIG_WRITE_MAX_DELAY = 2.0
+
+# Gemeinsame Konfigurations-Generation: jeder Worker erhöht sie nach dem Schreiben einer
+# Konfigurationsdatei, alle Worker vergleichen sie pro Anfrage und laden abgeleitete
+# Stände (RELAY_GROUPS, RELAY_NAMES, STROMKREISE) nur bei Änderung neu
+CONFIG_GENERATION_FILE = '/dev/shm/vde_config_generation' if os.path.isdir('/dev/shm') else '/tmp/vde_config_generation'
+
+# Hintergrund-Jobs (Relais-Test): Long-Poll-Dauer pro Anfrage im Event-Stream
+JOB_STREAM_KEEPALIVE = 15.0
 
 # Modbus Module
+# base_addr = globale Nummer des ersten Relais, num_coils = Relais des Moduls (Standard 32).
+# Der gesamte Relais-Adressraum wird daraus abgeleitet (relay_layout.py), z.B. 8 x 32 Relais:
+#   {i: {'slave_id': i + 1, 'base_addr': i * 32, 'num_coils': 32, 'name': f'Modul {i + 1}'} for i in range(8)}
+# Optional 'port' (Standard SERIAL_PORT) und 'baud_rate' (Standard BAUD_RATE): Module an verschiedenen
+# Schnittstellen bilden eigene Busse, die parallel angesteuert werden (bus_pool.py), z.B.
+#   2: {'slave_id': 1, 'base_addr': 64, 'num_coils': 32, 'name': 'Modul 3', 'port': '/dev/ttyACM1'}
 MODBUS_MODULES = {
-    0: {'slave_id': 1, 'base_addr': 0, 'name': 'Modul 1'},
-    1: {'slave_id': 2, 'base_addr': 32, 'name': 'Modul 2'}
+    0: {'slave_id': 1, 'base_addr': 0, 'num_coils': 32, 'name': 'Modul 1'},
+    1: {'slave_id': 2, 'base_addr': 32, 'num_coils': 32, 'name': 'Modul 2'}
 }
 
 # Stromkreis-Definitionen
@@ -55,3 +117,17 @@ GPIO_WARNING_TEXT = "NOTAUS BETÄTIGT"
 # Shutdown-Timeout in Sekunden (wenn Notaus für diese Zeit aktiv bleibt)
 # Standard: 120 Sekunden (2 Minuten)
 GPIO_SHUTDOWN_TIMEOUT = 120
+
+# Entprellzeit für Flanken-Events am Schließer (Millisekunden)
+# Ohne Flanken-Unterstützung fällt der Monitor auf 100ms-Polling zurück
+GPIO_DEBOUNCE_MS = 20
+
+# Event-Stream (/api/gpio/stream): Keepalive-Kommentar, wenn sich so lange nichts ändert
+GPIO_STREAM_KEEPALIVE = 15.0
+
+# Gemeinsamer Status-Block: der Monitor-Prozess schreibt, alle Gunicorn-Worker lesen
+GPIO_STATUS_FILE = '/dev/shm/vde_gpio_status' if os.path.isdir('/dev/shm') else '/tmp/vde_gpio_status'
+# Worker mit offenem Event-Stream binden hier einen Unix-Socket, der Monitor-Prozess weckt
+# sie nach jedem Schreiben des Status-Blocks (kein Polling)
+GPIO_NOTIFY_DIR = '/dev/shm/vde_gpio_notify' if os.path.isdir('/dev/shm') else '/tmp/vde_gpio_notify'
+GPIO_NOTIFY_FALLBACK_INTERVAL = 1.0  # Sekunden, nur falls GPIO_NOTIFY_DIR nicht nutzbar ist
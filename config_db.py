@@ -0,0 +1,253 @@
+"""
+VDE Messwand - Konfigurations-Tabellen in SQLite
+Relais-, Stromkreis-, Kategorien- und Übungs-Konfiguration liegen als indizierte Tabellen
+in DATABASE_PATH. Abfragen wie "alle Relais der Kategorie X" sind Index-Zugriffe statt
+Durchläufe über das komplette JSON.
+
+Jede Tabelle gehört zu einem Dokument im Konfigurations-Speicher (die bisherige JSON-Datei):
+- Beim ersten Zugriff wird die Tabelle einmalig aus der JSON-Datei übernommen (Importer).
+- Nach jeder schreibenden Transaktion wird der Tabelleninhalt wieder als JSON in die Datei
+  exportiert (verzögert und atomar, siehe config_store) - die Dateien bleiben als Backup
+  und zur Wiederherstellung erhalten.
+- Schreibende Transaktionen erhöhen die gemeinsame Konfigurations-Generation, damit
+  die anderen Worker ihre abgeleiteten Stände neu aufbauen.
+
+Die Manager registrieren ihre Tabelle einmal beim Import:
+
+    _relais_table = register_table(_relais_document, RELAIS_SCHEMA, _import_relais, _export_relais)
+    with _relais_table.transaction() as conn:          # lesen
+        conn.execute('SELECT ...')
+    with _relais_table.transaction(write=True) as conn: # schreiben (BEGIN IMMEDIATE)
+        conn.execute('UPDATE ...')
+"""
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+
+from config import DATABASE_PATH, CONFIG_DB_TIMEOUT
+from config_store import CONFIG_STORE, atomic_write, flush_config
+from log_buffer import get_logger
+
+log = get_logger(__name__)
+
+META_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS config_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+'''
+
+# Eine Verbindung pro Thread und Prozess (nach fork neu öffnen)
+_local = threading.local()
+
+
+def get_connection():
+    """
+    Verbindung zur Konfigurations-Datenbank für den aktuellen Thread
+
+    Autocommit-Modus: Transaktionen werden ausschließlich über ConfigTable.transaction()
+    bzw. config_transaction() geöffnet.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(DATABASE_PATH, timeout=CONFIG_DB_TIMEOUT, isolation_level=None)
+        # WAL: Leser blockieren keinen Schreiber (mehrere Gunicorn-Worker + Relais-Daemon)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(META_SCHEMA)
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+@contextlib.contextmanager
+def _transaction(conn, write, table=None):
+    """
+    BEGIN/COMMIT bzw. ROLLBACK; innerhalb einer laufenden Transaktion nur durchreichen.
+    Schreibende Tabellen werden gesammelt und nach dem äußersten Commit einmal exportiert.
+    """
+    if conn.in_transaction:
+        if write and table is not None:
+            _local.dirty.add(table)
+        yield conn
+        return
+
+    _local.dirty = {table} if write and table is not None else set()
+    conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+    changes = conn.total_changes
+    try:
+        yield conn
+        # Export noch in der Transaktion: genau der Stand, der committet wird.
+        # Ohne geänderte Zeilen (z.B. abgelehnte Eingabe) kein Export und keine neue Generation.
+        dirty = _local.dirty if conn.total_changes != changes else ()
+        exports = [(table, table.exporter(conn)) for table in dirty]
+        # Backup-Dateien (verzögert, atomar) noch unter der Schreibsperre der Datenbank
+        # übernehmen: die Dateien bekommen die Stände in derselben Reihenfolge wie die Tabellen
+        for table, data in exports:
+            table.document.save(data)
+    except BaseException:
+        conn.execute('ROLLBACK')
+        _local.dirty = set()
+        raise
+    conn.execute('COMMIT')
+    _local.dirty = set()
+
+    if exports:
+        # Benachrichtigung der anderen Worker
+        CONFIG_STORE.generation.bump()
+
+
+@contextlib.contextmanager
+def config_transaction(write=False):
+    """
+    Transaktion über mehrere Konfigurations-Tabellen (z.B. Relais + Stromkreise in einem Schritt)
+
+    Yields:
+        sqlite3.Connection
+    """
+    conn = get_connection()
+    with _transaction(conn, write):
+        yield conn
+
+
+class ConfigTable:
+    """Eine Konfigurations-Tabelle mit ihrer JSON-Datei als Import-Quelle und Backup"""
+
+    def __init__(self, document, schema, importer, exporter):
+        """
+        Args:
+            document: ConfigDocument der JSON-Datei (Import-Quelle, Ziel des Exports)
+            schema: Liste von CREATE TABLE/INDEX-Anweisungen (idempotent, IF NOT EXISTS);
+                    der Tabellenname muss dem Dokumentnamen entsprechen
+            importer: Funktion(conn, json_inhalt) - füllt die leere Tabelle
+            exporter: Funktion(conn) -> json_inhalt
+        """
+        self.name = document.name
+        self.document = document
+        self.schema = schema
+        self.importer = importer
+        self.exporter = exporter
+        self.lock = threading.Lock()
+        # Pro Prozess: Schema angelegt und Import geprüft
+        self._ready_pid = None
+
+    def _ensure_ready(self, conn):
+        """Legt das Schema an und übernimmt einmalig die JSON-Datei"""
+        if self._ready_pid == os.getpid():
+            return
+        with self.lock:
+            if self._ready_pid == os.getpid():
+                return
+            # Einzelne Anweisungen statt executescript(): kein implizites COMMIT einer laufenden Transaktion
+            with _transaction(conn, write=True):
+                for statement in self.schema:
+                    conn.execute(statement)
+                imported = conn.execute('SELECT value FROM config_meta WHERE key = ?',
+                                        (f'imported:{self.name}',)).fetchone()
+                if imported is None:
+                    self._import(conn)
+            # In einer äußeren Transaktion erst nach deren Commit als erledigt merken
+            if not conn.in_transaction:
+                self._ready_pid = os.getpid()
+
+    def _import(self, conn):
+        """Übernimmt den Inhalt der JSON-Datei (innerhalb der laufenden Transaktion)"""
+        data = self.document.read()
+        self.importer(conn, data)
+        conn.execute('INSERT OR REPLACE INTO config_meta (key, value) VALUES (?, ?)',
+                     (f'imported:{self.name}', self.document.path))
+        log.info(f"📥 {self.document.path} in die Datenbank übernommen ({len(data)} Einträge)")
+
+    @contextlib.contextmanager
+    def transaction(self, write=False):
+        """
+        Transaktion auf der Konfigurations-Datenbank
+
+        Args:
+            write: True = schreibend (BEGIN IMMEDIATE); nach dem Commit wird die JSON-Datei
+                   neu exportiert und die Konfigurations-Generation erhöht
+
+        Yields:
+            sqlite3.Connection
+        """
+        conn = get_connection()
+        self._ensure_ready(conn)
+        with _transaction(conn, write, self):
+            yield conn
+
+    def reimport(self):
+        """Ersetzt den Tabelleninhalt durch die JSON-Datei (Wiederherstellung aus dem Backup)"""
+        self.document.invalidate()
+        with self.transaction(write=True) as conn:
+            conn.execute(f'DELETE FROM {self.name}')
+            self._import(conn)
+
+    def export(self):
+        """Aktueller Tabelleninhalt im JSON-Format der Datei"""
+        with self.transaction() as conn:
+            return self.exporter(conn)
+
+
+_tables = {}
+
+
+def register_table(document, schema, importer, exporter):
+    """Registriert die Tabelle zu einem Konfigurations-Dokument (Tabellenname = Dokumentname)"""
+    table = _tables.get(document.name)
+    if table is None:
+        table = _tables[document.name] = ConfigTable(document, schema, importer, exporter)
+    return table
+
+
+def get_tables():
+    return dict(_tables)
+
+
+def export_config_json(directory):
+    """
+    Schreibt alle Konfigurations-Tabellen als JSON-Dateien nach directory (Backup)
+
+    Returns:
+        Liste der geschriebenen Pfade
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for table in _tables.values():
+        path = os.path.join(directory, os.path.basename(table.document.path))
+        atomic_write(path, json.dumps(table.export(), indent=table.document.indent, ensure_ascii=False))
+        paths.append(path)
+    return paths
+
+
+def _load_managers():
+    """Importiert die Manager, damit alle Tabellen registriert sind"""
+    import relais_manager       # noqa: F401
+    import stromkreis_manager   # noqa: F401
+    import training_manager     # noqa: F401
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Konfigurations-Tabellen exportieren / aus JSON wiederherstellen')
+    parser.add_argument('--export', metavar='VERZEICHNIS', help='Alle Tabellen als JSON-Dateien exportieren')
+    parser.add_argument('--reimport', metavar='TABELLE', nargs='*',
+                        help='Tabellen aus ihren JSON-Dateien neu übernehmen (ohne Angabe: alle)')
+    args = parser.parse_args()
+
+    _load_managers()
+    if args.export:
+        for path in export_config_json(args.export):
+            print(f"✓ {path}")
+    if args.reimport is not None:
+        names = args.reimport or list(_tables)
+        for name in names:
+            _tables[name].reimport()
+            print(f"✓ {name} aus {_tables[name].document.path} übernommen")
+        flush_config()
+    if not args.export and args.reimport is None:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
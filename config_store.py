@@ -0,0 +1,518 @@
+"""
+VDE Messwand - Zentraler Konfigurations-Speicher
+Alle JSON-Konfigurationsdateien (relais_config.json, stromkreise.json, settings.json, ...)
+werden einmal geparst und im Speicher gehalten. Ein Zugriff prüft nur mtime/Größe der
+Datei (Änderungen durch andere Worker oder von Hand) und parst erst dann neu.
+Jede Änderung eines Dokuments erhöht seinen Versionszähler, abgeleitete Sichten
+(z.B. der Relais-Index) bauen sich nur bei neuer Version neu auf.
+
+Speichern wirkt sofort im Speicher (lesen nach schreiben sieht den neuen Stand), die
+Datei wird erst nach CONFIG_WRITE_DELAY Sekunden ohne weitere Änderung geschrieben:
+eine Serie von Bearbeitungen wird zu einem Schreibvorgang. Geschrieben wird atomar
+(tmp-Datei, fsync, rename) - ein Stromausfall hinterlässt den alten oder den neuen
+Stand, nie eine halbe Datei. Beim Prozessende werden ausstehende Änderungen geschrieben.
+
+Mehrere Prozesse (Gunicorn-Worker, Relais-Daemon) schreiben dieselben Dateien. Lesen-
+Ändern-Schreiben läuft deshalb in transaction(): ein flock auf <datei>.lock, gehalten vom
+Lesen bis zum Schreiben. Ein noch nicht geschriebener Stand hält die Sperre ebenfalls -
+ein anderer Prozess wartet höchstens CONFIG_WRITE_MAX_DELAY, liest danach die neue Datei
+und kann die Änderung nicht mehr überschreiben.
+
+Nach jedem Schreiben wird die gemeinsame Konfigurations-Generation (mmap-Block, siehe
+SharedGeneration) erhöht. Abgeleitete Stände in Modul-Globalen (config.RELAY_GROUPS, ...)
+prüfen pro Anfrage nur diese Zahl und die lokalen Änderungen (ConfigWatcher) und werden
+nur bei einer Änderung in irgendeinem Worker neu aufgebaut.
+
+Die Manager registrieren ihre Datei einmal beim Import:
+
+    _settings = register_document('settings', SETTINGS_FILE, default=get_default_settings,
+                                  normalize=_with_defaults)
+    _settings.read()             # geteilter Stand - nur lesen!
+    with _settings.transaction():
+        settings = _settings.copy()     # eigene Kopie zum Bearbeiten
+        _settings.save(settings)        # Speicherstand übernehmen, Datei verzögert schreiben
+"""
+import atexit
+import contextlib
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from config import CONFIG_WRITE_DELAY, CONFIG_WRITE_MAX_DELAY, CONFIG_GENERATION_FILE
+from log_buffer import get_logger
+
+log = get_logger(__name__)
+
+
+def copy_json(value):
+    """Tiefe Kopie eines JSON-Dokuments (dict/list/Skalare) - deutlich schneller als copy.deepcopy"""
+    if isinstance(value, dict):
+        return {key: copy_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_json(item) for item in value]
+    return value
+
+
+def atomic_write(path, text):
+    """
+    Schreibt text so nach path, dass die Datei immer vollständig ist:
+    tmp-Datei im selben Verzeichnis, fsync, rename über die alte Datei, fsync des Verzeichnisses
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    # Pro Prozess eigene tmp-Datei (mehrere Gunicorn-Worker)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # Rename selbst dauerhaft machen (nicht jedes Dateisystem erlaubt fsync auf Verzeichnisse)
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+
+class SharedGeneration:
+    """
+    Zähler als 8-Byte-mmap-Block (z.B. /dev/shm) für alle Prozesse.
+    Lesen ist ein Zugriff auf den Speicher ohne Lock und ohne Systemaufruf, Erhöhen
+    nimmt einen POSIX-Dateilock (lockf gilt pro Prozess, auch für vererbte Deskriptoren).
+    """
+
+    COUNTER = struct.Struct('<Q')
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.mm = None
+        self.lock = threading.Lock()
+
+    def _open(self):
+        """Öffnet bzw. legt die Datei an - True bei Erfolg"""
+        if self.mm is not None:
+            return True
+        with self.lock:
+            if self.mm is not None:
+                return True
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError as e:
+                log.warning(f"⚠️ Konfigurations-Generation {self.path} nicht verfügbar: {e}")
+                return False
+            try:
+                if os.fstat(fd).st_size < self.COUNTER.size:
+                    os.ftruncate(fd, self.COUNTER.size)
+                self.mm = mmap.mmap(fd, self.COUNTER.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            except OSError as e:
+                os.close(fd)
+                log.warning(f"⚠️ Konfigurations-Generation {self.path} nicht verfügbar: {e}")
+                return False
+            self.fd = fd
+            return True
+
+    @property
+    def value(self):
+        """Aktuelle Generation (0 = noch nie erhöht oder nicht verfügbar)"""
+        if not self._open():
+            return 0
+        return self.COUNTER.unpack_from(self.mm, 0)[0]
+
+    def bump(self):
+        """Erhöht die Generation für alle Prozesse und liefert den neuen Wert"""
+        if not self._open():
+            return 0
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                value = self.COUNTER.unpack_from(self.mm, 0)[0] + 1
+                self.COUNTER.pack_into(self.mm, 0, value)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        return value
+
+
+class ConfigDocument:
+    """Eine JSON-Datei, geparst im Speicher"""
+
+    def __init__(self, name, path, default=dict, normalize=None, migrate=None, indent=2,
+                 write_delay=CONFIG_WRITE_DELAY, max_delay=CONFIG_WRITE_MAX_DELAY):
+        """
+        Args:
+            name: Name im Store (z.B. 'settings')
+            path: Pfad der JSON-Datei
+            default: Funktion, die den Inhalt bei fehlender/defekter Datei liefert
+            normalize: Funktion geparstes JSON -> Dokument (z.B. int-Keys, fehlende Felder)
+            migrate: Funktion geparstes JSON -> neues JSON oder None; ein Ergebnis wird
+                     sofort zurückgeschrieben (alte Dateistrukturen)
+            indent: Einrückung beim Schreiben (None = kompakt)
+            write_delay: Ruhezeit vor dem Schreiben in Sekunden (0 = sofort schreiben)
+            max_delay: Spätestens so lange nach der ersten ungeschriebenen Änderung schreiben
+        """
+        self.name = name
+        self.path = path
+        self.default = default
+        self.normalize = normalize
+        self.migrate = migrate
+        self.indent = indent
+        self.write_delay = write_delay
+        self.max_delay = max(max_delay, write_delay)
+        # Erhöht sich bei jedem neuen Stand (Laden nach Dateiänderung oder save)
+        self.version = 0
+        self.loads = 0
+        self.saves = 0
+        self.writes = 0
+        # Noch nicht geschriebener Stand (JSON-Text), Zeitpunkt der ersten Änderung, Timer
+        self._pending = None
+        self._pending_since = None
+        self._timer = None
+        self.lock = threading.RLock()
+        # Prozessübergreifende Sperre: Deskriptor der .lock-Datei (pro Prozess und Pfad),
+        # PID des Prozesses, der den flock hält, Verschachtelungstiefe von transaction()
+        self._lock_fd = None
+        self._lock_key = None
+        self._locked_by = None
+        self._depth = 0
+        # Store, dem Änderungen gemeldet werden (setzt ConfigStore.register)
+        self.store = None
+        self._data = None
+        # (inode, mtime_ns, size) des geladenen Stands, None = Datei fehlt, False = nie geladen
+        self._stamp = False
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+            # Inode: jedes atomare Schreiben ist eine neue Datei, auch bei gleicher mtime und Größe
+            return stat.st_ino, stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _parse(self, raw):
+        return self.normalize(raw) if self.normalize else raw
+
+    def _load(self):
+        """Liest die Datei; bei fehlender oder defekter Datei der Standardinhalt"""
+        self.loads += 1
+        if not os.path.exists(self.path):
+            return self.default()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except Exception as e:
+            log.error(f"Fehler beim Laden von {self.path}: {e}")
+            return self.default()
+
+        if self.migrate:
+            migrated = self.migrate(raw)
+            if migrated is not None:
+                atomic_write(self.path, self._serialize(migrated))
+                raw = migrated
+        return self._parse(raw)
+
+    @property
+    def exists(self):
+        """True, wenn der aktuelle Stand aus einer vorhandenen (oder gerade geschriebenen) Datei stammt"""
+        self.read()
+        return self._pending is not None or self._stamp is not None
+
+    def read(self):
+        """
+        Aktueller Stand - geteiltes Objekt, darf nicht verändert werden (dafür copy())
+        """
+        if self._pending is not None:
+            # Eigene Änderung noch nicht geschrieben: der Speicher ist aktueller als die Datei
+            # (und kein anderer Prozess kann schreiben, solange sie aussteht)
+            return self._data
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            with self.lock:
+                stamp = self._file_stamp()
+                if stamp != self._stamp:
+                    self._data = self._load()
+                    # Nach einer Migration hat sich die Datei geändert
+                    self._stamp = self._file_stamp()
+                    self.version += 1
+        return self._data
+
+    def copy(self):
+        """Eigene Kopie des aktuellen Stands zum Bearbeiten"""
+        return copy_json(self.read())
+
+    def get(self, key, default=None):
+        """Einzelner Eintrag eines dict-Dokuments (geteilt, nicht verändern)"""
+        return self.read().get(key, default)
+
+    def _serialize(self, data):
+        return json.dumps(data, indent=self.indent, ensure_ascii=False)
+
+    def _lock_file(self):
+        """Nimmt den flock auf <path>.lock (blockiert, bis kein anderer Prozess ihn hält)"""
+        key = os.getpid(), os.path.abspath(self.path)
+        if self._lock_key != key:
+            # Nach fork eigener Deskriptor: flock gilt pro geöffneter Datei, ein geerbter
+            # Deskriptor teilt die Sperre mit dem Elternprozess
+            self._lock_fd = os.open(f'{key[1]}.lock', os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_key = key
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        self._locked_by = key[0]
+
+    def _unlock_file(self):
+        if self._locked_by == os.getpid():
+            self._locked_by = None
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Lesen-Ändern-Schreiben exklusiv gegenüber anderen Threads und Prozessen
+
+        Hält den Dokument-Lock und den flock auf <path>.lock. read()/copy() darin sehen
+        den neuesten Stand der Datei, save() schreibt darin verzögert wie sonst auch - der
+        flock bleibt dann bis zum Schreiben gehalten. Verschachtelt aufrufbar.
+
+            with document.transaction():
+                data = document.copy()
+                data['key'] = value
+                document.save(data)
+        """
+        with self.lock:
+            if self._locked_by != os.getpid():
+                self._lock_file()
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and self._pending is None:
+                    self._unlock_file()
+
+    def save(self, data, immediate=False):
+        """
+        Übernimmt data als neuen Stand und plant das Schreiben der Datei
+
+        Basiert data auf einem vorher gelesenen Stand, müssen Lesen und save() in derselben
+        transaction() laufen - sonst kann data die Änderung eines anderen Prozesses überschreiben.
+
+        Args:
+            data: Neuer Inhalt
+            immediate: True = sofort (atomar) schreiben statt nach write_delay
+
+        Returns:
+            True bei Erfolg, False wenn data nicht serialisierbar ist bzw. (immediate)
+            das Schreiben fehlschlägt
+        """
+        try:
+            text = self._serialize(data)
+        except Exception as e:
+            log.error(f"Fehler beim Speichern von {self.path}: {e}")
+            return False
+        with self.transaction():
+            # Über JSON normalisiert: Keys als Strings wie nach dem Laden, keine geteilten Objekte mit data
+            self._data = self._parse(json.loads(text))
+            self.version += 1
+            self.saves += 1
+            if self.store is not None:
+                self.store.changes += 1
+            self._pending = text
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+
+            if immediate or self.write_delay <= 0:
+                return self.flush()
+            self._schedule(self.write_delay)
+            return True
+
+    def _schedule(self, delay):
+        """(Neu-)Start des Schreib-Timers, höchstens bis max_delay nach der ersten Änderung"""
+        deadline = self._pending_since + self.max_delay
+        delay = max(0.0, min(delay, deadline - time.monotonic()))
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """
+        Schreibt einen ausstehenden Stand sofort und gibt den flock frei (außerhalb einer
+        laufenden transaction()). Schlägt das Schreiben fehl, wird der Stand verworfen und
+        die Datei neu geladen - andere Prozesse dürfen nicht unbegrenzt auf die Sperre warten.
+
+        Returns:
+            True wenn nichts aussteht oder das Schreiben geklappt hat
+        """
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            text = self._pending
+            if text is None:
+                return True
+            try:
+                atomic_write(self.path, text)
+                written = True
+            except Exception as e:
+                log.error(f"Fehler beim Schreiben von {self.path}, Änderung verworfen: {e}")
+                written = False
+            self._pending = None
+            self._pending_since = None
+            if written:
+                self._stamp = self._file_stamp()
+                self.writes += 1
+            else:
+                self._stamp = False
+            if self._depth == 0:
+                self._unlock_file()
+        # Andere Worker laden die Datei ab jetzt neu
+        if written and self.store is not None:
+            self.store.generation.bump()
+        return written
+
+    def update(self, mutator):
+        """
+        Lesen-Ändern-Schreiben in einer transaction()
+
+        Args:
+            mutator: Funktion(kopie) -> Ergebnis; verändert die Kopie direkt
+
+        Returns:
+            (saved, ergebnis)
+        """
+        with self.transaction():
+            data = self.copy()
+            result = mutator(data)
+            return self.save(data), result
+
+    def invalidate(self):
+        """Erzwingt Neuladen beim nächsten Zugriff (ausstehende Änderungen werden vorher geschrieben)"""
+        self.flush()
+        self._stamp = False
+
+    def info(self):
+        return {
+            'name': self.name,
+            'path': self.path,
+            'version': self.version,
+            'loads': self.loads,
+            'saves': self.saves,
+            'writes': self.writes,
+            'pending': self._pending is not None,
+            'exists': self._stamp not in (None, False),
+        }
+
+
+class ConfigStore:
+    """Alle registrierten Konfigurationsdokumente"""
+
+    def __init__(self, generation_file=CONFIG_GENERATION_FILE):
+        self.documents = {}
+        self.lock = threading.Lock()
+        # Gemeinsam für alle Prozesse: erhöht nach jedem Schreiben einer Datei
+        self.generation = SharedGeneration(generation_file)
+        # Nur dieser Prozess: erhöht bei jedem save() (auch vor dem verzögerten Schreiben)
+        self.changes = 0
+
+    def token(self):
+        """Vergleichswert für ConfigWatcher - ändert sich bei jeder Konfigurationsänderung"""
+        return self.generation.value, self.changes
+
+    def register(self, name, path, **options):
+        """Legt ein Dokument an (bei erneutem Aufruf mit gleichem Namen das vorhandene)"""
+        with self.lock:
+            document = self.documents.get(name)
+            if document is None:
+                document = self.documents[name] = ConfigDocument(name, path, **options)
+                document.store = self
+            return document
+
+    def document(self, name):
+        return self.documents[name]
+
+    def versions(self):
+        """{name: version} aller Dokumente"""
+        return {name: document.version for name, document in self.documents.items()}
+
+    def info(self):
+        return [document.info() for document in self.documents.values()]
+
+    def watch(self, rebuild):
+        """Liefert einen ConfigWatcher, der rebuild() bei Konfigurationsänderungen aufruft"""
+        return ConfigWatcher(self, rebuild)
+
+    def flush_all(self):
+        """Schreibt alle ausstehenden Änderungen (Prozessende, Herunterfahren)"""
+        success = True
+        for document in list(self.documents.values()):
+            success = document.flush() and success
+        return success
+
+
+class ConfigWatcher:
+    """
+    Hält einen abgeleiteten Stand (z.B. config.RELAY_GROUPS) aktuell: refresh() vergleicht
+    nur die Generation und baut den Stand neu auf, wenn sich seit dem letzten Aufbau
+    irgendeine Konfiguration geändert hat - in diesem oder einem anderen Prozess.
+    """
+
+    def __init__(self, store, rebuild):
+        self.store = store
+        self.rebuild = rebuild
+        self.lock = threading.Lock()
+        self.seen = None
+        self.rebuilds = 0
+
+    def refresh(self):
+        """
+        Returns:
+            True, wenn neu aufgebaut wurde
+        """
+        token = self.store.token()
+        if token == self.seen:
+            return False
+        with self.lock:
+            if token == self.seen:
+                return False
+            # Stand vor dem Aufbau merken: Änderungen währenddessen lösen einen weiteren Aufbau aus
+            self.rebuild()
+            self.seen = token
+            self.rebuilds += 1
+            return True
+
+
+CONFIG_STORE = ConfigStore()
+atexit.register(CONFIG_STORE.flush_all)
+
+
+def register_document(name, path, **options):
+    """Registriert eine JSON-Datei im globalen Store (siehe ConfigDocument)"""
+    return CONFIG_STORE.register(name, path, **options)
+
+
+def get_document(name):
+    return CONFIG_STORE.document(name)
+
+
+def watch_config(rebuild):
+    """ConfigWatcher auf dem globalen Store (siehe ConfigWatcher)"""
+    return CONFIG_STORE.watch(rebuild)
+
+
+def flush_config():
+    """Schreibt alle ausstehenden Konfigurationsänderungen sofort"""
+    return CONFIG_STORE.flush_all()
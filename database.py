@@ -79,7 +79,7 @@ def get_relay_display_name(relay_num):
     Wenn kein Name vergeben ist, wird "Relais X" zurückgegeben.
 
     Args:
-        relay_num: Relais-Nummer (0-63)
+        relay_num: Relais-Nummer (siehe relay_layout)
 
     Returns:
         Anzeigename als String
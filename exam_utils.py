@@ -3,6 +3,7 @@ VDE Messwand - Prüfungs-Hilfsfunktionen
 """
 import random
 from config import DEFAULT_EXAM_RELAY_COUNT
+from relay_layout import RELAY_LAYOUT
 from relais_manager import get_all_relais_config, get_groups_overview
 from stromkreis_manager import get_all_stromkreise
 from settings_manager import get_wallbox_enabled, get_exam_settings
@@ -17,7 +18,7 @@ def get_effective_relay_list():
         Liste von Relais-Nummern oder Gruppen-IDs
     """
     groups = get_groups_overview()
-    all_relays = set(range(64))
+    all_relays = set(RELAY_LAYOUT.relays())
     grouped_relays = set()
     effective_list = []
 
@@ -70,7 +71,7 @@ def select_random_relays(count=None):
 
             # Finde alle Relais mit diesem Stromkreis
             relais_list = []
-            for relay_num in range(64):
+            for relay_num in RELAY_LAYOUT.relays():
                 relay_data = relais_config.get(relay_num, {})
                 if relay_data.get('stromkreis') == sk_data['name']:
                     relais_list.append(relay_num)
@@ -128,7 +129,7 @@ def get_stromkreis_for_relay(relay_num):
     Findet den Stromkreis für ein bestimmtes Relais
 
     Args:
-        relay_num: Relais-Nummer (0-63)
+        relay_num: Relais-Nummer (siehe relay_layout)
 
     Returns:
         Dictionary mit Stromkreis-Info oder None
@@ -156,7 +157,7 @@ def get_relay_description(relay_num):
     Berücksichtigt auch Gruppen
 
     Args:
-        relay_num: Relais-Nummer (0-63)
+        relay_num: Relais-Nummer (siehe relay_layout)
 
     Returns:
         String mit Beschreibung
@@ -252,7 +253,7 @@ def validate_relay_selection(relay_numbers):
     for relay in relay_numbers:
         try:
             relay_int = int(relay)
-            if 0 <= relay_int <= 63:
+            if RELAY_LAYOUT.is_valid(relay_int):
                 valid.append(relay_int)
             else:
                 invalid.append(relay)
@@ -3,8 +3,18 @@ GPIO Monitor für Schließer-Überwachung
 Überwacht einen Schließer-Kontakt an GPIO-Pins
 Unterstützt Raspberry Pi 5 (gpiod) und ältere Modelle (RPi.GPIO)
 """
+import contextlib
+import itertools
+import mmap
+import os
+import select
+import socket
+import struct
 import time
 import threading
+from datetime import timedelta
+
+from config import GPIO_STATUS_FILE, GPIO_NOTIFY_DIR, GPIO_NOTIFY_FALLBACK_INTERVAL
 
 # GPIO-Bibliothek importieren - versuche zuerst gpiod (Pi 5), dann RPi.GPIO
 GPIO_BACKEND = None
@@ -26,10 +36,310 @@ except ImportError:
         print("⚠️ Keine GPIO-Bibliothek verfügbar - Dummy-Modus aktiv")
 
 
+class StatusBroadcaster:
+    """
+    Verteilt Statusänderungen an beliebig viele wartende Clients (z.B. SSE-Verbindungen).
+    Alle Clients warten auf dieselbe Condition, ein publish() weckt alle mit einem notify_all().
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.status = None
+
+    def publish(self, status):
+        """
+        Veröffentlicht einen neuen Status, aber nur wenn er sich geändert hat
+
+        Returns:
+            bool: True wenn sich der Status geändert hat
+        """
+        with self.condition:
+            if status == self.status:
+                return False
+            self.status = status
+            self.seq += 1
+            self.condition.notify_all()
+            return True
+
+    def wait(self, last_seq=None, timeout=None):
+        """
+        Wartet bis ein neuerer Status als last_seq vorliegt
+
+        Args:
+            last_seq: Zuletzt empfangene Sequenznummer (None = sofort aktuellen Status liefern)
+            timeout: Maximale Wartezeit in Sekunden
+
+        Returns:
+            tuple: (seq, status) - seq == last_seq bei Timeout
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq != last_seq, timeout)
+            return self.seq, self.status
+
+
+# Globaler Broadcaster für Notaus-Status und Shutdown-Countdown
+gpio_status_broadcaster = StatusBroadcaster()
+
+
+def _build_status(active, pin1, pin2, gpio_available, gpio_backend, monitoring, edge_events,
+                  shutdown_timeout, notaus_start_time, shutdown_triggered):
+    """Status-Dictionary wie von /api/gpio/status geliefert (Countdown aus Startzeit berechnet)"""
+    status = {
+        'active': active,
+        'pin1': pin1,
+        'pin2': pin2,
+        'gpio_available': gpio_available,
+        'gpio_backend': gpio_backend,
+        'monitoring': monitoring,
+        'edge_events': edge_events,
+        'shutdown_pending': False,
+        'shutdown_in_seconds': None
+    }
+
+    # Shutdown-Timer Info hinzufügen
+    if active and notaus_start_time and not shutdown_triggered:
+        elapsed = time.time() - notaus_start_time
+        remaining = shutdown_timeout - elapsed
+        status['shutdown_pending'] = True
+        status['shutdown_in_seconds'] = int(remaining)
+
+    return status
+
+
+class SharedStatusBlock:
+    """
+    Notaus-Status als kleiner mmap-Block (z.B. /dev/shm) für alle Prozesse.
+    Genau ein Schreiber (Prozess mit Monitor-Thread), beliebig viele Leser ohne Lock:
+    Seqlock - seq ist während des Schreibens ungerade, Leser wiederholen bei Änderung.
+    Der Countdown wird beim Lesen aus der Startzeit berechnet; geschrieben wird bei jeder
+    Statusänderung, während eines Notaus-Countdowns also auch einmal pro Sekunde.
+    Wartende Leser weckt der StatusNotifier.
+    """
+
+    SEQ = struct.Struct('<Q')
+    # active, gpio_available, monitoring, edge_events, shutdown_triggered, backend,
+    # pin1, pin2, shutdown_timeout, notaus_start_time
+    BODY = struct.Struct('<BBBBBBHHId')
+    SIZE = SEQ.size + BODY.size
+    BACKENDS = (None, 'gpiod', 'RPi.GPIO')
+
+    def __init__(self, path, writer=False):
+        """
+        Args:
+            path: Pfad der Status-Datei
+            writer: True = Datei anlegen und beschreiben, False = nur lesen
+        """
+        self.path = path
+        self.writer = writer
+        self.mm = None
+        self.seq = 0
+
+        if writer:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.ftruncate(fd, self.SIZE)
+                self.mm = mmap.mmap(fd, self.SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            finally:
+                os.close(fd)
+        else:
+            self.open_reader()
+
+    def open_reader(self):
+        """Öffnet die Datei zum Lesen, falls vorhanden - True bei Erfolg"""
+        if self.mm is not None:
+            return True
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            if os.fstat(fd).st_size < self.SIZE:
+                return False
+            self.mm = mmap.mmap(fd, self.SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+            return True
+        finally:
+            os.close(fd)
+
+    def write(self, monitor):
+        """Schreibt den Zustand des Monitors (nur im Schreiber-Prozess)"""
+        seq = self.seq + 1
+        self.SEQ.pack_into(self.mm, 0, seq)
+        self.BODY.pack_into(
+            self.mm, self.SEQ.size,
+            monitor.is_active, GPIO_AVAILABLE, monitor.monitoring, monitor.edge_events,
+            monitor.shutdown_triggered, self.BACKENDS.index(GPIO_BACKEND),
+            monitor.pin1, monitor.pin2, int(monitor.shutdown_timeout),
+            monitor.notaus_start_time or 0.0
+        )
+        self.SEQ.pack_into(self.mm, 0, seq + 1)
+        self.seq = seq + 1
+
+    def read_seq(self):
+        """Aktuelle Sequenznummer (0 = noch nichts geschrieben oder Datei fehlt)"""
+        if not self.open_reader():
+            return 0
+        return self.SEQ.unpack_from(self.mm, 0)[0]
+
+    def read(self):
+        """
+        Liest einen konsistenten Stand ohne Lock
+
+        Returns:
+            tuple: (seq, status) oder None wenn (noch) kein Status vorliegt
+        """
+        if not self.open_reader():
+            return None
+
+        for _ in range(1000):
+            seq = self.SEQ.unpack_from(self.mm, 0)[0]
+            if seq & 1:
+                continue  # Schreiber ist gerade dabei
+            fields = self.BODY.unpack_from(self.mm, self.SEQ.size)
+            if seq == self.SEQ.unpack_from(self.mm, 0)[0]:
+                break
+        else:
+            return None
+
+        if seq == 0:
+            return None
+
+        (active, available, monitoring, edge_events, triggered, backend,
+         pin1, pin2, shutdown_timeout, start_time) = fields
+        return seq, _build_status(
+            bool(active), pin1, pin2, bool(available), self.BACKENDS[backend], bool(monitoring),
+            bool(edge_events), shutdown_timeout, start_time or None, bool(triggered)
+        )
+
+    def close(self, unlink=False):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if unlink:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class StatusNotifier:
+    """
+    Weckt Leser anderer Prozesse nach jedem Schreiben des Status-Blocks.
+    Jeder Leser (StatusSubscription) bindet einen Unix-Datagram-Socket in directory und
+    blockiert in recv(); der Schreiber schickt ein Byte an jeden Socket dort. Ohne
+    angemeldete Leser (kein offener Event-Stream) kostet ein Schreiben nur ein scandir().
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.sock = None
+
+    def notify(self):
+        """
+        Weckt alle angemeldeten Leser, ohne zu blockieren
+
+        Returns:
+            int: Anzahl geweckter Leser
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.sock')]
+        except OSError:
+            return 0
+        if not entries:
+            return 0
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+
+        woken = 0
+        for entry in entries:
+            try:
+                self.sock.sendto(b'\x01', entry.path)
+                woken += 1
+            except BlockingIOError:
+                # Leser hat noch ungelesene Weckrufe - er liest ohnehin den neuesten Stand
+                woken += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket eines beendeten Workers
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+            except OSError as e:
+                print(f"⚠️ GPIO-Status-Leser {entry.path} nicht erreichbar: {e}")
+        return woken
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class StatusSubscription:
+    """Empfangs-Socket eines Lesers in einem anderen Prozess (siehe StatusNotifier)"""
+
+    _ids = itertools.count()
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{os.getpid()}-{next(self._ids)}.sock')
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self.sock.bind(self.path)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def wait(self):
+        """Blockiert bis zum nächsten Weckruf (Schreiben des Status-Blocks oder wake())"""
+        self.sock.recv(64)
+
+    def wake(self):
+        """Weckt den eigenen wait() (z.B. zum Beenden)"""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.setblocking(False)
+                sock.sendto(b'\x00', self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class PolledSubscription:
+    """
+    Ersatz für StatusSubscription, wenn GPIO_NOTIFY_DIR nicht nutzbar ist: wait() kehrt
+    spätestens nach interval zurück - Event-Streams der Worker bleiben nie stehen
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.event = threading.Event()
+
+    def wait(self):
+        self.event.wait(self.interval)
+        self.event.clear()
+
+    def wake(self):
+        self.event.set()
+
+    def close(self):
+        pass
+
+
 class GPIOMonitor:
     """Überwacht GPIO-Pins für Schließer-Status"""
 
-    def __init__(self, pin1=17, pin2=27, shutdown_timeout=120):
+    def __init__(self, pin1=17, pin2=27, shutdown_timeout=120, debounce_ms=20):
         """
         Initialisiert GPIO-Monitor
 
@@ -37,6 +347,7 @@ class GPIOMonitor:
             pin1: Erster GPIO-Pin (BCM-Nummerierung)
             pin2: Zweiter GPIO-Pin (BCM-Nummerierung)
             shutdown_timeout: Sekunden bis zum Shutdown bei aktivem Notaus (Standard: 120)
+            debounce_ms: Entprellzeit für Flanken-Events in Millisekunden (Standard: 20)
         """
         global GPIO_AVAILABLE
 
@@ -50,6 +361,29 @@ class GPIOMonitor:
         self.chip = None
         self.lines = None
 
+        # Flanken-Events statt Polling (falls vom Backend unterstützt)
+        self.debounce_ms = debounce_ms
+        self.edge_events = False
+        # Weckt den Monitor-Thread (RPi.GPIO-Callback, Stop, Polling-Fallback)
+        self.wake_event = threading.Event()
+        # Pipe zum Aufwecken aus select() (gpiod)
+        self._wake_read, self._wake_write = os.pipe()
+        # Zeitpunkt der letzten Flanke (time.monotonic()) für die Notaus-Latenzmessung
+        self.last_edge_time = None
+        # Werden bei jedem Notaus-Wechsel mit (active, edge_time) aufgerufen
+        self.notaus_callbacks = []
+
+        # Prozess mit dem Monitor-Thread; nach fork() (Gunicorn-Worker) wird der
+        # Status stattdessen aus dem gemeinsamen Status-Block gelesen
+        self.owner_pid = os.getpid()
+        self.shared_block = None
+        try:
+            self.shared_block = SharedStatusBlock(GPIO_STATUS_FILE, writer=True)
+        except OSError as e:
+            print(f"⚠️ GPIO-Status-Block {GPIO_STATUS_FILE} nicht verfügbar: {e}")
+        # Weckt Event-Streams der Worker nach jedem Schreiben des Status-Blocks
+        self.notifier = StatusNotifier(GPIO_NOTIFY_DIR)
+
         # Shutdown-Timer für Notaus
         self.shutdown_timeout = shutdown_timeout
         self.notaus_start_time = None  # Zeitpunkt wann Notaus aktiviert wurde
@@ -65,6 +399,10 @@ class GPIOMonitor:
                 print(f"✅ GPIO-Monitor initialisiert: Pin {self.pin1} und {self.pin2}")
                 print(f"   Backend: {GPIO_BACKEND}")
                 print(f"   Konfiguration: INPUT mit Pull-Up (LOW=geschlossen)")
+                if self.edge_events:
+                    print(f"   Modus: Flanken-Events (Entprellung {self.debounce_ms} ms)")
+                else:
+                    print(f"   Modus: Polling alle 100 ms (keine Flanken-Events verfügbar)")
 
                 # Starte Überwachung
                 self.start_monitoring()
@@ -75,6 +413,9 @@ class GPIOMonitor:
         else:
             print("⚠️ GPIO-Monitor im Dummy-Modus")
 
+        # Anfangszustand für Event-Stream-Clients (im Dummy-Modus der einzige)
+        self.publish_status()
+
     def _init_gpiod(self):
         """Initialisiert GPIO mit gpiod (Raspberry Pi 5)"""
         # Öffne GPIO-Chip (gpiochip4 ist ein Symlink zu gpiochip0 auf Pi 5)
@@ -95,13 +436,27 @@ class GPIOMonitor:
 
         # Request Lines mit gpiod v2 API
         # Beide Pins als Tuple für gemeinsame LineSettings
-        self.lines = self.chip.request_lines(
-            consumer="gpio_monitor",
-            config={(self.pin1, self.pin2): gpiod.LineSettings(
-                direction=gpiod.line.Direction.INPUT,
-                bias=gpiod.line.Bias.PULL_UP
-            )}
-        )
+        # Zuerst mit Flanken-Erkennung + Entprellung im Kernel, sonst ohne (Polling)
+        try:
+            self.lines = self.chip.request_lines(
+                consumer="gpio_monitor",
+                config={(self.pin1, self.pin2): gpiod.LineSettings(
+                    direction=gpiod.line.Direction.INPUT,
+                    bias=gpiod.line.Bias.PULL_UP,
+                    edge_detection=gpiod.line.Edge.BOTH,
+                    debounce_period=timedelta(milliseconds=self.debounce_ms)
+                )}
+            )
+            self.edge_events = True
+        except Exception as e:
+            print(f"⚠️ gpiod Flanken-Erkennung nicht verfügbar ({e}) - verwende Polling")
+            self.lines = self.chip.request_lines(
+                consumer="gpio_monitor",
+                config={(self.pin1, self.pin2): gpiod.LineSettings(
+                    direction=gpiod.line.Direction.INPUT,
+                    bias=gpiod.line.Bias.PULL_UP
+                )}
+            )
 
     def _init_rpi_gpio(self):
         """Initialisiert GPIO mit RPi.GPIO (Raspberry Pi 1-4)"""
@@ -113,6 +468,19 @@ class GPIOMonitor:
         GPIO.setup(self.pin1, GPIO.IN, pull_up_down=GPIO.PUD_UP)
         GPIO.setup(self.pin2, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
+        # Flanken-Callback weckt den Monitor-Thread (nur Pin1 ist relevant)
+        try:
+            kwargs = {'bouncetime': int(self.debounce_ms)} if self.debounce_ms > 0 else {}
+            GPIO.add_event_detect(self.pin1, GPIO.BOTH, callback=self._on_edge, **kwargs)
+            self.edge_events = True
+        except RuntimeError as e:
+            print(f"⚠️ RPi.GPIO Flanken-Erkennung nicht verfügbar ({e}) - verwende Polling")
+
+    def _on_edge(self, channel):
+        """RPi.GPIO-Callback: Zeitpunkt merken und Monitor-Thread wecken"""
+        self.last_edge_time = time.monotonic()
+        self.wake_event.set()
+
     def read_status(self):
         """
         Liest aktuellen Schließer-Status
@@ -153,7 +521,11 @@ class GPIOMonitor:
             return False
 
     def monitor_loop(self):
-        """Kontinuierliche Überwachung in separatem Thread"""
+        """
+        Überwachung in separatem Thread.
+        Mit Flanken-Events blockiert der Thread, bis sich Pin1 ändert; nur während eines
+        laufenden Shutdown-Countdowns wacht er einmal pro Sekunde auf.
+        """
         print("🔄 GPIO-Überwachung gestartet")
 
         last_state = None
@@ -164,8 +536,11 @@ class GPIOMonitor:
 
                 # Nur bei Zustandsänderung loggen
                 if current_state != last_state:
+                    edge_time = self.last_edge_time or time.monotonic()
                     self.is_active = current_state
                     if current_state:
+                        # Zuerst Relais abschalten, dann loggen
+                        self._run_notaus_callbacks(True, edge_time)
                         print("🔴 WARNUNG: Schließer geschlossen (Notaus betätigt)")
                         # Starte Shutdown-Timer
                         self.notaus_start_time = time.time()
@@ -175,7 +550,10 @@ class GPIOMonitor:
                         # Setze Timer zurück
                         self.notaus_start_time = None
                         self.shutdown_triggered = False
+                        if last_state is not None:
+                            self._run_notaus_callbacks(False, edge_time)
                     last_state = current_state
+                self.last_edge_time = None
 
                 # Prüfe Shutdown-Timer (wenn Notaus aktiv)
                 if current_state and self.notaus_start_time and not self.shutdown_triggered:
@@ -196,12 +574,77 @@ class GPIOMonitor:
                         print("🔴 NOTAUS: 2 Minuten abgelaufen - System wird heruntergefahren!")
                         self._trigger_shutdown()
 
-                time.sleep(0.1)  # 100ms Polling-Intervall
+                # Zustandswechsel und Countdown-Sekunden an Event-Stream-Clients
+                self.publish_status()
+
+                self._wait_for_change(self._countdown_timeout())
 
             except Exception as e:
                 print(f"❌ Fehler in Monitor-Loop: {e}")
                 time.sleep(1)
 
+    def add_notaus_callback(self, callback):
+        """
+        Registriert callback(active, edge_time), aufgerufen im Monitor-Thread bei jedem Wechsel.
+        Ist der Notaus bereits aktiv, wird callback sofort aufgerufen.
+        """
+        self.notaus_callbacks.append(callback)
+        if self.is_active:
+            self._call_notaus_callback(callback, True, time.monotonic())
+
+    def _run_notaus_callbacks(self, active, edge_time):
+        for callback in self.notaus_callbacks:
+            self._call_notaus_callback(callback, active, edge_time)
+
+    @staticmethod
+    def _call_notaus_callback(callback, active, edge_time):
+        try:
+            callback(active, edge_time)
+        except Exception as e:
+            print(f"❌ Fehler im Notaus-Callback: {e}")
+
+    def _countdown_timeout(self):
+        """
+        Zeit bis zum nächsten Countdown-Schritt (volle Sekunde bzw. Shutdown)
+
+        Returns:
+            float oder None wenn kein Countdown läuft (= unbegrenzt warten)
+        """
+        if not (self.is_active and self.notaus_start_time and not self.shutdown_triggered):
+            return None
+        remaining = self.shutdown_timeout - (time.time() - self.notaus_start_time)
+        if remaining <= 0:
+            return 0
+        fraction = remaining - int(remaining)
+        return fraction if fraction > 0.001 else min(1.0, remaining)
+
+    def _wait_for_change(self, timeout):
+        """
+        Blockiert bis zur nächsten Flanke, zum Timeout oder zum Stop
+
+        Args:
+            timeout: Maximale Wartezeit in Sekunden (None = unbegrenzt)
+        """
+        if not self.edge_events:
+            # Polling-Fallback: 100ms-Intervall wie bisher
+            self.wake_event.wait(0.1 if timeout is None else min(0.1, timeout))
+            self.wake_event.clear()
+            return
+
+        if GPIO_BACKEND == 'gpiod':
+            readable, _, _ = select.select([self.lines.fd, self._wake_read], [], [], timeout)
+            if self.lines.fd in readable:
+                # Events abholen, der Pegel wird danach per read_status() gelesen.
+                # Kernel-Zeitstempel (CLOCK_MONOTONIC) = Zeitpunkt der Flanke
+                events = self.lines.read_edge_events()
+                if events:
+                    self.last_edge_time = events[0].timestamp_ns / 1e9
+            if self._wake_read in readable:
+                os.read(self._wake_read, 64)
+        else:
+            self.wake_event.wait(timeout)
+            self.wake_event.clear()
+
     def _trigger_shutdown(self):
         """Fährt das System herunter"""
         import subprocess
@@ -226,6 +669,9 @@ class GPIOMonitor:
     def stop_monitoring(self):
         """Stoppt Hintergrund-Überwachung"""
         self.monitoring = False
+        # Wartenden Thread aufwecken
+        self.wake_event.set()
+        os.write(self._wake_write, b'x')
         if self.monitor_thread:
             self.monitor_thread.join(timeout=2)
 
@@ -241,12 +687,33 @@ class GPIOMonitor:
                     if hasattr(self, 'chip') and self.chip:
                         self.chip.close()
                 elif GPIO_BACKEND == 'RPi.GPIO':
+                    if self.edge_events:
+                        GPIO.remove_event_detect(self.pin1)
                     GPIO.cleanup([self.pin1, self.pin2])
 
                 print("✅ GPIO-Cleanup durchgeführt")
             except Exception as e:
                 print(f"⚠️ GPIO-Cleanup Fehler: {e}")
 
+        os.close(self._wake_read)
+        os.close(self._wake_write)
+
+        if self.shared_block is not None:
+            # Leser sehen "monitoring: False" statt eines eingefrorenen Zustands
+            self.shared_block.write(self)
+            self.notifier.notify()
+            self.shared_block.close(unlink=True)
+            self.shared_block = None
+        self.notifier.close()
+
+    def publish_status(self):
+        """Veröffentlicht den aktuellen Status, falls er sich geändert hat"""
+        changed = gpio_status_broadcaster.publish(self.get_status())
+        if changed and self.shared_block is not None:
+            self.shared_block.write(self)
+            self.notifier.notify()
+        return changed
+
     def get_status(self):
         """
         Gibt aktuellen Status zurück
@@ -254,32 +721,96 @@ class GPIOMonitor:
         Returns:
             dict: Status-Informationen
         """
-        status = {
-            'active': self.is_active,
-            'pin1': self.pin1,
-            'pin2': self.pin2,
-            'gpio_available': GPIO_AVAILABLE,
-            'gpio_backend': GPIO_BACKEND,
-            'monitoring': self.monitoring,
-            'shutdown_pending': False,
-            'shutdown_in_seconds': None
-        }
-
-        # Shutdown-Timer Info hinzufügen
-        if self.is_active and self.notaus_start_time and not self.shutdown_triggered:
-            elapsed = time.time() - self.notaus_start_time
-            remaining = self.shutdown_timeout - elapsed
-            status['shutdown_pending'] = True
-            status['shutdown_in_seconds'] = int(remaining)
-
-        return status
+        return _build_status(
+            self.is_active, self.pin1, self.pin2, GPIO_AVAILABLE, GPIO_BACKEND, self.monitoring,
+            self.edge_events, self.shutdown_timeout, self.notaus_start_time, self.shutdown_triggered
+        )
 
 
 # Globale Instanz
 gpio_monitor = None
 
+# Leser des gemeinsamen Status-Blocks (Prozesse ohne eigenen Monitor-Thread)
+_shared_reader = None
+# Weiterleitung an den lokalen Broadcaster: Subscription des laufenden Watchers und
+# Anzahl offener Event-Streams in diesem Prozess (der Watcher läuft nur, solange > 0)
+_shared_watcher = None
+_stream_clients = 0
+_shared_lock = threading.Lock()
+
+
+def _owns_monitor():
+    """True wenn in diesem Prozess der Monitor-Thread läuft (nicht in geforkten Workern)"""
+    return gpio_monitor is not None and gpio_monitor.owner_pid == os.getpid()
+
 
-def init_gpio_monitor(pin1=17, pin2=27, shutdown_timeout=120):
+def _read_shared_status():
+    """Liest den Status-Block des Monitor-Prozesses (None wenn nicht vorhanden)"""
+    global _shared_reader
+
+    if _shared_reader is None:
+        _shared_reader = SharedStatusBlock(GPIO_STATUS_FILE)
+    return _shared_reader.read()
+
+
+def _shared_watch_loop(subscription):
+    """
+    Reicht Änderungen des Status-Blocks an den lokalen Broadcaster weiter (Event-Streams).
+    Blockiert zwischen den Änderungen in recv() und endet mit dem letzten Event-Stream.
+    """
+    global _shared_watcher
+
+    while True:
+        result = _read_shared_status()
+        if result is not None:
+            gpio_status_broadcaster.publish(result[1])
+
+        with _shared_lock:
+            if _stream_clients == 0:
+                _shared_watcher = None
+                subscription.close()
+                return
+        try:
+            subscription.wait()
+        except OSError as e:
+            print(f"❌ Fehler beim Warten auf den GPIO-Status: {e}")
+            time.sleep(1)
+
+
+@contextlib.contextmanager
+def gpio_status_stream():
+    """
+    Für die Dauer eines Event-Streams: in Prozessen ohne Monitor-Thread (Gunicorn-Worker)
+    läuft solange ein Watcher, den der Monitor-Prozess bei jeder Änderung weckt
+    """
+    global _shared_watcher, _stream_clients
+
+    if _owns_monitor():
+        yield
+        return
+
+    with _shared_lock:
+        _stream_clients += 1
+        if _shared_watcher is None:
+            try:
+                # Vor dem ersten Lesen anmelden: keine Änderung geht zwischen Lesen und Warten verloren
+                subscription = StatusSubscription(GPIO_NOTIFY_DIR)
+            except OSError as e:
+                print(f"⚠️ GPIO-Status-Benachrichtigung {GPIO_NOTIFY_DIR} nicht verfügbar: {e} - "
+                      f"Event-Streams lesen alle {GPIO_NOTIFY_FALLBACK_INTERVAL} s")
+                subscription = PolledSubscription(GPIO_NOTIFY_FALLBACK_INTERVAL)
+            _shared_watcher = subscription
+            threading.Thread(target=_shared_watch_loop, args=(subscription,), daemon=True).start()
+    try:
+        yield
+    finally:
+        with _shared_lock:
+            _stream_clients -= 1
+            if _stream_clients == 0 and _shared_watcher is not None:
+                _shared_watcher.wake()
+
+
+def init_gpio_monitor(pin1=17, pin2=27, shutdown_timeout=120, debounce_ms=20):
     """
     Initialisiert globalen GPIO-Monitor
 
@@ -287,11 +818,13 @@ def init_gpio_monitor(pin1=17, pin2=27, shutdown_timeout=120):
         pin1: Erster GPIO-Pin (Standard: 17)
         pin2: Zweiter GPIO-Pin (Standard: 27)
         shutdown_timeout: Sekunden bis zum Shutdown (Standard: 120)
+        debounce_ms: Entprellzeit für Flanken-Events in Millisekunden (Standard: 20)
     """
     global gpio_monitor
 
     if gpio_monitor is None:
-        gpio_monitor = GPIOMonitor(pin1=pin1, pin2=pin2, shutdown_timeout=shutdown_timeout)
+        gpio_monitor = GPIOMonitor(pin1=pin1, pin2=pin2, shutdown_timeout=shutdown_timeout,
+                                   debounce_ms=debounce_ms)
 
     return gpio_monitor
 
@@ -303,6 +836,14 @@ def get_gpio_status():
     Returns:
         dict: Status-Informationen
     """
+    if _owns_monitor():
+        return gpio_monitor.get_status()
+
+    # Gunicorn-Worker o.ä.: lock-frei aus dem gemeinsamen Status-Block
+    result = _read_shared_status()
+    if result is not None:
+        return result[1]
+
     if gpio_monitor is None:
         return {
             'active': False,
@@ -315,10 +856,43 @@ def get_gpio_status():
     return gpio_monitor.get_status()
 
 
+def add_notaus_callback(callback):
+    """
+    Registriert callback(active, edge_time) beim GPIO-Monitor dieses Prozesses
+
+    Returns:
+        bool: False wenn kein Monitor initialisiert ist
+    """
+    if not _owns_monitor():
+        return False
+    gpio_monitor.add_notaus_callback(callback)
+    return True
+
+
+def wait_for_gpio_status(last_seq=None, timeout=None):
+    """
+    Wartet auf eine Änderung des GPIO-Status (für Server-Sent Events, innerhalb von
+    gpio_status_stream() - sonst sieht ein Worker-Prozess keine Änderungen)
+
+    Args:
+        last_seq: Zuletzt gesendete Sequenznummer (None = sofort aktuellen Status)
+        timeout: Maximale Wartezeit in Sekunden
+
+    Returns:
+        tuple: (seq, status) - seq == last_seq bei Timeout
+    """
+    seq, status = gpio_status_broadcaster.wait(last_seq, timeout)
+    if status is None:
+        # Monitor (noch) nicht initialisiert
+        status = get_gpio_status()
+    return seq, status
+
+
 def cleanup_gpio():
     """Cleanup-Funktion für GPIO"""
     global gpio_monitor
 
-    if gpio_monitor is not None:
+    # Geforkte Worker dürfen Pins und Status-Block des Monitor-Prozesses nicht freigeben
+    if gpio_monitor is not None and _owns_monitor():
         gpio_monitor.cleanup()
-        gpio_monitor = None
+    gpio_monitor = None
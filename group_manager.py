@@ -1,30 +1,55 @@
 """
 VDE Messwand - Relais-Gruppen und Relais-Namen Verwaltung
 Backend-Funktionen für dynamische Gruppenverwaltung und Benennung
+Änderungen laufen über GroupBatch: Gruppen und Namen werden einmal geladen, Prüfungen
+nutzen einen Rückwärts-Index Relais -> Gruppe, gespeichert wird einmal pro Datei.
 """
-import json
-import os
+import contextlib
+
+import config
 from config import DATABASE_PATH
+from config_store import register_document
+from relay_layout import RELAY_LAYOUT
 
 GROUPS_FILE = 'relay_groups.json'
 RELAY_NAMES_FILE = 'relay_names.json'
 
 
+def _normalize_relay_names(data):
+    """Konvertiert String-Keys zu Integer und normalisiert die Datenstruktur"""
+    result = {}
+    for k, v in data.items():
+        relay_num = int(k)
+        # Unterstütze alte Struktur (nur String) und neue (Objekt)
+        if isinstance(v, str):
+            result[relay_num] = {'name': v, 'category': '', 'stromkreis': ''}
+        elif isinstance(v, dict):
+            result[relay_num] = {
+                'name': v.get('name', ''),
+                'category': v.get('category', ''),
+                'stromkreis': v.get('stromkreis', '')
+            }
+    return result
+
+
+_groups_document = register_document('relay_groups', GROUPS_FILE)
+_relay_names_document = register_document('relay_names', RELAY_NAMES_FILE, normalize=_normalize_relay_names)
+
+# Gruppen/Namen aus config.py, wie beim Import definiert. config.RELAY_GROUPS/RELAY_NAMES
+# werden später mit dem zusammengeführten Stand überschrieben (app.py) und dürfen nicht
+# wieder als Basis dienen - gelöschte Gruppen würden sonst wieder auftauchen.
+_CONFIG_GROUPS = dict(config.RELAY_GROUPS)
+_CONFIG_NAMES = dict(config.RELAY_NAMES)
+
+
 def load_groups_from_file():
     """
-    Lädt Gruppen aus JSON-Datei
+    Lädt Gruppen (aus dem Konfigurations-Speicher, Kopie zum Bearbeiten)
     
     Returns:
         Dictionary mit Gruppen
     """
-    if os.path.exists(GROUPS_FILE):
-        try:
-            with open(GROUPS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading groups: {e}")
-            return {}
-    return {}
+    return _groups_document.copy()
 
 
 def save_groups_to_file(groups):
@@ -37,45 +62,20 @@ def save_groups_to_file(groups):
     Returns:
         True bei Erfolg, False bei Fehler
     """
-    try:
-        with open(GROUPS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(groups, f, indent=2, ensure_ascii=False)
+    if _groups_document.save(groups):
         print(f"✓ Groups saved to {GROUPS_FILE}")
         return True
-    except Exception as e:
-        print(f"Error saving groups: {e}")
-        return False
+    return False
 
 
 def load_relay_names_from_file():
     """
-    Lädt Relais-Namen aus JSON-Datei
+    Lädt Relais-Namen (aus dem Konfigurations-Speicher, Kopie zum Bearbeiten)
 
     Returns:
         Dictionary mit Relais-Daten {relay_num: {name, category, stromkreis}}
     """
-    if os.path.exists(RELAY_NAMES_FILE):
-        try:
-            with open(RELAY_NAMES_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Konvertiere String-Keys zu Integer und normalisiere Datenstruktur
-                result = {}
-                for k, v in data.items():
-                    relay_num = int(k)
-                    # Unterstütze alte Struktur (nur String) und neue (Objekt)
-                    if isinstance(v, str):
-                        result[relay_num] = {'name': v, 'category': '', 'stromkreis': ''}
-                    elif isinstance(v, dict):
-                        result[relay_num] = {
-                            'name': v.get('name', ''),
-                            'category': v.get('category', ''),
-                            'stromkreis': v.get('stromkreis', '')
-                        }
-                return result
-        except Exception as e:
-            print(f"Error loading relay names: {e}")
-            return {}
-    return {}
+    return _relay_names_document.copy()
 
 
 def save_relay_names_to_file(relay_names):
@@ -88,14 +88,10 @@ def save_relay_names_to_file(relay_names):
     Returns:
         True bei Erfolg, False bei Fehler
     """
-    try:
-        with open(RELAY_NAMES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(relay_names, f, indent=2, ensure_ascii=False)
+    if _relay_names_document.save(relay_names):
         print(f"✓ Relay names saved to {RELAY_NAMES_FILE}")
         return True
-    except Exception as e:
-        print(f"Error saving relay names: {e}")
-        return False
+    return False
 
 
 def get_all_relay_names():
@@ -105,62 +101,268 @@ def get_all_relay_names():
     Returns:
         Dictionary mit allen Relais-Namen
     """
-    from config import RELAY_NAMES
-    
     file_names = load_relay_names_from_file()
     
     # Merge: File-Namen haben Vorrang
-    all_names = RELAY_NAMES.copy()
+    all_names = _CONFIG_NAMES.copy()
     all_names.update(file_names)
     
     return all_names
 
 
+def get_all_groups():
+    """
+    Gibt alle definierten Gruppen zurück
+    
+    Returns:
+        Dictionary mit allen Gruppen
+    """
+    file_groups = load_groups_from_file()
+    
+    # Merge: File-Gruppen haben Vorrang
+    all_groups = _CONFIG_GROUPS.copy()
+    all_groups.update(file_groups)
+    
+    return all_groups
+
+
+def _shared_groups():
+    """Wie get_all_groups(), aber ohne Kopie der Gruppen - nur für Prüfungen, nicht verändern"""
+    return {**_CONFIG_GROUPS, **_groups_document.read()}
+
+
+class GroupBatch:
+    """
+    Transaktion über Gruppen und Relais-Namen
+
+    Lädt beide Dateien einmal (in den Dokument-Transaktionen, siehe
+    ConfigDocument.transaction - auch gegenüber anderen Prozessen exklusiv), hält einen Rückwärts-Index
+    Relais -> Gruppen-ID für O(1)-Mitgliedschafts- und Überschneidungsprüfungen, prüft
+    jede Änderung gegen den Stand inklusive der vorherigen Änderungen und schreibt beim
+    commit() jede geänderte Datei genau einmal. Ohne commit() wird nichts gespeichert.
+
+        with GroupBatch() as batch:
+            for relay_num, name in names.items():
+                batch.set_relay_name(relay_num, name)
+            saved = batch.commit()
+    """
+
+    def __init__(self):
+        self.groups = None
+        self.names = None
+        self.relay_to_group = None
+        self.groups_changed = False
+        self.names_changed = False
+        self.finished = False
+
+    def __enter__(self):
+        # Andere Threads und Prozesse warten, bis die Transaktion geschrieben ist
+        self._transactions = contextlib.ExitStack()
+        self._transactions.enter_context(_groups_document.transaction())
+        self._transactions.enter_context(_relay_names_document.transaction())
+        try:
+            # Unter dem flock: neuester Stand der Dateien, kein anderer Prozess schreibt bis zum Ende
+            self.groups = _groups_document.copy()
+            self.names = _relay_names_document.copy()
+            self.relay_to_group = {}
+            for group_id, group_data in self.all_groups().items():
+                for relay in group_data['relays']:
+                    self.relay_to_group[relay] = group_id
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None and not self.finished:
+                self.commit()
+        finally:
+            self.finished = True
+            self._release()
+        return False
+
+    def _release(self):
+        self._transactions.close()
+
+    def all_groups(self):
+        """Gruppen aus config.py und Datei mit allen Änderungen der Transaktion (nicht verändern)"""
+        return {**_CONFIG_GROUPS, **self.groups}
+
+    def group_of(self, relay_num):
+        """Gruppen-ID des Relais oder None"""
+        return self.relay_to_group.get(relay_num)
+
+    def rollback(self):
+        """Verwirft alle Änderungen"""
+        self.finished = True
+
+    def commit(self):
+        """
+        Schreibt die geänderten Dateien (je ein save)
+
+        Die Dateien sind seit __enter__ gesperrt (auch für andere Prozesse), der geladene
+        Stand ist also noch aktuell - Änderungen anderer Worker gehen nicht verloren, sie
+        laufen vorher oder danach.
+
+        Returns:
+            True bei Erfolg (auch ohne Änderungen), False bei Fehler
+        """
+        self.finished = True
+        success = True
+        if self.groups_changed:
+            success = save_groups_to_file(self.groups) and success
+        if self.names_changed:
+            success = save_relay_names_to_file(self.names) and success
+        return success
+
+    def _validate_relays(self, group_id, relays):
+        """
+        Prüft die Relais-Liste einer Gruppe
+
+        Returns:
+            None wenn gültig, sonst Fehlermeldung
+        """
+        if not isinstance(relays, list) or len(relays) < 2:
+            return "Eine Gruppe muss mindestens 2 Relais enthalten"
+
+        for relay in relays:
+            if not isinstance(relay, int) or not RELAY_LAYOUT.is_valid(relay):
+                return f"Ungültige Relais-Nummer: {relay}"
+
+        # Überschneidungen mit anderen Gruppen über den Rückwärts-Index
+        overlaps = {}
+        for relay in relays:
+            owner = self.relay_to_group.get(relay)
+            if owner is not None and owner != group_id:
+                overlaps.setdefault(owner, set()).add(relay)
+        if overlaps:
+            owner, overlap = next(iter(overlaps.items()))
+            return f"Relais {overlap} sind bereits in Gruppe '{self.all_groups()[owner]['name']}'"
+        return None
+
+    def _store_group(self, group_id, name, relays, description, category, stromkreis):
+        """Übernimmt die Gruppe und aktualisiert den Rückwärts-Index"""
+        old = self.all_groups().get(group_id)
+        if old is not None:
+            for relay in old['relays']:
+                if self.relay_to_group.get(relay) == group_id:
+                    del self.relay_to_group[relay]
+        self.groups[group_id] = {
+            'name': name,
+            'relays': sorted(relays),
+            'description': description,
+            'category': category,
+            'stromkreis': stromkreis
+        }
+        for relay in relays:
+            self.relay_to_group[relay] = group_id
+        self.groups_changed = True
+
+    def add_group(self, group_id, name, relays, description='', category='', stromkreis=''):
+        """Wie add_group(), aber innerhalb der Transaktion - (success, message)"""
+        if not group_id or not name or not relays:
+            return False, "Gruppe-ID, Name und Relais müssen angegeben werden"
+
+        error = self._validate_relays(group_id, relays)
+        if error:
+            return False, error
+
+        self._store_group(group_id, name, relays, description, category, stromkreis)
+        return True, f"Gruppe '{name}' erfolgreich erstellt"
+
+    def update_group(self, group_id, name, relays, description='', category='', stromkreis=''):
+        """Wie update_group(), aber innerhalb der Transaktion - (success, message)"""
+        if group_id not in self.groups:
+            # Prüfe ob in config.py definiert
+            if group_id in _CONFIG_GROUPS:
+                return False, "Gruppen aus config.py können nicht bearbeitet werden"
+            return False, "Gruppe nicht gefunden"
+
+        error = self._validate_relays(group_id, relays)
+        if error:
+            return False, error
+
+        self._store_group(group_id, name, relays, description, category, stromkreis)
+        return True, f"Gruppe '{name}' erfolgreich aktualisiert"
+
+    def delete_group(self, group_id):
+        """Wie delete_group(), aber innerhalb der Transaktion - (success, message)"""
+        if group_id not in self.groups:
+            if group_id in _CONFIG_GROUPS:
+                return False, "Gruppen aus config.py können nicht gelöscht werden"
+            return False, "Gruppe nicht gefunden"
+
+        group_data = self.groups.pop(group_id)
+        for relay in group_data['relays']:
+            if self.relay_to_group.get(relay) == group_id:
+                del self.relay_to_group[relay]
+        self.groups_changed = True
+        return True, f"Gruppe '{group_data['name']}' erfolgreich gelöscht"
+
+    def set_relay_name(self, relay_num, name, category='', stromkreis=''):
+        """
+        Setzt oder löscht den Namen eines Relais innerhalb der Transaktion
+
+        Returns:
+            (success, message, changed)
+        """
+        if not RELAY_LAYOUT.is_valid(relay_num):
+            return False, f"Ungültige Relais-Nummer: {relay_num}", False
+
+        # Prüfe ob Relais in Gruppe ist
+        group_id = self.relay_to_group.get(relay_num)
+        if group_id is not None:
+            return False, (f"Relais {relay_num} ist Teil der Gruppe '{self.all_groups()[group_id]['name']}'. "
+                           f"Gruppen können nicht einzeln benannt werden."), False
+
+        if name and name.strip():
+            self.names[relay_num] = {
+                'name': name.strip(),
+                'category': category,
+                'stromkreis': stromkreis
+            }
+            self.names_changed = True
+            return True, f"Relais {relay_num} wurde benannt als '{name}'", True
+
+        # Name löschen
+        if relay_num in self.names:
+            del self.names[relay_num]
+            self.names_changed = True
+            return True, f"Name für Relais {relay_num} wurde gelöscht", True
+        return True, "Kein Name gesetzt", False
+
+
+def _run_batch(operation, *args):
+    """Führt eine GroupBatch-Methode als eigene Transaktion aus - (success, message)"""
+    with GroupBatch() as batch:
+        success, message = getattr(batch, operation)(*args)[:2]
+        if not success:
+            batch.rollback()
+            return success, message
+        if not batch.commit():
+            return False, "Fehler beim Speichern"
+        return success, message
+
+
 def set_relay_name(relay_num, name):
     """
     Setzt oder ändert den Namen eines Relais
     
     Args:
-        relay_num: Relais-Nummer (0-63)
+        relay_num: Relais-Nummer (siehe relay_layout)
         name: Neuer Name (leer = löschen)
         
     Returns:
         (success, message)
     """
-    if not 0 <= relay_num <= 63:
-        return False, f"Ungültige Relais-Nummer: {relay_num}"
-    
-    # Prüfe ob Relais in Gruppe ist
-    groups = get_all_groups()
-    for group_data in groups.values():
-        if relay_num in group_data['relays']:
-            return False, f"Relais {relay_num} ist Teil der Gruppe '{group_data['name']}'. Gruppen können nicht einzeln benannt werden."
-    
-    relay_names = load_relay_names_from_file()
-    
-    if name and name.strip():
-        relay_names[relay_num] = name.strip()
-        success = save_relay_names_to_file(relay_names)
-        if success:
-            return True, f"Relais {relay_num} wurde benannt als '{name}'"
-        else:
-            return False, "Fehler beim Speichern"
-    else:
-        # Name löschen
-        if relay_num in relay_names:
-            del relay_names[relay_num]
-            success = save_relay_names_to_file(relay_names)
-            if success:
-                return True, f"Name für Relais {relay_num} wurde gelöscht"
-            else:
-                return False, "Fehler beim Speichern"
-        else:
-            return True, "Kein Name gesetzt"
+    return _run_batch('set_relay_name', relay_num, name)
 
 
 def bulk_set_relay_names(relay_data_dict):
     """
     Setzt mehrere Relais-Namen mit Kategorien auf einmal
+    (eine Transaktion: einmal laden, einmal schreiben)
 
     Args:
         relay_data_dict: Dictionary {relay_num: {name, category, stromkreis}, ...}
@@ -168,79 +370,46 @@ def bulk_set_relay_names(relay_data_dict):
     Returns:
         (success, message, failed_relays)
     """
-    relay_names = load_relay_names_from_file()
     failed = []
     success_count = 0
 
-    for relay_num, data in relay_data_dict.items():
-        try:
-            relay_num = int(relay_num)
-            if not 0 <= relay_num <= 63:
-                failed.append((relay_num, "Ungültige Nummer"))
-                continue
-
-            # Prüfe Gruppe
-            groups = get_all_groups()
-            is_grouped = False
-            for group_data in groups.values():
-                if relay_num in group_data['relays']:
-                    is_grouped = True
-                    break
-
-            if is_grouped:
-                failed.append((relay_num, "Teil einer Gruppe"))
-                continue
-
-            # Extrahiere Daten (unterstütze auch alte Struktur mit nur String)
-            if isinstance(data, str):
-                name = data
-                category = ''
-                stromkreis = ''
-            else:
-                name = data.get('name', '')
-                category = data.get('category', '')
-                stromkreis = data.get('stromkreis', '')
-
-            if name and name.strip():
-                relay_names[relay_num] = {
-                    'name': name.strip(),
-                    'category': category,
-                    'stromkreis': stromkreis
-                }
-                success_count += 1
-            elif relay_num in relay_names:
-                del relay_names[relay_num]
-                success_count += 1
-
-        except Exception as e:
-            failed.append((relay_num, str(e)))
-
-    if success_count > 0:
-        if save_relay_names_to_file(relay_names):
+    with GroupBatch() as batch:
+        for relay_num, data in relay_data_dict.items():
+            try:
+                relay_num = int(relay_num)
+                if not RELAY_LAYOUT.is_valid(relay_num):
+                    failed.append((relay_num, "Ungültige Nummer"))
+                    continue
+
+                # Prüfe Gruppe (Rückwärts-Index)
+                if batch.group_of(relay_num) is not None:
+                    failed.append((relay_num, "Teil einer Gruppe"))
+                    continue
+
+                # Extrahiere Daten (unterstütze auch alte Struktur mit nur String)
+                if isinstance(data, str):
+                    name = data
+                    category = ''
+                    stromkreis = ''
+                else:
+                    name = data.get('name', '')
+                    category = data.get('category', '')
+                    stromkreis = data.get('stromkreis', '')
+
+                success, message, changed = batch.set_relay_name(relay_num, name, category, stromkreis)
+                if changed:
+                    success_count += 1
+
+            except Exception as e:
+                failed.append((relay_num, str(e)))
+
+        if success_count == 0:
+            batch.rollback()
+            return False, "Keine Änderungen", failed
+
+        if batch.commit():
             return True, f"{success_count} Relais benannt", failed
-        else:
-            return False, "Fehler beim Speichern", failed
-
-    return False, "Keine Änderungen", failed
-
-
-def get_all_groups():
-    """
-    Gibt alle definierten Gruppen zurück
-    
-    Returns:
-        Dictionary mit allen Gruppen
-    """
-    # Kombiniere Gruppen aus config.py und JSON-Datei
-    from config import RELAY_GROUPS
-    
-    file_groups = load_groups_from_file()
-    
-    # Merge: File-Gruppen haben Vorrang
-    all_groups = RELAY_GROUPS.copy()
-    all_groups.update(file_groups)
-    
-    return all_groups
+        return False, "Fehler beim Speichern", failed
 
 
 def add_group(group_id, name, relays, description='', category='', stromkreis=''):
@@ -258,44 +427,7 @@ def add_group(group_id, name, relays, description='', category='', stromkreis=''
     Returns:
         (success, message)
     """
-    if not group_id or not name or not relays:
-        return False, "Gruppe-ID, Name und Relais müssen angegeben werden"
-
-    if not isinstance(relays, list) or len(relays) < 2:
-        return False, "Eine Gruppe muss mindestens 2 Relais enthalten"
-
-    # Prüfe ob Relais-Nummern gültig sind
-    for relay in relays:
-        if not isinstance(relay, int) or relay < 0 or relay > 63:
-            return False, f"Ungültige Relais-Nummer: {relay}"
-
-    # Prüfe auf Überschneidungen mit existierenden Gruppen
-    existing_groups = get_all_groups()
-    for existing_id, existing_data in existing_groups.items():
-        if existing_id == group_id:
-            continue  # Bei Update ignorieren
-
-        overlap = set(relays) & set(existing_data['relays'])
-        if overlap:
-            return False, f"Relais {overlap} sind bereits in Gruppe '{existing_data['name']}'"
-
-    # Lade bestehende File-Gruppen
-    groups = load_groups_from_file()
-
-    # Füge neue Gruppe hinzu
-    groups[group_id] = {
-        'name': name,
-        'relays': sorted(relays),
-        'description': description,
-        'category': category,
-        'stromkreis': stromkreis
-    }
-
-    # Speichern
-    if save_groups_to_file(groups):
-        return True, f"Gruppe '{name}' erfolgreich erstellt"
-    else:
-        return False, "Fehler beim Speichern"
+    return _run_batch('add_group', group_id, name, relays, description, category, stromkreis)
 
 
 def update_group(group_id, name, relays, description='', category='', stromkreis=''):
@@ -313,46 +445,7 @@ def update_group(group_id, name, relays, description='', category='', stromkreis
     Returns:
         (success, message)
     """
-    groups = load_groups_from_file()
-
-    if group_id not in groups:
-        # Prüfe ob in config.py definiert
-        from config import RELAY_GROUPS
-        if group_id in RELAY_GROUPS:
-            return False, "Gruppen aus config.py können nicht bearbeitet werden"
-        return False, "Gruppe nicht gefunden"
-
-    # Validierung wie bei add_group
-    if not isinstance(relays, list) or len(relays) < 2:
-        return False, "Eine Gruppe muss mindestens 2 Relais enthalten"
-
-    for relay in relays:
-        if not isinstance(relay, int) or relay < 0 or relay > 63:
-            return False, f"Ungültige Relais-Nummer: {relay}"
-
-    # Prüfe Überschneidungen (außer mit sich selbst)
-    all_groups = get_all_groups()
-    for existing_id, existing_data in all_groups.items():
-        if existing_id == group_id:
-            continue
-
-        overlap = set(relays) & set(existing_data['relays'])
-        if overlap:
-            return False, f"Relais {overlap} sind bereits in Gruppe '{existing_data['name']}'"
-
-    # Update
-    groups[group_id] = {
-        'name': name,
-        'relays': sorted(relays),
-        'description': description,
-        'category': category,
-        'stromkreis': stromkreis
-    }
-
-    if save_groups_to_file(groups):
-        return True, f"Gruppe '{name}' erfolgreich aktualisiert"
-    else:
-        return False, "Fehler beim Speichern"
+    return _run_batch('update_group', group_id, name, relays, description, category, stromkreis)
 
 
 def delete_group(group_id):
@@ -365,21 +458,7 @@ def delete_group(group_id):
     Returns:
         (success, message)
     """
-    groups = load_groups_from_file()
-    
-    if group_id not in groups:
-        from config import RELAY_GROUPS
-        if group_id in RELAY_GROUPS:
-            return False, "Gruppen aus config.py können nicht gelöscht werden"
-        return False, "Gruppe nicht gefunden"
-    
-    group_name = groups[group_id]['name']
-    del groups[group_id]
-    
-    if save_groups_to_file(groups):
-        return True, f"Gruppe '{group_name}' erfolgreich gelöscht"
-    else:
-        return False, "Fehler beim Speichern"
+    return _run_batch('delete_group', group_id)
 
 
 def get_available_relays():
@@ -389,10 +468,10 @@ def get_available_relays():
     Returns:
         Set von Relais-Nummern
     """
-    all_relays = set(range(64))
+    all_relays = set(RELAY_LAYOUT.relays())
     grouped_relays = set()
     
-    groups = get_all_groups()
+    groups = _shared_groups()
     for group_data in groups.values():
         grouped_relays.update(group_data['relays'])
     
@@ -415,7 +494,7 @@ def get_group_statistics():
     return {
         'total_groups': len(groups),
         'total_grouped_relays': len(grouped_relays),
-        'available_relays': 64 - len(grouped_relays),
+        'available_relays': RELAY_LAYOUT.relay_count - len(grouped_relays),
         'groups': groups
     }
 
@@ -436,7 +515,7 @@ def get_relays_by_category(category):
     }
 
     # Einzelne Relais mit dieser Kategorie
-    relay_names = load_relay_names_from_file()
+    relay_names = _relay_names_document.read()
     for relay_num, data in relay_names.items():
         if data.get('category') == category:
             result['relays'].append({
@@ -446,13 +525,13 @@ def get_relays_by_category(category):
             })
 
     # Gruppen mit dieser Kategorie
-    groups = get_all_groups()
+    groups = _shared_groups()
     for group_id, group_data in groups.items():
         if group_data.get('category') == category:
             result['groups'].append({
                 'group_id': group_id,
                 'name': group_data['name'],
-                'relays': group_data['relays'],
+                'relays': list(group_data['relays']),
                 'stromkreis': group_data.get('stromkreis', '')
             })
 
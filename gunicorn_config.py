@@ -9,7 +9,11 @@ backlog = 2048
 
 # Worker Processes
 workers = 4
-worker_class = 'sync'
+# Threads statt sync: offene Event-Streams (/api/gpio/stream) blockieren sonst ganze Worker.
+# Der GPIO-Monitor läuft nur im Master (on_starting); Worker mit offenem Stream werden von
+# ihm über GPIO_NOTIFY_DIR geweckt (gpio_monitor.gpio_status_stream)
+worker_class = 'gthread'
+threads = 16
 worker_connections = 1000
 timeout = 300
 keepalive = 2
@@ -35,10 +39,16 @@ def on_starting(server):
     from app import initialize_app
     initialize_app(skip_gpio_check=True)
 
-    print("✅ GPIO-Monitor im Master-Prozess initialisiert")
+    print("✅ GPIO-Monitor und Relais-Daemon im Master-Prozess initialisiert")
     print("   Worker-Prozesse werden jetzt gestartet...")
 
 
+def worker_exit(server, worker):
+    """Hook: Worker beendet sich - gesammelte Konfigurationsänderungen noch schreiben"""
+    from config_store import flush_config
+    flush_config()
+
+
 def on_exit(server):
     """Hook: Wird beim Beenden des Master-Prozesses aufgerufen"""
     print("🛑 Gunicorn Master-Prozess wird beendet...")
@@ -47,4 +57,8 @@ def on_exit(server):
     from app import cleanup_gpio
     cleanup_gpio()
 
+    # Relais-Daemon (Bus-Owner) beenden
+    from relay_daemon import stop_relay_daemon
+    stop_relay_daemon()
+
     print("✅ Cleanup abgeschlossen")
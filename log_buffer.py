@@ -0,0 +1,125 @@
+"""
+VDE Messwand - Logging mit Ringpuffer
+Alle Module loggen über get_logger(__name__) unterhalb von 'vde'. Jeder Eintrag
+(auch Frame-Traces auf DEBUG) wird in einen Ringpuffer fester Größe gehängt; formatiert
+wird erst beim Abruf. Auf stdout (und damit journald) geht nur ab LOG_CONSOLE_LEVEL.
+"""
+import collections
+import logging
+import sys
+import threading
+
+from config import LOG_BUFFER_SIZE, LOG_CONSOLE_LEVEL
+
+ROOT_LOGGER = 'vde'
+
+_setup_lock = threading.Lock()
+_ring_handler = None
+
+
+class RingBufferHandler(logging.Handler):
+    """Hält die letzten capacity LogRecords im Speicher (ohne Formatierung beim Loggen)"""
+
+    def __init__(self, capacity):
+        super().__init__(logging.DEBUG)
+        self.records = collections.deque(maxlen=capacity)
+
+    def handle(self, record):
+        # deque.append ist threadsicher - kein Handler-Lock und keine Filter im Hot-Path
+        self.records.append(record)
+        return True
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def dump(self, limit=200, level=logging.DEBUG, logger=None):
+        """
+        Letzte Einträge als Liste von Dictionaries (älteste zuerst)
+
+        Args:
+            limit: Maximale Anzahl Einträge
+            level: Mindest-Level (Zahl oder Name wie 'WARNING')
+            logger: Nur Logger mit diesem Namenspräfix (z.B. 'vde.modbus_controller')
+        """
+        level = _level_number(level, logging.DEBUG)
+
+        entries = []
+        for record in reversed(list(self.records)):
+            if record.levelno < level:
+                continue
+            if logger and not record.name.startswith(logger):
+                continue
+            entries.append(_record_to_dict(record))
+            if len(entries) >= limit:
+                break
+        entries.reverse()
+        return entries
+
+    def clear(self):
+        self.records.clear()
+
+
+def _level_number(level, default):
+    """Level-Name ('warning') oder Zahl -> Zahl, unbekannte Namen -> default"""
+    if isinstance(level, int):
+        return level
+    number = logging.getLevelName(str(level).upper())
+    return number if isinstance(number, int) else default
+
+
+def _record_to_dict(record):
+    try:
+        message = record.getMessage()
+    except Exception as e:
+        message = f'{record.msg!r} (Formatierungsfehler: {e})'
+    if record.exc_info:
+        message += '\n' + logging.Formatter().formatException(record.exc_info)
+    return {
+        'time': record.created,
+        'level': record.levelname,
+        'logger': record.name,
+        'thread': record.threadName,
+        'message': message,
+    }
+
+
+def setup_logging():
+    """Richtet Ringpuffer und Konsolen-Handler für 'vde' einmal pro Prozess ein"""
+    global _ring_handler
+
+    with _setup_lock:
+        if _ring_handler is not None:
+            return _ring_handler
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(logging.DEBUG)
+        # Nicht zusätzlich an den Root-Logger (Flask/Werkzeug) weiterreichen
+        root.propagate = False
+
+        _ring_handler = RingBufferHandler(LOG_BUFFER_SIZE)
+        root.addHandler(_ring_handler)
+
+        console = logging.StreamHandler(sys.stdout)
+        console.setLevel(_level_number(LOG_CONSOLE_LEVEL, logging.WARNING))
+        console.setFormatter(logging.Formatter('%(message)s'))
+        root.addHandler(console)
+        return _ring_handler
+
+
+def get_logger(name):
+    """
+    Logger für ein Modul (z.B. get_logger(__name__) -> 'vde.modbus_controller')
+    """
+    setup_logging()
+    if name == '__main__':
+        name = sys.argv[0].rsplit('/', 1)[-1].removesuffix('.py') if sys.argv and sys.argv[0] else 'main'
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+
+def dump_log(limit=200, level='DEBUG', logger=None):
+    """Einträge aus dem Ringpuffer dieses Prozesses (siehe RingBufferHandler.dump)"""
+    return setup_logging().dump(limit, level, logger)
+
+
+def clear_log():
+    setup_logging().clear()
@@ -1,29 +1,179 @@
 """
 VDE Messwand - Modbus RTU Controller
 """
+import os
+import select
 import struct
+import threading
 import time
 from serial_handler import serial, SERIAL_AVAILABLE
+from config import MODBUS_TURNAROUND_TIMEOUT, SIMULATOR_PORT_PREFIX
+from bus_metrics import BusMetrics
+from retry_policy import create_retry_policy
+from log_buffer import get_logger
+
+log = get_logger(__name__)
+
+# Länge einer Exception-Antwort: Slave, FC|0x80, Exception-Code, CRC (2)
+EXCEPTION_RESPONSE_LENGTH = 5
+
+# Modbus-Broadcast-Adresse (alle Slaves führen aus, keiner antwortet)
+BROADCAST_ADDRESS = 0
+
+# Maximale Länge eines RTU-Frames (ADU) - Größe des Empfangspuffers
+MAX_ADU_LENGTH = 256
+
+# Schreibende Funktionscodes - im Notaus-Zustand gesperrt
+WRITE_FUNCTION_CODES = (0x05, 0x0F)
+
+
+def _build_crc16_table():
+    """256-Einträge-Tabelle für CRC-16 Modbus (Polynom 0xA001, reflektiert)"""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 0x0001 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _build_crc16_table()
+
+
+def crc16(data):
+    """
+    CRC-16 Modbus über Tabelle (ein Lookup pro Byte statt 8 Bit-Schritte)
+
+    Args:
+        data: bytes/bytearray/memoryview
+
+    Returns:
+        CRC als Integer (Low-Byte wird zuerst gesendet)
+    """
+    crc = 0xFFFF
+    table = CRC16_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+class ModbusTiming:
+    """
+    Aus der Baudrate abgeleitete Modbus-RTU-Zeiten (statt fester Sleeps)
+
+    Ein Zeichen besteht bei 8N2 aus 11 Bit (Start, 8 Daten, 2 Stop).
+    Oberhalb von 19200 Baud gelten laut Spezifikation feste Werte.
+    """
+
+    BITS_PER_CHAR = 11
+
+    def __init__(self, baudrate, turnaround=MODBUS_TURNAROUND_TIMEOUT):
+        """
+        Args:
+            baudrate: Baudrate des Busses
+            turnaround: Maximale Bearbeitungszeit des Slaves in Sekunden
+        """
+        self.baudrate = baudrate
+        self.turnaround = turnaround
+        self.char_time = self.BITS_PER_CHAR / baudrate
+
+        if baudrate > 19200:
+            self.t1_5 = 0.00075
+            self.t3_5 = 0.00175
+        else:
+            self.t1_5 = 1.5 * self.char_time
+            self.t3_5 = 3.5 * self.char_time
+
+    def frame_time(self, num_bytes):
+        """Übertragungsdauer eines Frames auf der Leitung"""
+        return num_bytes * self.char_time
+
+    def response_timeout(self, tx_bytes, rx_bytes, turnaround=None):
+        """
+        Spätester Zeitpunkt (relativ zum Sendebeginn), bis zu dem die Antwort
+        vollständig sein muss: TX + Stille + Bearbeitung + RX
+
+        Args:
+            turnaround: Bearbeitungszeit des Slaves (None = Standardwert)
+        """
+        if turnaround is None:
+            turnaround = self.turnaround
+        return self.frame_time(tx_bytes) + self.t3_5 + turnaround + self.frame_time(rx_bytes)
+
+    @staticmethod
+    def expected_response_length(function_code, num_coils=0):
+        """
+        Erwartete Antwortlänge pro Funktionscode
+
+        Args:
+            function_code: Modbus-Funktionscode
+            num_coils: Anzahl gelesener Coils (nur FC01)
+
+        Returns:
+            Anzahl Bytes inkl. CRC
+        """
+        if function_code == 0x01:
+            return 5 + (num_coils + 7) // 8
+        # FC05 und FC15 antworten mit 8 Bytes (Echo bzw. Adresse + Anzahl)
+        return 8
+
+
+class ReceiveBuffer(threading.local):
+    """
+    Vorab angelegter Empfangspuffer, einer pro Thread (Worker, Bus-Worker, Notaus).
+    Antworten werden als memoryview ausgewertet - pro Transaktion entsteht kein neues
+    bytearray, CRC und Coil-Bytes lesen ohne Kopie. Von einer echten Schnittstelle liest
+    os.readv() direkt in den Puffer; readinto() von pyserial, Simulator und Dummy ruft
+    intern read() auf und kopiert das Ergebnis.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray(MAX_ADU_LENGTH)
+        self.view = memoryview(self.buffer)
 
 
 class ModbusRTU:
     """Modbus RTU Kommunikation mit CRC-Prüfung und Retry-Logik"""
     
-    def __init__(self, port, baudrate=9600, timeout=1.0):
+    def __init__(self, port, baudrate=9600, timeout=1.0, retry_policy=None):
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
         self.serial_conn = None
         self.last_command_time = 0
-        # Erhöhtes Intervall für stabilere Bus-Kommunikation (100ms)
-        self.min_command_interval = 0.1
+        self.timing = ModbusTiming(baudrate)
+        # Minimale Busruhe zwischen zwei Frames (t3.5)
+        self.min_command_interval = self.timing.t3_5
+        # Fertige Frames inkl. CRC: {(slave_id, coil, state): bytes} bzw. {(slave_id, start, count): bytes}
+        self.fc05_frames = {}
+        self.fc01_frames = {}
+        # Alle-AUS-FC15-Frames für den Notaus: {slave_id: bytes} (Slave 0 = Broadcast)
+        self.emergency_frames = {}
+        # Exklusiver Buszugriff pro Transaktion (Notaus darf zwischen zwei Transaktionen drängeln)
+        self.bus_lock = threading.Lock()
+        # Gesetzt = Notaus aktiv: Schreibbefehle werden abgewiesen, Retry-Pausen abgebrochen
+        self.emergency = threading.Event()
+        # Zähler und Latenz-Histogramme pro Slave/Funktionscode
+        self.metrics = BusMetrics()
+        # Versuche, Timeouts, Pausen und Circuit Breaker pro Slave (siehe retry_policy.py)
+        self.retry_policy = retry_policy or create_retry_policy()
+        # Round-Trip-Zeit der letzten Transaktion (Senden bis Antwort gelesen) in Sekunden
+        self.last_rtt = 0.0
+        # Empfangspuffer pro Thread; eine Antwort bleibt gültig bis zur nächsten Transaktion im selben Thread
+        self.rx = ReceiveBuffer()
         self.connect()
 
     def connect(self):
         """Verbindung zur seriellen Schnittstelle herstellen"""
         global SERIAL_AVAILABLE
         try:
-            if SERIAL_AVAILABLE and hasattr(serial, 'Serial'):
+            if self.port.startswith(SIMULATOR_PORT_PREFIX):
+                from modbus_simulator import open_simulated_serial
+                self.serial_conn = open_simulated_serial(self.port, self.baudrate, self.timeout)
+                log.info(f"🧪 Simulierter Modbus-Bus {self.port}")
+                return True
+            elif SERIAL_AVAILABLE and hasattr(serial, 'Serial'):
                 self.serial_conn = serial.Serial(
                     port=self.port,
                     baudrate=self.baudrate,
@@ -31,13 +181,12 @@ class ModbusRTU:
                     parity=serial.PARITY_NONE,
                     stopbits=serial.STOPBITS_TWO,
                     timeout=self.timeout,
-                    write_timeout=self.timeout,
-                    inter_byte_timeout=0.1
+                    write_timeout=self.timeout
                 )
                 time.sleep(0.1)
                 self.serial_conn.reset_input_buffer()
                 self.serial_conn.reset_output_buffer()
-                print(f"✅ Real Modbus RTU connected on {self.port}")
+                log.info(f"✅ Real Modbus RTU connected on {self.port}")
                 return True
             else:
                 self.serial_conn = serial.Serial(
@@ -45,124 +194,327 @@ class ModbusRTU:
                     baudrate=self.baudrate,
                     timeout=self.timeout
                 )
-                print(f"🔧 Dummy Modbus RTU mode on {self.port}")
+                log.warning(f"🔧 Dummy Modbus RTU mode on {self.port}")
                 return True
         except Exception as e:
-            print(f"❌ Error connecting to Modbus RTU: {e}")
+            log.error(f"❌ Error connecting to Modbus RTU: {e}")
             try:
                 self.serial_conn = serial.Serial()
-                print("🔧 Fallback to dummy mode")
+                log.warning("🔧 Fallback to dummy mode")
                 return True
             except:
-                print("❌ Complete serial failure")
+                log.critical("❌ Complete serial failure")
                 return False
 
     def calculate_crc16(self, data):
         """CRC-16 Modbus Berechnung"""
-        crc = 0xFFFF
-        for byte in data:
-            crc ^= byte
-            for _ in range(8):
-                crc = (crc >> 1) ^ 0xA001 if crc & 0x0001 else crc >> 1
-        return struct.pack('<H', crc)
+        return struct.pack('<H', crc16(data))
+
+    def build_frame(self, slave_id, function_code, start_addr, data):
+        """Baut einen Frame inkl. CRC"""
+        frame = struct.pack('>BBH', slave_id, function_code, start_addr) + data
+        return frame + self.calculate_crc16(frame)
+
+    def prebuild_frames(self, modules):
+        """
+        Erzeugt alle FC05-EIN/AUS-Frames und den FC01-Lese-Frame pro Modul im Voraus,
+        damit Befehle im laufenden Betrieb nur noch ein Dictionary-Lookup sind
+
+        Args:
+            modules: Liste von (slave_id, num_coils)
+        """
+        for slave_id, num_coils in modules:
+            for coil in range(num_coils):
+                self._fc05_frame(slave_id, coil, True)
+                self._fc05_frame(slave_id, coil, False)
+            self._fc01_frame(slave_id, 0, num_coils)
+            # Notaus: alle Coils des Moduls AUS
+            self.emergency_frames[slave_id] = self._all_off_frame(slave_id, num_coils)
+
+        # Broadcast nur bei gleich großen Modulen - ein Frame muss für alle passen
+        coil_counts = {num_coils for slave_id, num_coils in modules}
+        if len(coil_counts) == 1:
+            self.emergency_frames[BROADCAST_ADDRESS] = self._all_off_frame(BROADCAST_ADDRESS, coil_counts.pop())
+
+    def _all_off_frame(self, slave_id, num_coils):
+        """FC15-Frame, der alle num_coils Coils ab Adresse 0 ausschaltet"""
+        byte_count = (num_coils + 7) // 8
+        data = struct.pack('>HB', num_coils, byte_count) + bytes(byte_count)
+        return self.build_frame(slave_id, 0x0F, 0, data)
+
+    def _fc05_frame(self, slave_id, coil_addr, state):
+        """FC05-Frame aus dem Cache (wird bei Bedarf erzeugt)"""
+        key = (slave_id, coil_addr, bool(state))
+        frame = self.fc05_frames.get(key)
+        if frame is None:
+            frame = self.build_frame(slave_id, 0x05, coil_addr, b'\xff\x00' if state else b'\x00\x00')
+            self.fc05_frames[key] = frame
+        return frame
+
+    def _fc01_frame(self, slave_id, start_addr, num_coils):
+        """FC01-Frame aus dem Cache (wird bei Bedarf erzeugt)"""
+        key = (slave_id, start_addr, num_coils)
+        frame = self.fc01_frames.get(key)
+        if frame is None:
+            frame = self.build_frame(slave_id, 0x01, start_addr, struct.pack('>H', num_coils))
+            self.fc01_frames[key] = frame
+        return frame
 
     def wait_for_command_interval(self):
-        """Wartezeit zwischen Befehlen einhalten"""
-        elapsed = time.time() - self.last_command_time
+        """Busruhe t3.5 seit dem Ende der letzten Antwort einhalten"""
+        elapsed = time.monotonic() - self.last_command_time
         if elapsed < self.min_command_interval:
             time.sleep(self.min_command_interval - elapsed)
-        self.last_command_time = time.time()
 
-    def send_command(self, slave_id, function_code, start_addr, data, retry_count=3):
+    def _prepare_read(self, timeout):
+        """
+        Einmal pro Transaktion: Dateideskriptor der Schnittstelle für select(), ohne
+        Deskriptor (Simulator, Dummy) stattdessen das Lese-Timeout des Transports setzen
+
+        Returns:
+            Dateideskriptor oder None
+        """
+        conn = self.serial_conn
+        try:
+            return conn.fileno()
+        except Exception:
+            # Kein fileno() (Simulator, Dummy) oder Schnittstelle nicht offen
+            pass
+        if conn.timeout != timeout:
+            conn.timeout = timeout
+        return None
+
+    def _read_into(self, view, start, end, deadline, fd=None):
+        """
+        Liest Bytes nach view[start:end] bis end erreicht oder die Deadline abgelaufen ist
+        (kein Polling von in_waiting)
+
+        Mit fd wartet select() bis zur Deadline und os.readv() liest vom Deskriptor direkt
+        in view (ohne Zwischen-bytes): Serial.timeout bleibt unverändert, jede Zuweisung wäre
+        bei pyserial ein tcgetattr/tcsetattr. Ohne fd liest der Transport mit dem Timeout aus
+        _prepare_read (readinto() dort kopiert aus read()).
+
+        Returns:
+            Neue Füllstandsposition (ggf. < end bei Timeout)
+        """
+        position = start
+        if fd is not None:
+            while position < end:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                    break
+                count = os.readv(fd, [view[position:end]])
+                if not count:
+                    # Lesbar ohne Daten: Adapter abgezogen (pyserial meldet das ebenso als Fehler)
+                    raise OSError(f"{self.port}: Schnittstelle meldet Daten, liefert aber keine")
+                position += count
+            return position
+
+        conn = self.serial_conn
+        readinto = getattr(conn, 'readinto', None)
+        while position < end and time.monotonic() < deadline:
+            if readinto is not None:
+                position += readinto(view[position:end]) or 0
+            else:
+                chunk = conn.read(end - position)
+                if chunk:
+                    view[position:position + len(chunk)] = chunk
+                    position += len(chunk)
+        return position
+
+    def _transaction(self, frame, expected_length, turnaround=None):
+        """
+        Sendet einen Frame und liest die erwartete Antwortlänge mit Deadline
+
+        Args:
+            frame: Kompletter Frame inkl. CRC
+            expected_length: Erwartete Länge der regulären Antwort
+            turnaround: Bearbeitungszeit des Slaves für die Deadline (None = Standardwert)
+
+        Returns:
+            Antwort als memoryview auf den Empfangspuffer des Threads (ggf. unvollständig
+            oder Exception-Antwort), gültig bis zur nächsten Transaktion im selben Thread;
+            None, wenn ein Schreibbefehl wegen Notaus nicht gesendet wurde
+        """
+        view = self.rx.view
+        with self.bus_lock:
+            # Erneut unter dem Bus-Lock prüfen: ein Notaus zwischen der Prüfung in _request
+            # und dem Lock darf nicht mehr von diesem Schreibbefehl überschrieben werden
+            if frame[1] in WRITE_FUNCTION_CODES and self.emergency.is_set():
+                return None
+
+            if not self.serial_conn or not self.serial_conn.is_open:
+                self.connect()
+
+            self.wait_for_command_interval()
+            self.serial_conn.reset_input_buffer()
+
+            tx_start = time.monotonic()
+            bytes_written = self.serial_conn.write(frame)
+            if bytes_written != len(frame):
+                log.warning(f"Only {bytes_written} of {len(frame)} bytes written")
+            self.serial_conn.flush()
+
+            timeout = min(self.timing.response_timeout(len(frame), expected_length, turnaround), self.timeout)
+            deadline = time.monotonic() + timeout
+            fd = self._prepare_read(timeout)
+
+            # Erst Slave-ID + Funktionscode: Exception-Antworten sind kürzer
+            length = self._read_into(view, 0, 2, deadline, fd)
+            if length == 2:
+                total_length = EXCEPTION_RESPONSE_LENGTH if view[1] & 0x80 else expected_length
+                length = self._read_into(view, 2, total_length, deadline, fd)
+
+            self.last_command_time = time.monotonic()
+            self.last_rtt = self.last_command_time - tx_start
+            return view[:length]
+
+    def send_command(self, slave_id, function_code, start_addr, data, retry_count=None):
         """Modbus-Befehl senden mit Retry-Logik"""
+        frame = self.build_frame(slave_id, function_code, start_addr, data)
+        return self.send_frame(frame, retry_count)
+
+    def send_frame(self, frame, retry_count=None):
+        """
+        Fertigen Frame (inkl. CRC) senden mit Retry-Logik
+
+        Args:
+            frame: Kompletter Frame inkl. CRC
+            retry_count: Versuche (None = laut Retry-Strategie)
+
+        Returns:
+            True bei gültiger Antwort
+        """
+        expected_length = ModbusTiming.expected_response_length(frame[1])
+        return self._request(frame, expected_length, retry_count) is not None
+
+    def _request(self, frame, expected_length, retry_count=None):
+        """
+        Eine Anfrage mit Versuchen, Timeouts und Pausen laut Retry-Strategie
+
+        Returns:
+            Gültige Antwort (memoryview, siehe _transaction) oder None (Fehler, Slave gesperrt oder Notaus)
+        """
+        slave_id = frame[0]
+        function_code = frame[1]
+        metrics = self.metrics
+        policy = self.retry_policy
+
+        if function_code in WRITE_FUNCTION_CODES and self.emergency.is_set():
+            log.info(f"⛔ Notaus aktiv - Schreibbefehl an Slave {slave_id} verworfen")
+            return None
+
+        if not policy.allow_request(slave_id):
+            # Circuit Breaker: Modul gilt als nicht erreichbar, sofort abbrechen statt Timeouts abzuwarten
+            log.debug(f"⏭️ Slave {slave_id} gesperrt - Anfrage {frame.hex()} sofort abgelehnt")
+            metrics.record_rejected(slave_id, function_code)
+            return None
+
+        if retry_count is None:
+            retry_count = policy.attempts(slave_id)
+
         for attempt in range(retry_count):
+            if function_code in WRITE_FUNCTION_CODES and self.emergency.is_set():
+                # Abbruch durch Notaus sagt nichts über den Slave aus - nicht als Fehler werten
+                log.info(f"⛔ Notaus aktiv - Schreibbefehl an Slave {slave_id} verworfen")
+                policy.abort_request(slave_id)
+                return None
+            attempt_start = time.monotonic()
             try:
-                if not self.serial_conn or not self.serial_conn.is_open:
-                    self.connect()
-                
-                self.wait_for_command_interval()
-                self.serial_conn.reset_input_buffer()
-                self.serial_conn.reset_output_buffer()
-                
-                # Frame zusammenbauen
-                frame = struct.pack('>BBH', slave_id, function_code, start_addr) + data
-                frame += self.calculate_crc16(frame)
-                
-                print(f"TX (Attempt {attempt + 1}): {frame.hex()}")
-                
-                # Senden
-                bytes_written = self.serial_conn.write(frame)
-                if bytes_written != len(frame):
-                    print(f"Warning: Only {bytes_written} of {len(frame)} bytes written")
-                
-                self.serial_conn.flush()
-                # Längere Wartezeit für Antwort (50ms statt 20ms)
-                time.sleep(0.05)
-
-                # Antwort empfangen
-                response = bytearray()
-                start_time = time.time()
-                
-                while len(response) < 8:
-                    if time.time() - start_time > self.timeout:
-                        print(f"Timeout waiting for response (got {len(response)} bytes)")
-                        break
-                    if self.serial_conn.in_waiting > 0:
-                        response.extend(self.serial_conn.read(self.serial_conn.in_waiting))
-                        time.sleep(0.01)
-                    else:
-                        time.sleep(0.01)
-                
-                print(f"RX (Attempt {attempt + 1}): {response.hex()} ({len(response)} bytes)")
-                
-                # CRC prüfen
-                if len(response) >= 5:
-                    received_crc = response[-2:]
-                    calculated_crc = self.calculate_crc16(response[:-2])
-                    if received_crc == calculated_crc:
-                        print(f"✅ Command successful on attempt {attempt + 1}")
-                        return True
-                    else:
-                        print(f"❌ CRC mismatch - Expected: {calculated_crc.hex()}, Got: {received_crc.hex()}")
-                        if attempt < retry_count - 1:
-                            time.sleep(0.15 * (attempt + 1))  # Längere Wartezeit zwischen Retries
-                            continue
+                log.debug("TX (Attempt %d): %s", attempt + 1, frame.hex())
+                response = self._transaction(frame, expected_length, policy.turnaround(slave_id))
+                if response is None:
+                    log.info(f"⛔ Notaus aktiv - Schreibbefehl an Slave {slave_id} verworfen")
+                    policy.abort_request(slave_id)
+                    return None
+                log.debug("RX (Attempt %d): %s (%d bytes)", attempt + 1, response.hex(), len(response))
+
+                outcome = self._classify_response(response, slave_id, function_code)
+                metrics.record_attempt(slave_id, function_code, attempt, outcome,
+                                       self.last_rtt, len(frame), len(response))
+                # Exception-Antwort: Slave ist erreichbar, nur die Anfrage war ungültig
+                policy.record_attempt(slave_id, outcome in ('ok', 'exception'))
+
+                if outcome == 'ok':
+                    log.debug("✅ Command successful on attempt %d", attempt + 1)
+                    policy.record_request(slave_id, True)
+                    return response
+                if outcome == 'exception':
+                    # Slave hat eindeutig abgelehnt - Wiederholen bringt nichts
+                    log.warning(f"❌ Modbus exception code {response[2]} from slave {slave_id}")
+                    metrics.record_failure(slave_id, function_code)
+                    policy.record_request(slave_id, True)
+                    return None
+                if outcome == 'crc_error':
+                    log.info(f"❌ CRC mismatch - Expected: {crc16(response[:-2]):04x}, "
+                             f"Got: {response[-2] | (response[-1] << 8):04x}")
+                elif outcome == 'wrong_slave':
+                    log.info(f"❌ Wrong slave ID/function - Expected: {slave_id}/{function_code:02x}, "
+                             f"Got: {response[:2].hex()}")
                 else:
-                    print(f"❌ Incomplete response")
-                    if attempt < retry_count - 1:
-                        time.sleep(0.15 * (attempt + 1))  # Längere Wartezeit zwischen Retries
-                        continue
-            
+                    log.info(f"❌ Incomplete response from slave {slave_id} ({len(response)} bytes)")
+
             except Exception as e:
-                print(f"Modbus error (attempt {attempt + 1}): {e}")
-                if attempt < retry_count - 1:
-                    time.sleep(0.1 * (attempt + 1))
-                    continue
-        
-        print(f"❌ Command failed after {retry_count} attempts")
-        return False
+                log.info(f"Modbus error (attempt {attempt + 1}): {e}")
+                metrics.record_attempt(slave_id, function_code, attempt, 'error',
+                                       time.monotonic() - attempt_start, len(frame), 0)
+                policy.record_attempt(slave_id, False)
+
+            if attempt < retry_count - 1:
+                # Pause laut Strategie (wächst mit der Fehlerrate, Notaus bricht sie ab)
+                self.emergency.wait(policy.backoff(slave_id, attempt))
+
+        log.error(f"❌ Command {frame.hex()} failed after {retry_count} attempts")
+        metrics.record_failure(slave_id, function_code)
+        policy.record_request(slave_id, False)
+        return None
+
+    @staticmethod
+    def _classify_response(response, slave_id, function_code):
+        """
+        Bewertet eine Antwort für Auswertung und Metriken
+
+        Returns:
+            'ok', 'timeout' (unvollständig), 'crc_error', 'wrong_slave' (falscher Slave
+            oder Funktionscode) oder 'exception'
+        """
+        if len(response) < EXCEPTION_RESPONSE_LENGTH:
+            return 'timeout'
+        if crc16(response[:-2]) != (response[-2] | (response[-1] << 8)):
+            return 'crc_error'
+        if response[0] != slave_id:
+            return 'wrong_slave'
+        if response[1] == function_code | 0x80:
+            return 'exception'
+        if response[1] != function_code:
+            return 'wrong_slave'
+        return 'ok'
 
     def write_single_coil(self, slave_id, coil_addr, state):
         """Einzelnes Relais schalten (FC05)"""
-        value = 0xFF00 if state else 0x0000
-        data = struct.pack('>H', value)
-        return self.send_command(slave_id, 0x05, coil_addr, data)
+        return self.send_frame(self._fc05_frame(slave_id, coil_addr, state))
 
     def write_multiple_coils(self, slave_id, start_addr, states):
         """Mehrere Relais gleichzeitig schalten (FC15)"""
-        num_coils = len(states)
-        byte_count = (num_coils + 7) // 8
+        mask = 0
+        for coil_index, state in enumerate(states):
+            if state:
+                mask |= 1 << coil_index
+        return self.write_coil_mask(slave_id, start_addr, len(states), mask)
 
-        coil_bytes = []
-        for i in range(byte_count):
-            byte_val = 0
-            for bit in range(8):
-                coil_index = i * 8 + bit
-                if coil_index < num_coils and states[coil_index]:
-                    byte_val |= (1 << bit)
-            coil_bytes.append(byte_val)
+    def write_coil_mask(self, slave_id, start_addr, num_coils, mask):
+        """
+        Mehrere Relais gleichzeitig schalten (FC15) aus einer Bitmaske
 
-        data = struct.pack('>HB', num_coils, byte_count) + bytes(coil_bytes)
+        Args:
+            slave_id: Modbus Slave ID
+            start_addr: Start-Adresse
+            num_coils: Anzahl Coils
+            mask: Bit n = Coil start_addr + n
+        """
+        byte_count = (num_coils + 7) // 8
+        # FC15 überträgt Coil 0 im niedrigsten Bit des ersten Bytes = Little Endian
+        data = struct.pack('>HB', num_coils, byte_count) + mask.to_bytes(byte_count, 'little')
         return self.send_command(slave_id, 0x0F, start_addr, data)
 
     def read_coils(self, slave_id, start_addr, num_coils):
@@ -177,87 +529,108 @@ class ModbusRTU:
         Returns:
             Liste mit Boolean-Werten oder None bei Fehler
         """
-        try:
-            if not self.serial_conn or not self.serial_conn.is_open:
-                self.connect()
+        mask = self.read_coil_mask(slave_id, start_addr, num_coils)
+        if mask is None:
+            return None
+        return [bool((mask >> coil) & 1) for coil in range(num_coils)]
 
-            self.wait_for_command_interval()
-            self.serial_conn.reset_input_buffer()
-            self.serial_conn.reset_output_buffer()
+    def read_coil_mask(self, slave_id, start_addr, num_coils):
+        """
+        Liest Coil-Status (FC01) als Bitmaske
 
-            # Modbus FC01 (Read Coils) Frame erstellen
-            frame = struct.pack('>BBHH', slave_id, 0x01, start_addr, num_coils)
-            frame += self.calculate_crc16(frame)
+        Returns:
+            Integer (Bit n = Coil start_addr + n) oder None bei Fehler
+        """
+        # Modbus FC01 (Read Coils) Frame aus dem Cache
+        frame = self._fc01_frame(slave_id, start_addr, num_coils)
+        expected_length = ModbusTiming.expected_response_length(0x01, num_coils)
 
-            # Senden
-            bytes_written = self.serial_conn.write(frame)
-            if bytes_written != len(frame):
-                print(f"Warning: Only {bytes_written} of {len(frame)} bytes written")
+        response = self._request(frame, expected_length)
+        if response is None:
+            return None
 
-            self.serial_conn.flush()
-            time.sleep(0.05)
+        # Coil-Bytes direkt aus dem Empfangspuffer als Bitmaske (Coil 0 = niedrigstes Bit des ersten Bytes)
+        byte_count = response[2]
+        mask = int.from_bytes(response[3:3 + byte_count], 'little')
+        return mask & ((1 << num_coils) - 1)
 
-            # Antwort lesen
-            response = bytearray()
-            start_time = time.time()
-            min_response_size = 5
+    def send_emergency_off(self, slave_ids, broadcast=False):
+        """
+        Notaus-Schnellpfad: schaltet alle Coils mit vorgefertigten FC15-Frames aus.
+        Sperrt danach alle Schreibbefehle bis release_emergency(). Es gibt keine Retries
+        und keine Pausen außer der vorgeschriebenen Busruhe t3.5. Eine laufende Transaktion
+        wird noch beendet, bevor der Bus übernommen wird.
 
-            while len(response) < min_response_size:
-                if time.time() - start_time > self.timeout:
-                    print(f"Timeout - nur {len(response)} bytes empfangen")
-                    return None
+        Args:
+            slave_ids: Slave-IDs der Module
+            broadcast: True = ein Broadcast-Frame an alle Module (ohne Antwort);
+                       bei unterschiedlich großen Modulen wird pro Modul gesendet
 
-                if self.serial_conn.in_waiting > 0:
-                    response.extend(self.serial_conn.read(self.serial_conn.in_waiting))
-                    time.sleep(0.01)
-                else:
-                    time.sleep(0.01)
+        Returns:
+            (success, first_tx_time, done_time) - Zeiten in time.monotonic()
+        """
+        # Zuerst sperren: wartende Retries brechen ab, neue Schreibbefehle werden verworfen
+        self.emergency.set()
 
-            if len(response) < min_response_size:
-                print(f"Antwort zu kurz: {len(response)} bytes")
-                return None
+        if broadcast and BROADCAST_ADDRESS in self.emergency_frames:
+            frames = [(BROADCAST_ADDRESS, self.emergency_frames[BROADCAST_ADDRESS])]
+        else:
+            frames = [(slave_id, self.emergency_frames[slave_id]) for slave_id in slave_ids]
 
-            # Validierung
-            if response[0] != slave_id:
-                print(f"Falsche Slave ID: erwartet {slave_id}, bekommen {response[0]}")
-                return None
+        success = True
+        first_tx_time = None
 
-            if response[1] != 0x01:
-                if response[1] == 0x81:
-                    error_code = response[2] if len(response) > 2 else 0
-                    print(f"Modbus Fehler: Code {error_code}")
-                return None
+        with self.bus_lock:
+            if not self.serial_conn or not self.serial_conn.is_open:
+                self.connect()
 
-            # CRC prüfen
-            received_crc = response[-2:]
-            calculated_crc = self.calculate_crc16(response[:-2])
+            for slave_id, frame in frames:
+                tx_start = time.monotonic()
+                try:
+                    self.wait_for_command_interval()
+                    self.serial_conn.reset_input_buffer()
+                    tx_start = time.monotonic()
+                    self.serial_conn.write(frame)
+                    self.serial_conn.flush()
+                    if first_tx_time is None:
+                        first_tx_time = time.monotonic()
 
-            if received_crc != calculated_crc:
-                print(f"CRC Fehler")
-                return None
+                    response = b''
+                    outcome = 'ok'
+                    if slave_id != BROADCAST_ADDRESS:
+                        # Echo abwarten, sonst kollidiert der nächste Frame mit der Antwort
+                        expected_length = ModbusTiming.expected_response_length(0x0F)
+                        timeout = self.timing.response_timeout(len(frame), expected_length)
+                        deadline = time.monotonic() + timeout
+                        fd = self._prepare_read(timeout)
+                        view = self.rx.view
+                        response = view[:self._read_into(view, 0, expected_length, deadline, fd)]
+                        outcome = self._classify_response(response, slave_id, 0x0F)
+                        if outcome != 'ok':
+                            log.error(f"❌ Notaus: keine gültige Antwort von Slave {slave_id}")
+                            success = False
 
-            # Daten extrahieren
-            byte_count = response[2]
-            coil_data = response[3:3+byte_count]
+                    self.last_command_time = time.monotonic()
+                    self.metrics.record_attempt(slave_id, 0x0F, 0, outcome, self.last_command_time - tx_start,
+                                                len(frame), len(response))
 
-            # Bits in Boolean-Liste umwandeln
-            coils = []
-            for byte_idx, byte_val in enumerate(coil_data):
-                for bit_idx in range(8):
-                    if len(coils) < num_coils:
-                        coils.append(bool(byte_val & (1 << bit_idx)))
+                except Exception as e:
+                    log.error(f"❌ Notaus: Fehler beim Senden an Slave {slave_id}: {e}")
+                    self.metrics.record_attempt(slave_id, 0x0F, 0, 'error', time.monotonic() - tx_start,
+                                                len(frame), 0)
+                    success = False
 
-            return coils[:num_coils]
+        return success, first_tx_time, time.monotonic()
 
-        except Exception as e:
-            print(f"Fehler beim Lesen: {e}")
-            return None
+    def release_emergency(self):
+        """Hebt die Schreibsperre nach dem Notaus wieder auf"""
+        self.emergency.clear()
 
     def close(self):
         """Verbindung schließen"""
         try:
             if self.serial_conn and self.serial_conn.is_open:
                 self.serial_conn.close()
-                print("Serial connection closed")
+                log.info("Serial connection closed")
         except Exception as e:
-            print(f"Error closing connection: {e}")
+            log.error(f"Error closing connection: {e}")
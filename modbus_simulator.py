@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+VDE Messwand - Modbus RTU Slave-Simulator
+Virtuelle Relais-Module für Benchmarks und Tests ohne Hardware. Implementiert FC01, FC05
+und FC15 mit CRC-Prüfung, Exception-Antworten und Broadcast, sendet mit der Zeichenzeit
+der eingestellten Baudrate und kann Fehler einstreuen (falsche CRC, fehlende Bytes,
+keine Antwort, langsame Antworten).
+
+Zwei Transportwege:
+- In-Process: Als Schnittstelle 'sim://<name>' angeben (VDE_SERIAL_PORT oder 'port' in
+  MODBUS_MODULES), ModbusRTU verbindet sich dann mit einem SimulatedSerial statt pyserial.
+  Fehler als Parameter, z.B. 'sim://bus1?crc=0.01&drop=0.01&slow=0.05&slow_delay=0.3&seed=1'
+- pty: Eigenständiger Prozess mit virtueller Schnittstelle (für den kompletten Stack inkl. pyserial)
+      python3 modbus_simulator.py --slaves 1,2 --crc 0.01    -> gibt VDE_SERIAL_PORT=/dev/pts/N aus
+      VDE_SERIAL_PORT=/dev/pts/N python3 app.py
+"""
+import argparse
+import collections
+import os
+import random
+import select
+import struct
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from modbus_controller import crc16, ModbusTiming, BROADCAST_ADDRESS
+from config import SIMULATOR_PORT_PREFIX
+from log_buffer import get_logger
+
+log = get_logger(__name__)
+
+# Modbus-Exception-Codes
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+
+# Bearbeitungszeit eines simulierten Moduls zwischen Anfrage und Antwort (Sekunden)
+DEFAULT_TURNAROUND = 0.005
+
+# Registrierte In-Process-Simulatoren {port: ModbusSlaveSimulator}
+_simulators = {}
+_simulators_lock = threading.Lock()
+
+
+class FaultConfig:
+    """Wahrscheinlichkeiten (0.0 - 1.0) für eingestreute Fehler pro Antwort"""
+
+    def __init__(self, crc=0.0, drop=0.0, silent=0.0, slow=0.0, slow_delay=0.3,
+                 turnaround=DEFAULT_TURNAROUND, seed=None):
+        """
+        Args:
+            crc: Antwort mit verfälschtem Byte (CRC passt nicht mehr)
+            drop: Antwort bricht nach einem zufälligen Byte ab
+            silent: Slave antwortet gar nicht
+            slow: Antwort kommt um slow_delay Sekunden verspätet
+            slow_delay: Zusätzliche Verzögerung langsamer Antworten
+            turnaround: Normale Bearbeitungszeit des Slaves
+            seed: Startwert des Zufallsgenerators (reproduzierbare Läufe)
+        """
+        self.crc = crc
+        self.drop = drop
+        self.silent = silent
+        self.slow = slow
+        self.slow_delay = slow_delay
+        self.turnaround = turnaround
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_query(cls, query):
+        """FaultConfig aus einem Query-String wie 'crc=0.01&slow=0.05&seed=1'"""
+        params = {key: values[-1] for key, values in parse_qs(query).items()}
+        kwargs = {}
+        for key in ('crc', 'drop', 'silent', 'slow', 'slow_delay', 'turnaround'):
+            if key in params:
+                kwargs[key] = float(params[key])
+        if 'seed' in params:
+            kwargs['seed'] = int(params['seed'])
+        return cls(**kwargs)
+
+    def to_dict(self):
+        return {
+            'crc': self.crc,
+            'drop': self.drop,
+            'silent': self.silent,
+            'slow': self.slow,
+            'slow_delay': self.slow_delay,
+            'turnaround': self.turnaround,
+        }
+
+
+class SimulatedModule:
+    """Ein Relais-Modul mit num_coils Coils (Bitmaske, Bit n = Coil n)"""
+
+    def __init__(self, slave_id, num_coils=32):
+        self.slave_id = slave_id
+        self.num_coils = num_coils
+        self.coils = 0
+
+    def read(self, start, count):
+        return (self.coils >> start) & ((1 << count) - 1)
+
+    def write(self, start, count, bits):
+        field = ((1 << count) - 1) << start
+        self.coils = (self.coils & ~field) | ((bits << start) & field)
+
+
+class ModbusSlaveSimulator:
+    """Alle Slaves an einem simulierten Bus"""
+
+    def __init__(self, modules, baudrate=9600, faults=None):
+        """
+        Args:
+            modules: Liste von (slave_id, num_coils)
+            baudrate: Baudrate für die Zeichenzeit
+            faults: FaultConfig (None = fehlerfrei)
+        """
+        self.modules = {slave_id: SimulatedModule(slave_id, num_coils) for slave_id, num_coils in modules}
+        self.timing = ModbusTiming(baudrate)
+        self.faults = faults or FaultConfig()
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def coils(self, slave_id):
+        """Aktueller Coil-Zustand eines Moduls als Bitmaske"""
+        return self.modules[slave_id].coils
+
+    @staticmethod
+    def request_length(buffer):
+        """
+        Länge der Anfrage am Anfang von buffer
+
+        Returns:
+            Anzahl Bytes, None = noch unvollständig, 0 = unbekannter Funktionscode
+        """
+        if len(buffer) < 2:
+            return None
+        function_code = buffer[1]
+        if function_code in (0x01, 0x05):
+            return 8
+        if function_code == 0x0F:
+            return 9 + buffer[6] if len(buffer) >= 7 else None
+        return 0
+
+    def process(self, frame):
+        """
+        Verarbeitet eine komplette Anfrage
+
+        Returns:
+            (response, delay) - Antwort-Bytes inkl. CRC oder None (keine Antwort) und
+            Bearbeitungszeit in Sekunden bis zum ersten Antwort-Byte
+        """
+        with self.lock:
+            self.stats['requests'] += 1
+            if len(frame) < 4 or crc16(frame[:-2]) != (frame[-2] | (frame[-1] << 8)):
+                # Echte Slaves verwerfen gestörte Frames kommentarlos
+                self.stats['bad_requests'] += 1
+                return None, 0.0
+
+            slave_id = frame[0]
+            if slave_id == BROADCAST_ADDRESS:
+                if frame[1] in (0x05, 0x0F):
+                    for module in self.modules.values():
+                        self._execute(module, frame)
+                self.stats['broadcasts'] += 1
+                return None, 0.0
+
+            module = self.modules.get(slave_id)
+            if module is None:
+                self.stats['unknown_slave'] += 1
+                return None, 0.0
+
+            body = self._execute(module, frame)
+            response = bytearray(body)
+            response += struct.pack('<H', crc16(response))
+            return self._inject_faults(response)
+
+    def _execute(self, module, frame):
+        """Führt die Anfrage aus und liefert die Antwort ohne CRC"""
+        slave_id, function_code = frame[0], frame[1]
+
+        def exception(code):
+            self.stats['exceptions'] += 1
+            return bytes((slave_id, function_code | 0x80, code))
+
+        if function_code == 0x01:
+            start, count = struct.unpack('>HH', frame[2:6])
+            if count == 0 or count > 2000:
+                return exception(ILLEGAL_DATA_VALUE)
+            if start + count > module.num_coils:
+                return exception(ILLEGAL_DATA_ADDRESS)
+            byte_count = (count + 7) // 8
+            bits = module.read(start, count)
+            return bytes((slave_id, 0x01, byte_count)) + bits.to_bytes(byte_count, 'little')
+
+        if function_code == 0x05:
+            coil, value = struct.unpack('>HH', frame[2:6])
+            if value not in (0xFF00, 0x0000):
+                return exception(ILLEGAL_DATA_VALUE)
+            if coil >= module.num_coils:
+                return exception(ILLEGAL_DATA_ADDRESS)
+            module.write(coil, 1, 1 if value == 0xFF00 else 0)
+            return bytes(frame[:6])
+
+        if function_code == 0x0F:
+            start, count = struct.unpack('>HH', frame[2:6])
+            byte_count = frame[6]
+            if count == 0 or byte_count != (count + 7) // 8 or len(frame) != 9 + byte_count:
+                return exception(ILLEGAL_DATA_VALUE)
+            if start + count > module.num_coils:
+                return exception(ILLEGAL_DATA_ADDRESS)
+            module.write(start, count, int.from_bytes(frame[7:7 + byte_count], 'little'))
+            return bytes(frame[:6])
+
+        return exception(ILLEGAL_FUNCTION)
+
+    def _inject_faults(self, response):
+        faults = self.faults
+        rng = faults.random
+        delay = faults.turnaround
+
+        if faults.silent and rng.random() < faults.silent:
+            self.stats['silent'] += 1
+            return None, 0.0
+        if faults.crc and rng.random() < faults.crc:
+            self.stats['crc'] += 1
+            response[rng.randrange(len(response))] ^= 1 << rng.randrange(8)
+        if faults.drop and rng.random() < faults.drop:
+            self.stats['drop'] += 1
+            response = response[:rng.randrange(1, len(response))]
+        if faults.slow and rng.random() < faults.slow:
+            self.stats['slow'] += 1
+            delay += faults.slow_delay
+
+        self.stats['responses'] += 1
+        return bytes(response), delay
+
+
+class SimulatedSerial:
+    """
+    In-Process-Transport mit der Schnittstelle von serial.Serial (soweit von ModbusRTU genutzt).
+    Antwort-Bytes werden erst lesbar, wenn sie auf einer echten Leitung angekommen wären:
+    Anfrage senden + Bearbeitungszeit + eine Zeichenzeit pro Antwort-Byte.
+    """
+
+    def __init__(self, simulator, port='sim://', timeout=None):
+        self.simulator = simulator
+        self.port = port
+        self.timeout = timeout
+        self.is_open = True
+        self.char_time = simulator.timing.char_time
+        self.tx_buffer = bytearray()
+        # Zeitpunkt, an dem das zuletzt geschriebene Byte auf der Leitung fertig ist
+        self.tx_done = 0.0
+        # Noch nicht angekommene Antwort: (Ankunftszeit erstes Byte, Bytes)
+        self.pending = collections.deque()
+        self.rx_buffer = bytearray()
+
+    def write(self, data):
+        now = time.monotonic()
+        self.tx_done = max(now, self.tx_done) + len(data) * self.char_time
+        self.tx_buffer.extend(data)
+
+        while self.tx_buffer:
+            length = ModbusSlaveSimulator.request_length(self.tx_buffer)
+            if length is None or length > len(self.tx_buffer):
+                break
+            if length == 0:
+                # Unbekannter Funktionscode: Rest verwerfen (Busruhe trennt die Frames)
+                length = len(self.tx_buffer)
+            frame = bytes(self.tx_buffer[:length])
+            del self.tx_buffer[:length]
+            response, delay = self.simulator.process(frame)
+            if response:
+                self.pending.append((self.tx_done + delay + self.char_time, response))
+        return len(data)
+
+    def flush(self):
+        # Wie pyserial: zurück, wenn alles gesendet ist
+        remaining = self.tx_done - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _collect(self, now):
+        """Übernimmt alle bis now angekommenen Bytes; liefert die Ankunftszeit des nächsten Bytes"""
+        while self.pending:
+            first_byte_time, response = self.pending[0]
+            arrived = min(len(response), int((now - first_byte_time) / self.char_time) + 1) if now >= first_byte_time else 0
+            if arrived:
+                self.rx_buffer.extend(response[:arrived])
+            if arrived < len(response):
+                self.pending[0] = (first_byte_time + arrived * self.char_time, response[arrived:])
+                return self.pending[0][0]
+            self.pending.popleft()
+        return None
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            now = time.monotonic()
+            next_byte = self._collect(now)
+            if len(self.rx_buffer) >= size or next_byte is None:
+                if len(self.rx_buffer) >= size or deadline is None or now >= deadline:
+                    break
+                # Nichts mehr unterwegs: wie eine stille Leitung bis zum Timeout warten
+                time.sleep(deadline - now)
+                continue
+            if deadline is not None and now >= deadline:
+                break
+            wake = next_byte if deadline is None else min(next_byte, deadline)
+            time.sleep(max(0.0, wake - now))
+        data = bytes(self.rx_buffer[:size])
+        del self.rx_buffer[:size]
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        self._collect(time.monotonic())
+        return len(self.rx_buffer)
+
+    def reset_input_buffer(self):
+        self._collect(time.monotonic())
+        self.rx_buffer.clear()
+
+    def reset_output_buffer(self):
+        self.tx_buffer.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+class PtySimulator:
+    """Simulator hinter einem pty-Paar: die Slave-Seite ist eine normale serielle Schnittstelle"""
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.master_fd = None
+        self.slave_fd = None
+        self.device = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """
+        Returns:
+            Gerätename der virtuellen Schnittstelle (z.B. /dev/pts/3)
+        """
+        import pty
+        import tty
+
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.master_fd)
+        tty.setraw(self.slave_fd)
+        self.device = os.ttyname(self.slave_fd)
+        self.thread = threading.Thread(target=self._serve, name='modbus-sim', daemon=True)
+        self.thread.start()
+        return self.device
+
+    def _serve(self):
+        timing = self.simulator.timing
+        # Busruhe, nach der ein unvollständiger Frame verworfen wird (pty liefert ohne echte Pausen)
+        frame_gap = max(timing.t3_5, 0.05)
+        buffer = bytearray()
+
+        while not self.stop_event.is_set():
+            readable, _, _ = select.select([self.master_fd], [], [], frame_gap if buffer else 0.5)
+            if not readable:
+                buffer.clear()
+                continue
+            try:
+                buffer.extend(os.read(self.master_fd, 256))
+            except OSError:
+                break
+
+            while buffer:
+                length = ModbusSlaveSimulator.request_length(buffer)
+                if length is None or length > len(buffer):
+                    break
+                if length == 0:
+                    buffer.clear()
+                    break
+                frame = bytes(buffer[:length])
+                del buffer[:length]
+                response, delay = self.simulator.process(frame)
+                if response:
+                    # Anfrage war schon auf der Leitung; Bearbeitungszeit + Sendedauer der Antwort
+                    time.sleep(delay + len(response) * timing.char_time)
+                    os.write(self.master_fd, response)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+
+def _modules_for_port(port):
+    """(slave_id, num_coils) der Module an port laut Relais-Layout, sonst alle Module"""
+    from relay_layout import RELAY_LAYOUT
+
+    modules = RELAY_LAYOUT.buses.get(port) or RELAY_LAYOUT.modules
+    return [(module.slave_id, module.num_coils) for module in modules]
+
+
+def get_simulator(port, baudrate=9600):
+    """
+    Simulator für eine Schnittstelle (einmal pro Prozess angelegt, danach derselbe).
+    Bei 'sim://name?crc=...' werden die Fehler-Parameter aus dem Query-String übernommen.
+    """
+    with _simulators_lock:
+        simulator = _simulators.get(port)
+        if simulator is None:
+            faults = FaultConfig.from_query(urlsplit(port).query) if port.startswith(SIMULATOR_PORT_PREFIX) else None
+            simulator = _simulators[port] = ModbusSlaveSimulator(_modules_for_port(port), baudrate, faults)
+            log.info(f"🧪 Modbus-Simulator für {port}: Slaves {sorted(simulator.modules)}, {baudrate} Baud")
+        return simulator
+
+
+def open_simulated_serial(port, baudrate=9600, timeout=None):
+    """serial.Serial-Ersatz, der mit dem Simulator für port verbunden ist"""
+    return SimulatedSerial(get_simulator(port, baudrate), port, timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Modbus RTU Relais-Modul-Simulator (pty)')
+    parser.add_argument('--slaves', default='1,2', help='Slave-IDs, kommagetrennt')
+    parser.add_argument('--coils', type=int, default=32, help='Coils pro Modul')
+    parser.add_argument('--baud', type=int, default=9600, help='Baudrate für die Zeichenzeit')
+    parser.add_argument('--turnaround', type=float, default=DEFAULT_TURNAROUND, help='Bearbeitungszeit (s)')
+    parser.add_argument('--crc', type=float, default=0.0, help='Anteil Antworten mit falscher CRC')
+    parser.add_argument('--drop', type=float, default=0.0, help='Anteil abgeschnittener Antworten')
+    parser.add_argument('--silent', type=float, default=0.0, help='Anteil fehlender Antworten')
+    parser.add_argument('--slow', type=float, default=0.0, help='Anteil verspäteter Antworten')
+    parser.add_argument('--slow-delay', type=float, default=0.3, help='Verspätung (s)')
+    parser.add_argument('--seed', type=int, default=None, help='Zufalls-Startwert')
+    args = parser.parse_args()
+
+    faults = FaultConfig(args.crc, args.drop, args.silent, args.slow, args.slow_delay, args.turnaround, args.seed)
+    modules = [(int(slave_id), args.coils) for slave_id in args.slaves.split(',')]
+    simulator = ModbusSlaveSimulator(modules, args.baud, faults)
+    pty_simulator = PtySimulator(simulator)
+
+    # Als Zuweisung ausgegeben, damit Skripte die Zeile direkt übernehmen können
+    print(f"VDE_SERIAL_PORT={pty_simulator.start()}", flush=True)
+    print(f"🧪 Slaves {[slave_id for slave_id, _ in modules]} à {args.coils} Coils, {args.baud} Baud, "
+          f"Fehler {faults.to_dict()}", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pty_simulator.stop()
+        print(f"Statistik: {dict(simulator.stats)}")
+
+
+if __name__ == '__main__':
+    main()
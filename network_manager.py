@@ -2,10 +2,10 @@
 Netzwerk-Manager für WiFi-Hotspot (Access Point) Mode
 """
 import subprocess
-import os
-import json
 import time
 
+from config_store import register_document
+
 # Konfigurationsdatei für Hotspot-Status
 HOTSPOT_STATE_FILE = '/home/vde/VDE-Messwand/hotspot_state.json'
 
@@ -15,27 +15,18 @@ HOTSPOT_PASSWORD = 'vde12345'
 HOTSPOT_IP = '192.168.50.1'
 HOTSPOT_CON_NAME = 'Hotspot'  # NetworkManager Verbindungsname (nicht SSID!)
 
+_hotspot_document = register_document('hotspot_state', HOTSPOT_STATE_FILE,
+                                      default=lambda: {'active': False}, indent=None,
+                                      write_delay=0)  # selten, wird vor Netzwerkwechseln gelesen
+
 def get_hotspot_state():
     """Liest den aktuellen Hotspot-Status"""
-    try:
-        if os.path.exists(HOTSPOT_STATE_FILE):
-            with open(HOTSPOT_STATE_FILE, 'r') as f:
-                return json.load(f)
-        return {'active': False}
-    except Exception as e:
-        print(f"Error reading hotspot state: {e}")
-        return {'active': False}
+    return _hotspot_document.copy()
 
 
 def save_hotspot_state(active):
     """Speichert den Hotspot-Status"""
-    try:
-        with open(HOTSPOT_STATE_FILE, 'w') as f:
-            json.dump({'active': active}, f)
-        return True
-    except Exception as e:
-        print(f"Error saving hotspot state: {e}")
-        return False
+    return _hotspot_document.save({'active': active})
 
 
 def is_hotspot_active():
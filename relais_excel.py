@@ -5,6 +5,7 @@ from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from io import BytesIO
 from relais_manager import get_all_relais_config, bulk_update_relais
+from relay_layout import RELAY_LAYOUT
 from stromkreis_manager import get_all_kategorien, add_kategorie, get_all_stromkreise, add_stromkreis
 
 
@@ -55,9 +56,8 @@ def create_excel_template(include_current_config=False):
     if include_current_config:
         # Aktuelle Konfiguration laden
         config = get_all_relais_config()
-        for relay_num in range(64):
+        for row, relay_num in enumerate(RELAY_LAYOUT.relays(), 2):
             relay_data = config.get(relay_num, {})
-            row = relay_num + 2
 
             ws.cell(row=row, column=1, value=relay_num + 1).border = thin_border
             ws.cell(row=row, column=2, value=relay_data.get('group_number', 0)).border = thin_border
@@ -65,9 +65,8 @@ def create_excel_template(include_current_config=False):
             ws.cell(row=row, column=4, value=relay_data.get('category', '')).border = thin_border
             ws.cell(row=row, column=5, value=relay_data.get('stromkreis', '')).border = thin_border
     else:
-        # Leere Vorlage mit allen 64 Relais
-        for relay_num in range(64):
-            row = relay_num + 2
+        # Leere Vorlage mit allen Relais
+        for row, relay_num in enumerate(RELAY_LAYOUT.relays(), 2):
             ws.cell(row=row, column=1, value=relay_num + 1).border = thin_border
             ws.cell(row=row, column=2, value=0).border = thin_border
             ws.cell(row=row, column=3, value='').border = thin_border
@@ -83,7 +82,7 @@ def create_excel_template(include_current_config=False):
         ("", False),
         ("Anleitung:", True),
         ("1. Füllen Sie die Tabelle 'Relais-Konfiguration' aus", False),
-        ("2. Relais-Nr: 1-64 (nicht ändern!)", False),
+        (f"2. Relais-Nr: 1-{RELAY_LAYOUT.total_relays} (nicht ändern!)", False),
         ("3. Gruppen-Nr: 0 = einzeln, 1-20 = Gruppennummer", False),
         ("4. Name: Beliebige Beschreibung (z.B. 'CEE L1')", False),
         ("5. Kategorie: z.B. RISO, Zi, Zs, RCD", False),
@@ -161,8 +160,9 @@ def import_from_excel(file_stream):
                 relay_num = relay_num_excel - 1    # Intern 0-basiert
                 group_number = int(group_number) if group_number is not None else 0
 
-                if not (1 <= relay_num_excel <= 64):
-                    errors.append(f"Zeile {row_num}: Ungültige Relais-Nr {relay_num_excel} (muss 1-64 sein)")
+                if not RELAY_LAYOUT.is_valid(relay_num):
+                    errors.append(f"Zeile {row_num}: Ungültige Relais-Nr {relay_num_excel} "
+                                  f"(muss 1-{RELAY_LAYOUT.total_relays} sein)")
                     continue
 
                 if not (0 <= group_number <= 20):
@@ -332,10 +332,9 @@ def create_predefined_template_excel(template_id):
             ws.column_dimensions['D'].width = 15
             ws.column_dimensions['E'].width = 15
 
-            # Füge alle 64 Relais hinzu, befülle nur die aus der Vorlage
+            # Füge alle Relais hinzu, befülle nur die aus der Vorlage
             config = template['config']
-            for relay_num in range(64):
-                row = relay_num + 2
+            for row, relay_num in enumerate(RELAY_LAYOUT.relays(), 2):
 
                 if relay_num in config:
                     relay_data = config[relay_num]
@@ -1,33 +1,72 @@
 """
 VDE Messwand - Modulare Relais-Verwaltung
 Nummer-basierte Gruppierung mit Kategorie und Stromkreis
+Die Konfiguration liegt in der Tabelle relais_config (Indizes auf Kategorie, Stromkreis
+und Gruppen-Nummer), relais_config.json ist Import-Quelle und Backup (siehe config_db).
 """
-import json
-import os
+from config_db import register_table
+from config_store import register_document, watch_config
+from relay_layout import RELAY_LAYOUT
 
 RELAIS_CONFIG_FILE = 'relais_config.json'
 
+RELAIS_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS relais_config (
+        relay_num INTEGER PRIMARY KEY,
+        group_number INTEGER NOT NULL DEFAULT 0,
+        name TEXT NOT NULL DEFAULT '',
+        category TEXT NOT NULL DEFAULT '',
+        stromkreis TEXT NOT NULL DEFAULT ''
+    )
+    ''',
+    # Relais-Nummer im Index: Abfragen liefern sortierte Listen direkt aus dem Index
+    'CREATE INDEX IF NOT EXISTS idx_relais_category ON relais_config (category, relay_num)',
+    'CREATE INDEX IF NOT EXISTS idx_relais_stromkreis ON relais_config (stromkreis, relay_num)',
+    'CREATE INDEX IF NOT EXISTS idx_relais_group ON relais_config (group_number, relay_num)',
+]
+
+RELAIS_COLUMNS = 'relay_num, group_number, name, category, stromkreis'
+
+
+def _relais_row(relay_data):
+    """(group_number, name, category, stromkreis) eines Eintrags"""
+    return (int(relay_data.get('group_number', 0)), relay_data.get('name', ''),
+            relay_data.get('category', ''), relay_data.get('stromkreis', ''))
+
+
+def _import_relais(conn, config):
+    """Übernimmt relais_config.json in die Tabelle"""
+    conn.executemany(f'INSERT OR REPLACE INTO relais_config ({RELAIS_COLUMNS}) VALUES (?, ?, ?, ?, ?)',
+                     [(int(relay_key), *_relais_row(relay_data)) for relay_key, relay_data in config.items()])
+
+
+def _export_relais(conn):
+    """Tabelle im Format von relais_config.json (String-Keys)"""
+    return {str(relay_num): {'group_number': group_number, 'name': name,
+                             'category': category, 'stromkreis': stromkreis}
+            for relay_num, group_number, name, category, stromkreis
+            in conn.execute(f'SELECT {RELAIS_COLUMNS} FROM relais_config ORDER BY relay_num')}
+
+
+# relais_config.json: Import-Quelle beim ersten Start und Backup jeder Änderung
+_relais_document = register_document('relais_config', RELAIS_CONFIG_FILE)
+_relais_table = register_table(_relais_document, RELAIS_SCHEMA, _import_relais, _export_relais)
+
 
 def load_relais_config():
     """
-    Lädt Relais-Konfiguration aus JSON-Datei
+    Lädt die Relais-Konfiguration aus der Datenbank
 
     Returns:
         Dictionary mit Relais-Konfiguration {relay_num: {group_number, name, category, stromkreis}}
     """
-    if os.path.exists(RELAIS_CONFIG_FILE):
-        try:
-            with open(RELAIS_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading relais config: {e}")
-            return {}
-    return {}
+    return _relais_table.export()
 
 
 def save_relais_config(config):
     """
-    Speichert Relais-Konfiguration in JSON-Datei
+    Ersetzt die komplette Relais-Konfiguration (eine Transaktion)
 
     Args:
         config: Dictionary mit Relais-Konfiguration
@@ -36,15 +75,66 @@ def save_relais_config(config):
         True bei Erfolg, False bei Fehler
     """
     try:
-        with open(RELAIS_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        print(f"✓ Relais config saved to {RELAIS_CONFIG_FILE}")
+        with _relais_table.transaction(write=True) as conn:
+            conn.execute('DELETE FROM relais_config')
+            _import_relais(conn, config)
+        print(f"✓ Relais config saved ({len(config)} Einträge)")
         return True
     except Exception as e:
         print(f"Error saving relais config: {e}")
         return False
 
 
+def _write_relay(conn, relay_num, group_number, name, category, stromkreis):
+    """Schreibt einen Eintrag bzw. löscht ihn, wenn alle Felder leer sind (in laufender Transaktion)"""
+    if group_number == 0 and not name and not category and not stromkreis:
+        conn.execute('DELETE FROM relais_config WHERE relay_num = ?', (relay_num,))
+    else:
+        conn.execute(f'INSERT OR REPLACE INTO relais_config ({RELAIS_COLUMNS}) VALUES (?, ?, ?, ?, ?)',
+                     (relay_num, group_number, name, category, stromkreis))
+
+
+def _build_group_index():
+    """{relay_num: (group_number, name, [relais der Gruppe])} für alle gruppierten Relais"""
+    with _relais_table.transaction() as conn:
+        rows = conn.execute('SELECT group_number, relay_num, name FROM relais_config '
+                            'WHERE group_number > 0 ORDER BY group_number, relay_num').fetchall()
+    members = {}
+    for group_number, relay_num, name in rows:
+        members.setdefault(group_number, []).append(relay_num)
+    return {relay_num: (group_number, name, members[group_number]) for group_number, relay_num, name in rows}
+
+
+def _rebuild_group_index():
+    global _group_index
+    _group_index = _build_group_index()
+
+
+# Schaltpfad (set_relay, apply_scene, ...): Gruppen-Zugehörigkeit aus dem Speicher. Neu
+# aufgebaut nur, wenn sich die gemeinsame Konfigurations-Generation ändert (irgendein Worker
+# hat Konfiguration geschrieben) - sonst keine Datenbank-Transaktion pro Relais.
+_group_index = {}
+_group_index_watcher = watch_config(_rebuild_group_index)
+
+
+def get_relay_group_info(relay_num):
+    """
+    Gruppe eines Relais (In-Memory-Index, aufgebaut aus der Tabelle relais_config)
+
+    Args:
+        relay_num: Relais-Nummer
+
+    Returns:
+        (group_number, name, [relais]) oder None, wenn das Relais in keiner Gruppe ist
+    """
+    _group_index_watcher.refresh()
+    group = _group_index.get(relay_num)
+    if group is None:
+        return None
+    group_number, name, members = group
+    return group_number, name, list(members)
+
+
 def get_relais_by_group_number(group_number):
     """
     Gibt alle Relais einer Gruppen-Nummer zurück
@@ -55,14 +145,9 @@ def get_relais_by_group_number(group_number):
     Returns:
         Liste von Relais-Nummern in dieser Gruppe
     """
-    config = load_relais_config()
-    relais_in_group = []
-
-    for relay_num_str, relay_data in config.items():
-        if relay_data.get('group_number') == group_number:
-            relais_in_group.append(int(relay_num_str))
-
-    return sorted(relais_in_group)
+    with _relais_table.transaction() as conn:
+        return [relay_num for relay_num, in conn.execute(
+            'SELECT relay_num FROM relais_config WHERE group_number = ? ORDER BY relay_num', (group_number,))]
 
 
 def get_groups_overview():
@@ -72,26 +157,20 @@ def get_groups_overview():
     Returns:
         Dictionary {group_number: {name, relays, category, stromkreis}}
     """
-    config = load_relais_config()
     groups = {}
-
-    for relay_num_str, relay_data in config.items():
-        group_num = relay_data.get('group_number', 0)
-
-        if group_num > 0:  # 0 = keine Gruppe
+    with _relais_table.transaction() as conn:
+        rows = conn.execute('SELECT group_number, relay_num, name, category, stromkreis FROM relais_config '
+                            'WHERE group_number > 0 ORDER BY group_number, relay_num')
+        for group_num, relay_num, name, category, stromkreis in rows:
             if group_num not in groups:
+                # Name/Kategorie/Stromkreis vom Repräsentanten (kleinste Relais-Nummer)
                 groups[group_num] = {
-                    'name': relay_data.get('name', f'Gruppe {group_num}'),
+                    'name': name or f'Gruppe {group_num}',
                     'relays': [],
-                    'category': relay_data.get('category', ''),
-                    'stromkreis': relay_data.get('stromkreis', '')
+                    'category': category,
+                    'stromkreis': stromkreis
                 }
-            groups[group_num]['relays'].append(int(relay_num_str))
-
-    # Sortiere Relais in jeder Gruppe
-    for group_data in groups.values():
-        group_data['relays'].sort()
-
+            groups[group_num]['relays'].append(relay_num)
     return groups
 
 
@@ -100,7 +179,7 @@ def update_relay_config(relay_num, group_number=0, name='', category='', stromkr
     Aktualisiert die Konfiguration eines einzelnen Relais
 
     Args:
-        relay_num: Relais-Nummer (0-63)
+        relay_num: Relais-Nummer (siehe relay_layout)
         group_number: Gruppen-Nummer (0 = keine Gruppe, 1-99 = Gruppe)
         name: Name/Beschreibung
         category: Kategorie
@@ -109,34 +188,19 @@ def update_relay_config(relay_num, group_number=0, name='', category='', stromkr
     Returns:
         (success, message)
     """
-    if not 0 <= relay_num <= 63:
+    if not RELAY_LAYOUT.is_valid(relay_num):
         return False, "Ungültige Relais-Nummer"
 
     if not 0 <= group_number <= 99:
         return False, "Ungültige Gruppen-Nummer (0-99)"
 
-    config = load_relais_config()
-
-    # Konvertiere zu String für JSON-Keys
-    relay_key = str(relay_num)
-
-    # Erstelle oder aktualisiere Eintrag
-    config[relay_key] = {
-        'group_number': group_number,
-        'name': name.strip(),
-        'category': category.strip(),
-        'stromkreis': stromkreis.strip()
-    }
-
-    # Wenn alle Felder leer und group_number = 0, lösche den Eintrag
-    if (group_number == 0 and not name.strip() and
-        not category.strip() and not stromkreis.strip()):
-        if relay_key in config:
-            del config[relay_key]
-
-    if save_relais_config(config):
+    try:
+        # Ein Eintrag statt kompletter Konfiguration; leere Einträge werden gelöscht
+        with _relais_table.transaction(write=True) as conn:
+            _write_relay(conn, relay_num, group_number, name.strip(), category.strip(), stromkreis.strip())
         return True, f"Relais {relay_num} erfolgreich aktualisiert"
-    else:
+    except Exception as e:
+        print(f"Error updating relay {relay_num}: {e}")
         return False, "Fehler beim Speichern"
 
 
@@ -150,46 +214,39 @@ def bulk_update_relais(updates):
     Returns:
         Dictionary mit success, message und failed_count
     """
-    config = load_relais_config()
     failed = 0
     success_count = 0
 
-    for relay_num, data in updates.items():
-        try:
-            relay_num = int(relay_num)
-            if not 0 <= relay_num <= 63:
-                failed += 1
-                continue
-
-            group_number = data.get('group_number', 0)
-            name = data.get('name', '')
-            category = data.get('category', '')
-            stromkreis = data.get('stromkreis', '')
-
-            relay_key = str(relay_num)
-
-
-            # Update oder erstelle Eintrag
-            config[relay_key] = {
-                'group_number': int(group_number),
-                'name': name.strip(),
-                'category': category.strip(),
-                'stromkreis': stromkreis.strip()
-            }
-
-            # Leere Einträge löschen
-            if (int(group_number) == 0 and not name.strip() and
-                not category.strip() and not stromkreis.strip()):
-                if relay_key in config:
-                    del config[relay_key]
-
-            success_count += 1
-
-        except Exception as e:
-            print(f"Error updating relay {relay_num}: {e}")
-            failed += 1
+    try:
+        # Alle Änderungen in einer Transaktion: ein Commit, ein Export
+        with _relais_table.transaction(write=True) as conn:
+            for relay_num, data in updates.items():
+                try:
+                    relay_num = int(relay_num)
+                    if not RELAY_LAYOUT.is_valid(relay_num):
+                        failed += 1
+                        continue
+
+                    group_number = data.get('group_number', 0)
+                    name = data.get('name', '')
+                    category = data.get('category', '')
+                    stromkreis = data.get('stromkreis', '')
+
+                    # Update oder erstelle Eintrag, leere Einträge löschen
+                    _write_relay(conn, relay_num, int(group_number),
+                                 name.strip(), category.strip(), stromkreis.strip())
+
+                    success_count += 1
+
+                except Exception as e:
+                    print(f"Error updating relay {relay_num}: {e}")
+                    failed += 1
+        saved = True
+    except Exception as e:
+        print(f"Error saving relais config: {e}")
+        saved = False
 
-    if save_relais_config(config):
+    if saved:
         return {
             'success': True,
             'message': f"{success_count} Relais aktualisiert",
@@ -205,18 +262,21 @@ def bulk_update_relais(updates):
 
 def get_all_relais_config():
     """
-    Gibt die komplette Relais-Konfiguration zurück (alle 64 Relais)
+    Gibt die komplette Relais-Konfiguration zurück (alle Relais aus MODBUS_MODULES)
 
     Returns:
-        Dictionary mit allen 64 Relais und ihren Konfigurationen
+        Dictionary mit allen Relais und ihren Konfigurationen
     """
-    config = load_relais_config()
+    with _relais_table.transaction() as conn:
+        config = {relay_num: {'group_number': group_number, 'name': name,
+                              'category': category, 'stromkreis': stromkreis}
+                  for relay_num, group_number, name, category, stromkreis
+                  in conn.execute(f'SELECT {RELAIS_COLUMNS} FROM relais_config')}
     full_config = {}
 
-    for i in range(64):
-        relay_key = str(i)
-        if relay_key in config:
-            full_config[i] = config[relay_key]
+    for i in RELAY_LAYOUT.relays():
+        if i in config:
+            full_config[i] = config[i]
         else:
             # Standardwerte für nicht konfigurierte Relais
             full_config[i] = {
@@ -239,14 +299,9 @@ def get_relais_by_category(category):
     Returns:
         Liste von Relais-Nummern
     """
-    config = load_relais_config()
-    relais_list = []
-
-    for relay_num_str, relay_data in config.items():
-        if relay_data.get('category', '') == category:
-            relais_list.append(int(relay_num_str))
-
-    return sorted(relais_list)
+    with _relais_table.transaction() as conn:
+        return [relay_num for relay_num, in conn.execute(
+            'SELECT relay_num FROM relais_config WHERE category = ? ORDER BY relay_num', (category,))]
 
 
 def get_relais_by_stromkreis(stromkreis):
@@ -259,14 +314,9 @@ def get_relais_by_stromkreis(stromkreis):
     Returns:
         Liste von Relais-Nummern
     """
-    config = load_relais_config()
-    relais_list = []
-
-    for relay_num_str, relay_data in config.items():
-        if relay_data.get('stromkreis', '') == stromkreis:
-            relais_list.append(int(relay_num_str))
-
-    return sorted(relais_list)
+    with _relais_table.transaction() as conn:
+        return [relay_num for relay_num, in conn.execute(
+            'SELECT relay_num FROM relais_config WHERE stromkreis = ? ORDER BY relay_num', (stromkreis,))]
 
 
 def get_representative_relais_for_groups():
@@ -276,14 +326,9 @@ def get_representative_relais_for_groups():
     Returns:
         Dictionary {group_number: representative_relay_num}
     """
-    groups = get_groups_overview()
-    representatives = {}
-
-    for group_num, group_data in groups.items():
-        if group_data['relays']:
-            representatives[group_num] = min(group_data['relays'])
-
-    return representatives
+    with _relais_table.transaction() as conn:
+        return dict(conn.execute('SELECT group_number, MIN(relay_num) FROM relais_config '
+                                 'WHERE group_number > 0 GROUP BY group_number'))
 
 
 def normalize_relay_to_representative(relay_num):
@@ -297,24 +342,12 @@ def normalize_relay_to_representative(relay_num):
     Returns:
         Repräsentant-Relais-Nummer
     """
-    config = load_relais_config()
-    relay_key = str(relay_num)
-
-    if relay_key not in config:
-        return relay_num
-
-    group_number = config[relay_key].get('group_number', 0)
-
-    if group_number == 0:
-        # Keine Gruppe
-        return relay_num
-
-    # Finde kleinstes Relais in der Gruppe
-    group_relais = get_relais_by_group_number(group_number)
-    if group_relais:
-        return min(group_relais)
-
-    return relay_num
+    # Kein Eintrag = keine Gruppe = eigener Repräsentant
+    with _relais_table.transaction() as conn:
+        row = conn.execute('SELECT MIN(member.relay_num) FROM relais_config AS relay '
+                           'JOIN relais_config AS member ON member.group_number = relay.group_number '
+                           'WHERE relay.relay_num = ? AND relay.group_number > 0', (relay_num,)).fetchone()
+    return row[0] if row[0] is not None else relay_num
 
 
 def get_relais_statistics():
@@ -324,20 +357,21 @@ def get_relais_statistics():
     Returns:
         Dictionary mit Statistiken
     """
-    config = load_relais_config()
-    groups = get_groups_overview()
-
-    configured_count = len(config)
-    grouped_count = sum(len(g['relays']) for g in groups.values())
-    named_count = sum(1 for r in config.values() if r.get('name', '').strip())
-    categorized_count = sum(1 for r in config.values() if r.get('category', '').strip())
+    with _relais_table.transaction() as conn:
+        configured_count, grouped_count, named_count, categorized_count, total_groups = conn.execute(
+            "SELECT COUNT(*), "
+            "COALESCE(SUM(group_number > 0), 0), "
+            "COALESCE(SUM(TRIM(name) != ''), 0), "
+            "COALESCE(SUM(TRIM(category) != ''), 0), "
+            "COUNT(DISTINCT NULLIF(group_number, 0)) "
+            "FROM relais_config").fetchone()
 
     return {
-        'total_relais': 64,
+        'total_relais': RELAY_LAYOUT.relay_count,
         'configured_relais': configured_count,
         'grouped_relais': grouped_count,
         'named_relais': named_count,
         'categorized_relais': categorized_count,
-        'total_groups': len(groups),
-        'unconfigured_relais': 64 - configured_count
+        'total_groups': total_groups,
+        'unconfigured_relais': RELAY_LAYOUT.relay_count - configured_count
     }
@@ -2,6 +2,8 @@
 VDE Messwand - Relais-Konfigurationsvorlagen
 Vordefinierte Templates für schnelle Einrichtung
 """
+from relay_layout import RELAY_LAYOUT
+
 
 def get_available_templates():
     """
@@ -123,7 +125,7 @@ def apply_template(template_id, start_relay=None, group_offset=0):
         new_config = {}
         for old_num, config in template_config.items():
             new_num = old_num + offset
-            if 0 <= new_num <= 63:  # Nur gültige Relais-Nummern
+            if RELAY_LAYOUT.is_valid(new_num):  # Nur gültige Relais-Nummern
                 new_config[new_num] = config.copy()
 
                 # Gruppen-Offset anwenden
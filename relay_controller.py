@@ -2,23 +2,56 @@
 VDE Messwand - Relay Controller
 High-Level Relais-Steuerung
 """
+import threading
 import time
-from modbus_controller import ModbusRTU
-from config import SERIAL_PORT, BAUD_RATE, SERIAL_TIMEOUT, MODBUS_MODULES
+from bus_pool import BusPool
+from relay_state import RelayState
+from relay_layout import RELAY_LAYOUT, TOTAL_RELAYS
+from config import SERIAL_TIMEOUT, MODBUS_EMERGENCY_BROADCAST
+from log_buffer import get_logger
+
+log = get_logger(__name__)
 
 
 class RelayController:
-    """High-Level Relais-Steuerung für 64 Relais auf 2 Modulen"""
+    """High-Level Relais-Steuerung für alle Relais-Module aus MODBUS_MODULES"""
     
-    def __init__(self):
-        self.active_relays = []
-        self.modbus = ModbusRTU(SERIAL_PORT, BAUD_RATE, SERIAL_TIMEOUT)
-        self.relay_states = {0: [False] * 32, 1: [False] * 32}
+    def __init__(self, layout=RELAY_LAYOUT):
+        self.layout = layout
+        # Ein Bus (ModbusRTU + Worker) pro serieller Schnittstelle
+        self.buses = BusPool(layout, SERIAL_TIMEOUT)
+        # Zuletzt geschriebener Zustand aller Relais (Bit n = Relais n)
+        self.state = RelayState()
+        # Aktive Gruppen-Repräsentanten
+        self.active = RelayState()
+        # Module, deren Hardware-Zustand sicher dem Cache entspricht (nach FC15-Schreiben)
+        self.module_synced = {module.index: False for module in self.layout.modules}
+        # Schützt state/active/module_synced: Notaus (Verbindungs-Thread) und Schreibbefehle
+        # (Worker) übernehmen ihre Ergebnisse nur unter diesem Lock, nie während Bus-Verkehr
+        self.state_lock = threading.Lock()
+        # Zählt Notaus-Vorgänge: Ergebnisse eines Schreibbefehls, während dessen ein Notaus kam,
+        # werden verworfen (die Hardware ist aus, egal was vorher bestätigt wurde)
+        self.emergency_epoch = 0
+
+    @property
+    def active_relays(self):
+        """Aktive Relais (Gruppen als Repräsentant), aufsteigend sortiert"""
+        return self.active.to_list()
+
+    @active_relays.setter
+    def active_relays(self, relays):
+        self.active = RelayState.from_relays(relays)
+
+    @property
+    def relay_states(self):
+        """Kompatibilitäts-Sicht {module_idx: [bool] * num_coils} auf den Bitmasken-Zustand"""
+        return {module.index: self.state.to_bools(module.base_addr, module.num_coils)
+                for module in self.layout.modules}
 
     def get_relay_group(self, relay_num):
         """
         Prüft, ob ein Relais Teil einer Gruppe ist.
-        Verwendet group_number aus relais_config.json.
+        Verwendet group_number aus der Relais-Konfiguration (relais_manager).
 
         Args:
             relay_num: Relais-Nummer
@@ -27,27 +60,23 @@ class RelayController:
             Tuple (group_name, relay_list) oder (None, [relay_num]) wenn keine Gruppe
         """
         try:
-            from relais_manager import load_relais_config, get_relais_by_group_number
-
-            config = load_relais_config()
-            relay_key = str(relay_num)
+            from relais_manager import get_relay_group_info
 
-            if relay_key in config:
-                group_number = config[relay_key].get('group_number', 0)
+            # Index-Zugriff in der Konfigurations-Datenbank
+            group = get_relay_group_info(relay_num)
 
-                if group_number > 0:
-                    # Finde alle Relais mit derselben group_number
-                    group_relais = get_relais_by_group_number(group_number)
+            if group is not None:
+                group_number, name, group_relais = group
 
-                    if len(group_relais) > 1:
-                        group_name = config[relay_key].get('name', f'Gruppe {group_number}')
-                        print(f"Relay {relay_num} is part of group {group_number} ('{group_name}') with relays {group_relais}")
-                        return f"Gruppe_{group_number}", group_relais
+                if len(group_relais) > 1:
+                    group_name = name or f'Gruppe {group_number}'
+                    log.debug(f"Relay {relay_num} is part of group {group_number} ('{group_name}') with relays {group_relais}")
+                    return f"Gruppe_{group_number}", group_relais
 
             return None, [relay_num]
 
         except Exception as e:
-            print(f"Warning: Could not load group from relais_config: {e}")
+            log.warning(f"Could not load group from relais_config: {e}")
             return None, [relay_num]
     
     def normalize_relay_to_group_representative(self, relay_num):
@@ -68,69 +97,77 @@ class RelayController:
         Ermittelt Modul, lokale Adresse und Slave-ID für ein Relais
         
         Args:
-            relay_num: Globale Relais-Nummer (0-63)
+            relay_num: Globale Relais-Nummer
             
         Returns:
-            (module_idx, local_relay, slave_id)
+            (module_idx, local_relay, slave_id) oder None bei ungültiger Nummer
         """
-        if relay_num < 32:
-            return 0, relay_num, MODBUS_MODULES[0]['slave_id']
-        else:
-            return 1, relay_num - 32, MODBUS_MODULES[1]['slave_id']
+        return self.layout.locate(relay_num)
 
     def set_relay(self, relay_num, state):
         """
         Schaltet ein einzelnes Relais (oder eine Gruppe, wenn es Teil einer ist)
         
         Args:
-            relay_num: Globale Relais-Nummer (0-63)
+            relay_num: Globale Relais-Nummer
             state: True = EIN, False = AUS
             
         Returns:
             True bei Erfolg, False bei Fehler
         """
         try:
-            if not 0 <= relay_num <= 63:
-                print(f"Invalid relay number: {relay_num}")
+            if not self.layout.is_valid(relay_num):
+                log.warning(f"Invalid relay number: {relay_num}")
                 return False
             
             # Prüfen ob Teil einer Gruppe
             group_name, relay_group = self.get_relay_group(relay_num)
             representative = relay_group[0]  # Erstes Relais ist Repräsentant
             
+            epoch = self.emergency_epoch
             success = True
             for relay in relay_group:
-                module_idx, local_relay, slave_id = self.get_module_info(relay)
-                self.relay_states[module_idx][local_relay] = state
-
-                print(f"  Setting relay {relay} (Module {module_idx}, Local {local_relay}, Slave {slave_id}) to {state}")
-                relay_success = self.modbus.write_single_coil(slave_id, local_relay, state)
+                location = self.layout.locate(relay)
+                if location is None:
+                    log.warning(f"  Group member {relay} is outside the relay address space")
+                    success = False
+                    continue
+                module_idx, local_relay, slave_id = location
+
+                log.debug(f"  Setting relay {relay} (Module {module_idx}, Local {local_relay}, Slave {slave_id}) to {state}")
+                relay_success = self.buses.bus_of(module_idx).modbus.write_single_coil(slave_id, local_relay, state)
+
+                with self.state_lock:
+                    if self.emergency_epoch != epoch:
+                        # Notaus während des Schaltens: Cache bleibt wie vom Notaus gesetzt (alles aus)
+                        self.module_synced[module_idx] = False
+                        success = False
+                        continue
+                    self.state = self.state.with_relay(relay, state)
+                    if not relay_success:
+                        self.module_synced[module_idx] = False
 
                 if not relay_success:
-                    print(f"  ❌ Failed to set relay {relay}")
+                    log.error(f"  ❌ Failed to set relay {relay}")
                     success = False
                 else:
-                    print(f"  ✅ Relay {relay} set successfully")
-
-                # Längere Pause zwischen Gruppen-Relais für stabile Bus-Kommunikation
-                time.sleep(0.1)  # 100ms Pause zwischen jedem Relais
+                    log.debug(f"  ✅ Relay {relay} set successfully")
             
             # Nur den Repräsentanten in active_relays tracken
             if success:
-                if state and representative not in self.active_relays:
-                    self.active_relays.append(representative)
-                elif not state and representative in self.active_relays:
-                    self.active_relays.remove(representative)
+                with self.state_lock:
+                    if self.emergency_epoch == epoch:
+                        self.active = self.active.with_relay(representative, state)
                 
                 if group_name:
-                    print(f"✓ Relay group '{group_name}' ({relay_group}) set to {'ON' if state else 'OFF'}")
+                    log.info(f"✓ Relay group '{group_name}' ({relay_group}) set to {'ON' if state else 'OFF'}")
                 else:
-                    print(f"Relay {relay_num} set to {'ON' if state else 'OFF'}")
+                    log.info(f"Relay {relay_num} set to {'ON' if state else 'OFF'}")
             
             return success
         
         except Exception as e:
-            print(f"Error setting relay {relay_num}: {e}")
+            log.exception(f"Error setting relay {relay_num}: {e}")
             return False
 
     def set_multiple_relays(self, relay_states_dict):
@@ -143,141 +180,293 @@ class RelayController:
         Returns:
             (success_count, failed_relays)
         """
+        # Zielzustand = aktueller Zustand + Änderungen, dann ein FC15 pro Modul
+        with self.state_lock:
+            epoch = self.emergency_epoch
+            target = self.state
+        relay_members = {}
+
+        for relay_num, state in relay_states_dict.items():
+            if not self.layout.is_valid(relay_num):
+                log.warning(f"Invalid relay number: {relay_num}")
+                relay_members[relay_num] = []
+                continue
+            group_name, relay_group = self.get_relay_group(relay_num)
+            relay_members[relay_num] = relay_group
+            for relay in relay_group:
+                target = target.with_relay(relay, state)
+
+        failed = self._write_module_states(target, epoch=epoch)
+
         success_count = 0
         failed_relays = []
-        
-        for relay_num, state in relay_states_dict.items():
-            if self.set_relay(relay_num, state):
-                success_count += 1
-            else:
-                failed_relays.append(relay_num)
-            # Längere Pause zwischen verschiedenen Relais/Gruppen
-            time.sleep(0.15)  # 150ms Pause zwischen Befehlen
-        
+        with self.state_lock:
+            if self.emergency_epoch != epoch:
+                failed = RelayState(self.layout.all_mask)
+            for relay_num, relay_group in relay_members.items():
+                if relay_group and not (RelayState.from_relays(relay_group) & failed):
+                    success_count += 1
+                    self.active = self.active.with_relay(relay_group[0], relay_states_dict[relay_num])
+                else:
+                    failed_relays.append(relay_num)
+
         return success_count, failed_relays
 
-    def reset_all_relays(self):
+    def _write_module_states(self, target, force=False, epoch=None):
         """
-        Setzt alle Relais auf beiden Modulen zurück
+        Schreibt den Zielzustand mit höchstens einem FC15-Frame pro Modul.
+        Module, deren Zielzustand dem bekannten Hardware-Zustand entspricht, werden übersprungen.
+        Mehrere Busse werden parallel beschrieben.
+
+        Args:
+            target: RelayState mit dem gewünschten Zustand aller Relais
+            force: True = alle Module schreiben, auch ohne Änderung
+            epoch: emergency_epoch, auf dem target beruht (None = aktueller Stand)
 
         Returns:
-            True bei Erfolg, False bei Fehler
+            RelayState mit allen Relais der Module, bei denen das Schreiben fehlgeschlagen ist
+            (nach einem Notaus während des Schreibens: alle Relais)
         """
-        try:
-            print("=" * 60)
-            print("RESET ALL RELAYS - Starting...")
-            print("=" * 60)
+        with self.state_lock:
+            if epoch is None:
+                epoch = self.emergency_epoch
+            state = self.state
+            module_synced = dict(self.module_synced)
+
+        def write_bus(bus):
+            # Läuft ggf. im Bus-Worker: nur schreiben, Zustand wird danach im Aufrufer übernommen
+            written = []
+            for module in bus.modules:
+                bits = target.module_mask(module.base_addr, module.num_coils)
+                if (not force and module_synced[module.index]
+                        and bits == state.module_mask(module.base_addr, module.num_coils)):
+                    continue
+                ok = bus.modbus.write_coil_mask(module.slave_id, 0, module.num_coils, bits)
+                # Notaus kam dazwischen und hat das Modul wieder abgeschaltet
+                written.append((module, bits, ok, ok and bus.modbus.emergency.is_set()))
+            return written
+
+        failed = RelayState()
+        results = self.buses.run(write_bus)
+
+        with self.state_lock:
+            # Notaus während des Schreibens: alle Ergebnisse verwerfen, der Notaus hat den
+            # Cache bereits geleert - kein Modul darf danach als synchron gelten
+            emergency = self.emergency_epoch != epoch
+            for written in results:
+                for module, bits, ok, interrupted in written:
+                    if ok and not interrupted and not emergency:
+                        self.state = self.state.with_module_mask(module.base_addr, module.num_coils, bits)
+                        self.module_synced[module.index] = True
+                        continue
+                    if not ok:
+                        log.error(f"❌ Failed to write module {module.index + 1} (Slave ID {module.slave_id})")
+                    self.module_synced[module.index] = False
+                    failed = failed | RelayState(module.field)
+            if emergency:
+                failed = RelayState(self.layout.all_mask)
+
+        return failed
+
+    def apply_scene(self, target_relays, force=False):
+        """
+        Schaltet genau die angegebenen Relais (inkl. Gruppen-Mitglieder) ein, alle anderen aus.
+        Ersetzt reset_all_relays() + set_relay() pro Relais: es wird der komplette
+        Zielzustand aller Relais berechnet und pro Modul höchstens ein FC15-Frame gesendet.
 
-            success = True
-            for module_idx in [0, 1]:
-                slave_id = MODBUS_MODULES[module_idx]['slave_id']
-                states = [False] * 32
+        Args:
+            target_relays: Iterable von Relais-Nummern (beliebige Gruppen-Mitglieder)
+            force: True = alle Module schreiben, auch ohne Änderung
+
+        Returns:
+            (activated_relays, failed_relays) bezogen auf die übergebenen Relais-Nummern
+        """
+        epoch = self.emergency_epoch
+        target = RelayState()
+        relay_members = {}
+
+        for relay_num in target_relays:
+            if not self.layout.is_valid(relay_num):
+                log.warning(f"Invalid relay number: {relay_num}")
+                relay_members[relay_num] = []
+                continue
+            group_name, relay_group = self.get_relay_group(relay_num)
+            relay_members[relay_num] = relay_group
+            target = target | RelayState.from_relays(relay_group)
 
-                print(f"\nResetting Module {module_idx + 1} (Slave ID {slave_id})...")
-                module_success = self.modbus.write_multiple_coils(slave_id, 0, states)
+        failed = self._write_module_states(target, force=force, epoch=epoch)
 
-                if module_success:
-                    self.relay_states[module_idx] = states.copy()
-                    print(f"✅ Module {module_idx + 1} (Slave ID {slave_id}) reset successfully")
+        activated_relays = []
+        failed_relays = []
+        active = RelayState()
+        with self.state_lock:
+            if self.emergency_epoch != epoch:
+                failed = RelayState(self.layout.all_mask)
+            for relay_num, relay_group in relay_members.items():
+                if relay_group and not (RelayState.from_relays(relay_group) & failed):
+                    activated_relays.append(relay_num)
+                    active = active.with_relay(relay_group[0], True)
                 else:
-                    print(f"❌ Failed to reset module {module_idx + 1}")
-                    success = False
+                    failed_relays.append(relay_num)
+
+            self.active = active
+        log.info(f"✓ Scene applied: {active.to_list()} ON"
+              + (f", failed relays {failed.to_list()}" if failed else ""))
 
-                time.sleep(0.2)  # Längere Pause zwischen Modulen
+        return activated_relays, failed_relays
+
+    def write_relay_mask(self, mask):
+        """
+        Schreibt einen kompletten Zustand ohne Gruppen-Logik (Diagnose-Muster).
+        Jedes Modul wird geschrieben, auch wenn der Cache schon passt.
+
+        Args:
+            mask: Integer-Bitmaske, Bit n = Relais n
+
+        Returns:
+            Integer-Bitmaske der Relais auf Modulen, deren Schreiben fehlgeschlagen ist
+        """
+        failed = self._write_module_states(RelayState(mask), force=True)
+        with self.state_lock:
+            self.active = RelayState()
+        return failed.mask
+
+    def emergency_off(self):
+        """
+        Notaus: alle Relais sofort aus (vorgefertigte FC15-Frames, ohne Queue und Retry-Pausen,
+        alle Busse gleichzeitig). Schreibbefehle bleiben gesperrt bis emergency_release().
+
+        Returns:
+            (success, first_tx_time, done_time) - Zeiten in time.monotonic()
+        """
+        # Vor dem Senden: laufende Schreibbefehle verwerfen ihre Ergebnisse ab jetzt
+        with self.state_lock:
+            self.emergency_epoch += 1
+            self.state = RelayState()
+            self.active = RelayState()
+            # Bei fehlender Bestätigung (oder Broadcast) ist der Hardware-Zustand nicht gesichert
+            self.module_synced = {module.index: False for module in self.layout.modules}
+
+        return self.buses.emergency_off(broadcast=MODBUS_EMERGENCY_BROADCAST)
+
+    def emergency_release(self):
+        """Hebt die Notaus-Sperre auf (Relais bleiben aus)"""
+        self.buses.release_emergency()
+
+    def reset_all_relays(self):
+        """
+        Setzt alle Relais auf allen Modulen zurück
+
+        Returns:
+            True bei Erfolg, False bei Fehler
+        """
+        try:
+            log.info("RESET ALL RELAYS - Starting...")
+
+            # Reset = leere Szene, immer auf alle Module geschrieben
+            failed = self._write_module_states(RelayState(), force=True)
+            success = not failed
 
             if success:
-                self.active_relays = []
-                print("\n" + "=" * 60)
-                print("✅ All relays reset successfully")
-                print("=" * 60)
+                with self.state_lock:
+                    self.active = RelayState()
+                log.info("✅ All relays reset successfully")
                 return True
             else:
-                print("\n" + "=" * 60)
-                print("❌ Reset failed for some modules")
-                print("=" * 60)
+                log.error("❌ Reset failed for some modules")
                 return False
 
         except Exception as e:
-            print(f"❌ Error resetting relays: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception(f"❌ Error resetting relays: {e}")
             return False
 
     def read_all_relay_status(self):
         """
-        Liest den tatsächlichen Status aller 64 Relais von der Hardware aus
+        Liest den tatsächlichen Status aller Relais von der Hardware aus
 
         Returns:
             Dictionary {relay_num: state} oder None bei Fehler
         """
-        try:
-            all_relays = {}
+        hardware_state = self.read_relay_state()
+        if hardware_state is None:
+            return None
+        return hardware_state.to_dict(TOTAL_RELAYS)
 
-            # Beide Module auslesen
-            for module_idx in [0, 1]:
-                slave_id = MODBUS_MODULES[module_idx]['slave_id']
+    def read_relay_state(self):
+        """
+        Liest den tatsächlichen Status aller Relais als Bitmaske (ein FC01 pro Modul,
+        mehrere Busse parallel)
 
-                # 32 Relais pro Modul lesen
-                coils = self.modbus.read_coils(slave_id, 0, 32)
+        Returns:
+            RelayState oder None bei Fehler
+        """
+        def read_bus(bus):
+            bus_state = RelayState()
+            for module in bus.modules:
+                bits = bus.modbus.read_coil_mask(module.slave_id, 0, module.num_coils)
 
-                if coils is None:
-                    print(f"❌ Konnte Modul {module_idx + 1} nicht auslesen")
+                if bits is None:
+                    log.error(f"❌ Konnte Modul {module.index + 1} nicht auslesen")
                     return None
 
-                # Status in Dictionary speichern
-                for local_relay, state in enumerate(coils):
-                    global_relay = (module_idx * 32) + local_relay
-                    all_relays[global_relay] = state
+                bus_state = bus_state.with_module_mask(module.base_addr, module.num_coils, bits)
+            return bus_state
+
+        try:
+            hardware_state = RelayState()
+
+            for bus_state in self.buses.run(read_bus):
+                if bus_state is None:
+                    return None
+                hardware_state = hardware_state | bus_state
 
-            return all_relays
+            return hardware_state
 
         except Exception as e:
-            print(f"❌ Fehler beim Lesen aller Relais: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception(f"❌ Fehler beim Lesen aller Relais: {e}")
             return None
 
     def test_all_relays(self):
         """
-        Testet alle 64 Relais nacheinander
+        Testet alle Relais nacheinander
 
         Returns:
             True bei Erfolg, False bei Fehler
         """
         try:
-            print("Starting relay test...")
-            for relay in range(64):
-                print(f"Testing relay {relay}")
+            log.info("Starting relay test...")
+            for relay in self.layout.relays():
+                log.info(f"Testing relay {relay}")
 
                 if not self.set_relay(relay, True):
-                    print(f"Failed to turn ON relay {relay}")
+                    log.error(f"Failed to turn ON relay {relay}")
                     return False
                 time.sleep(1.0)  # 1 Sekunde Pause nach Einschalten
 
                 if not self.set_relay(relay, False):
-                    print(f"Failed to turn OFF relay {relay}")
+                    log.error(f"Failed to turn OFF relay {relay}")
                     return False
                 time.sleep(1.0)  # 1 Sekunde Pause nach Ausschalten
 
-            print("Relay test completed successfully")
+            log.info("Relay test completed successfully")
             return True
 
         except Exception as e:
-            print(f"Error testing relays: {e}")
+            log.exception(f"Error testing relays: {e}")
             return False
 
     def get_active_relays(self):
         """
         Gibt Liste der aktiven Relais zurück (Gruppen als Repräsentant)
         """
-        return self.active_relays.copy()
+        return self.active.to_list()
     
     def get_active_relays_normalized(self):
         """
         Gibt normalisierte Liste zurück - alle Gruppen-Mitglieder werden zum Repräsentanten
         """
         normalized = []
-        for relay in self.active_relays:
+        for relay in self.active:
             representative = self.normalize_relay_to_group_representative(relay)
             if representative not in normalized:
                 normalized.append(representative)
@@ -288,20 +477,16 @@ class RelayController:
         Gibt den aktuellen Zustand eines Relais zurück
         
         Args:
-            relay_num: Globale Relais-Nummer (0-63)
+            relay_num: Globale Relais-Nummer
             
         Returns:
             True/False oder None bei ungültiger Nummer
         """
-        if not 0 <= relay_num <= 63:
+        if not self.layout.is_valid(relay_num):
             return None
         
-        module_idx, local_relay, _ = self.get_module_info(relay_num)
-        return self.relay_states[module_idx][local_relay]
+        return relay_num in self.state
 
     def get_all_relay_states(self):
         """Gibt Dictionary aller Relais-Zustände zurück"""
-        all_states = {}
-        for i in range(64):
-            all_states[i] = self.get_relay_state(i)
-        return all_states
+        return self.state.to_dict(TOTAL_RELAYS)
@@ -0,0 +1,656 @@
+"""
+VDE Messwand - Relais-Daemon (Bus-Owner)
+Einziger Prozess mit offener Modbus-Verbindung zum RS-485-Bus.
+Gunicorn-Worker und Flask-Threads senden Relais-Befehle über einen lokalen
+Unix-Socket, der Daemon führt sie über eine Queue strikt nacheinander aus.
+
+Start:
+    python relay_daemon.py [--socket PFAD]
+"""
+import collections
+import fcntl
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from config import (RELAY_DAEMON_SOCKET, RELAY_DAEMON_TIMEOUT,
+                    RELAY_SNAPSHOT_INTERVAL, RELAY_SNAPSHOT_MAX_AGE)
+from relay_layout import RELAY_LAYOUT
+from relay_state import RelayState
+from relay_jobs import JobManager, JobError
+from log_buffer import get_logger, dump_log
+
+log = get_logger(__name__)
+
+# Erlaubte Befehle = Methoden des RelayController, die über IPC aufgerufen werden dürfen
+DAEMON_COMMANDS = {
+    'set_relay',
+    'set_multiple_relays',
+    'apply_scene',
+    'write_relay_mask',
+    'reset_all_relays',
+    'read_all_relay_status',
+    'read_relay_mask',
+    'test_all_relays',
+    'get_active_relays',
+    'get_active_relays_normalized',
+    'normalize_relay_to_group_representative',
+    'get_relay_state',
+    'get_all_relay_states',
+}
+
+# Befehle, die Relais einschalten können - während Notaus abgewiesen.
+# reset_all_relays fehlt bewusst: Alle-AUS bleibt im Notaus erlaubt (siehe _worker_loop)
+SWITCHING_COMMANDS = {
+    'set_relay',
+    'set_multiple_relays',
+    'apply_scene',
+    'write_relay_mask',
+    'test_all_relays',
+}
+
+# Befehle mit langer Laufzeit bekommen ein größeres Timeout auf Client-Seite
+LONG_RUNNING_COMMANDS = {
+    'test_all_relays': 600.0,
+}
+
+
+def _int_keys(data):
+    """Wandelt String-Keys aus JSON wieder in Integer um"""
+    if not isinstance(data, dict):
+        return data
+    return {int(k): v for k, v in data.items()}
+
+
+# ==================== DAEMON (SERVER) ====================
+
+class RelayDaemon:
+    """Besitzt den einzigen RelayController und arbeitet Befehle seriell ab"""
+
+    def __init__(self, socket_path=RELAY_DAEMON_SOCKET, controller=None):
+        """
+        Args:
+            socket_path: Pfad des Unix-Sockets
+            controller: Optionaler RelayController (Standard: neue Instanz)
+        """
+        if controller is None:
+            from relay_controller import RelayController
+            controller = RelayController()
+
+        self.socket_path = socket_path
+        self.controller = controller
+        self.command_queue = queue.Queue()
+        self.server = None
+        self.worker_thread = None
+        self.poller_thread = None
+        self.stop_event = threading.Event()
+        # Letzter gelesener Hardware-Zustand: {'mask', 'timestamp', 'monotonic'}
+        self.snapshot = None
+        # Notaus: Sperre für schaltende Befehle + gemessene Latenzen der letzten Auslösungen
+        self.emergency_active = False
+        self.emergency_log = collections.deque(maxlen=20)
+        # Hintergrund-Jobs (Relais-Test); jeder Busbefehl eines Jobs geht durch die Queue
+        self.jobs = JobManager(self._bus_call)
+
+    def submit(self, cmd, args):
+        """
+        Stellt einen Befehl in die Queue und wartet auf das Ergebnis
+
+        Args:
+            cmd: Befehlsname (siehe DAEMON_COMMANDS)
+            args: Argumentliste
+
+        Returns:
+            Antwort-Dictionary {ok, result} oder {ok, error}
+        """
+        if cmd == 'ping':
+            return {'ok': True, 'result': 'pong'}
+
+        if cmd == 'get_state':
+            # Reiner Lesezugriff auf den Cache, kein Bus-Verkehr (Bitmasken als Integer)
+            return {'ok': True, 'result': {
+                'relay_mask': self.controller.state.mask,
+                'active_mask': self.controller.active.mask,
+            }}
+
+        # Notaus läuft am Queue vorbei direkt im Verbindungs-Thread
+        if cmd == 'emergency_off':
+            return {'ok': True, 'result': self.emergency_off(*args)}
+
+        if cmd == 'emergency_release':
+            self.emergency_active = False
+            self.controller.emergency_release()
+            log.warning("🟢 Relais-Daemon: Notaus-Sperre aufgehoben")
+            return {'ok': True, 'result': True}
+
+        if cmd == 'get_emergency_status':
+            return {'ok': True, 'result': {
+                'active': self.emergency_active,
+                'history': list(self.emergency_log),
+            }}
+
+        if cmd.startswith('job_'):
+            return self._job_command(cmd, args)
+
+        # Busmetriken: reine Zählerabfrage, kein Bus-Verkehr
+        if cmd == 'get_metrics':
+            return {'ok': True, 'result': self.controller.buses.metrics_snapshot()}
+
+        if cmd == 'reset_metrics':
+            self.controller.buses.reset_metrics()
+            return {'ok': True, 'result': True}
+
+        # Ringpuffer-Log des Daemons (Frame-Traces usw.)
+        if cmd == 'get_log':
+            return {'ok': True, 'result': dump_log(*args)}
+
+        if cmd == 'get_snapshot':
+            max_age = float(args[0]) if args else RELAY_SNAPSHOT_MAX_AGE
+            snapshot = self.snapshot
+            if snapshot is None or time.monotonic() - snapshot['monotonic'] > max_age:
+                # Zu alt: frische Lesung über die Queue (gleichzeitige Anfragen teilen sich eine)
+                return self._enqueue('refresh_snapshot', [time.monotonic()])
+            return {'ok': True, 'result': self._snapshot_result(snapshot)}
+
+        if cmd not in DAEMON_COMMANDS:
+            return {'ok': False, 'error': f'Unbekannter Befehl: {cmd}'}
+
+        return self._enqueue(cmd, args)
+
+    def _job_command(self, cmd, args):
+        """Job-Verwaltung - läuft im Verbindungs-Thread, ohne Bus-Zugriff"""
+        try:
+            if cmd == 'job_submit':
+                job = self.jobs.submit(*args)
+                return {'ok': True, 'result': job.to_dict()}
+            if cmd == 'job_status':
+                job = self.jobs.get(args[0])
+                since = args[1] if len(args) > 1 else 0
+                return {'ok': True, 'result': job.to_dict(since) if job else None}
+            if cmd == 'job_wait':
+                return {'ok': True, 'result': self.jobs.wait(*args)}
+            if cmd == 'job_cancel':
+                return {'ok': True, 'result': self.jobs.cancel(args[0])}
+            if cmd == 'job_list':
+                return {'ok': True, 'result': self.jobs.list()}
+        except JobError as e:
+            return {'ok': False, 'error': str(e), 'code': e.code}
+        return {'ok': False, 'error': f'Unbekannter Befehl: {cmd}'}
+
+    def _bus_call(self, cmd, *args):
+        """Führt einen Befehl über die Queue aus (für Jobs) - RuntimeError bei Fehler"""
+        reply = self._enqueue(cmd, list(args))
+        if not reply.get('ok'):
+            raise RuntimeError(reply.get('error'))
+        return reply.get('result')
+
+    def _enqueue(self, cmd, args):
+        """Stellt einen Befehl in die Bus-Queue und wartet auf die Antwort"""
+        reply = {}
+        done = threading.Event()
+        self.command_queue.put((cmd, args, reply, done))
+        done.wait()
+        return reply
+
+    def _worker_loop(self):
+        """Einziger Thread mit Bus-Zugriff - arbeitet die Queue nacheinander ab"""
+        while True:
+            item = self.command_queue.get()
+            if item is None:
+                break
+
+            cmd, args, reply, done = item
+            if self.emergency_active and cmd in SWITCHING_COMMANDS:
+                reply['ok'] = False
+                reply['error'] = 'Notaus aktiv - Relais gesperrt'
+                done.set()
+                continue
+            try:
+                if cmd == 'set_multiple_relays' and args:
+                    args = [_int_keys(args[0])] + list(args[1:])
+                if cmd == 'refresh_snapshot':
+                    snapshot = self.snapshot
+                    # Wurde seit der Anfrage schon gelesen, reicht dieser Snapshot
+                    if snapshot is None or snapshot['monotonic'] < args[0]:
+                        snapshot = self._read_snapshot()
+                    reply['result'] = self._snapshot_result(snapshot) if snapshot else None
+                elif cmd == 'read_relay_mask':
+                    snapshot = self._read_snapshot()
+                    reply['result'] = snapshot['mask'] if snapshot else None
+                elif cmd == 'reset_all_relays' and self.emergency_active:
+                    # Normale FC15-Schreibbefehle sperrt der Bus im Notaus - Alle-AUS
+                    # erneut über die vorgefertigten Notaus-Frames senden
+                    reply['result'] = self.controller.emergency_off()[0]
+                else:
+                    reply['result'] = getattr(self.controller, cmd)(*args)
+                reply['ok'] = True
+            except Exception as e:
+                log.error(f"❌ Relais-Daemon: Fehler bei '{cmd}': {e}")
+                reply['ok'] = False
+                reply['error'] = str(e)
+            finally:
+                done.set()
+
+    def emergency_off(self, edge_time=None):
+        """
+        Schaltet sofort alle Relais aus, ohne auf die Queue zu warten
+
+        Args:
+            edge_time: Zeitpunkt der Notaus-Flanke (time.monotonic(), systemweit gleiche Uhr)
+
+        Returns:
+            dict mit Erfolg und gemessenen Latenzen in Millisekunden
+        """
+        self.emergency_active = True
+        start = time.monotonic()
+        success, first_tx_time, done_time = self.controller.emergency_off()
+
+        reference = edge_time if edge_time is not None else start
+        record = {
+            'timestamp': time.time(),
+            'success': success,
+            'edge_to_bus_ms': round((first_tx_time - reference) * 1000, 2) if first_tx_time else None,
+            'edge_to_done_ms': round((done_time - reference) * 1000, 2),
+            'edge_time_known': edge_time is not None,
+        }
+        self.emergency_log.append(record)
+
+        if success:
+            log.warning(f"🛑 NOTAUS: alle Relais aus - Flanke→Bus {record['edge_to_bus_ms']} ms, "
+                        f"fertig nach {record['edge_to_done_ms']} ms")
+        else:
+            log.critical(f"❌ NOTAUS: Abschalten nicht bestätigt ({record['edge_to_done_ms']} ms)")
+        return record
+
+    def _read_snapshot(self):
+        """Liest alle Module (nur im Worker-Thread aufrufen) und speichert den Snapshot"""
+        hardware_state = self.controller.read_relay_state()
+        if hardware_state is None:
+            return None
+        self.snapshot = {
+            'mask': hardware_state.mask,
+            'timestamp': time.time(),
+            'monotonic': time.monotonic(),
+        }
+        return self.snapshot
+
+    @staticmethod
+    def _snapshot_result(snapshot):
+        return {
+            'mask': snapshot['mask'],
+            'timestamp': snapshot['timestamp'],
+            'age': round(time.monotonic() - snapshot['monotonic'], 3),
+        }
+
+    def _poller_loop(self):
+        """Liest die Module periodisch, solange keine anderen Befehle anstehen"""
+        while not self.stop_event.wait(RELAY_SNAPSHOT_INTERVAL):
+            if not self.command_queue.empty():
+                # Bus ist beschäftigt - Prüfungsbefehle haben Vorrang
+                continue
+            self._enqueue('refresh_snapshot', [time.monotonic() - RELAY_SNAPSHOT_INTERVAL / 2])
+
+    def serve_forever(self):
+        """Startet Worker-Thread und Socket-Server (blockiert)"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        daemon = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                # Eine Verbindung kann beliebig viele Befehle nacheinander senden
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        response = daemon.submit(request.get('cmd'), request.get('args', []))
+                    except Exception as e:
+                        response = {'ok': False, 'error': str(e)}
+                    self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+
+        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self.worker_thread.start()
+
+        if RELAY_SNAPSHOT_INTERVAL > 0:
+            self.poller_thread = threading.Thread(target=self._poller_loop, daemon=True)
+            self.poller_thread.start()
+
+        socketserver.ThreadingUnixStreamServer.daemon_threads = True
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, RequestHandler)
+        log.info(f"✅ Relais-Daemon lauscht auf {self.socket_path} (PID {os.getpid()})")
+
+        try:
+            self.server.serve_forever()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stoppt Worker, schließt Bus und Socket"""
+        self.stop_event.set()
+        self.command_queue.put(None)
+        if self.worker_thread:
+            self.worker_thread.join(timeout=5)
+        if self.server:
+            self.server.server_close()
+        try:
+            self.controller.buses.close()
+        except Exception as e:
+            log.warning(f"⚠️ Relais-Daemon: Fehler beim Schließen der Busse: {e}")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        log.info("🛑 Relais-Daemon beendet")
+
+
+# ==================== CLIENT (WORKER-SEITE) ====================
+
+class RelayClient:
+    """
+    Stellvertreter für den RelayController in Web-Workern.
+    Gleiche Schnittstelle wie RelayController, alle Befehle laufen über den Daemon.
+    """
+
+    def __init__(self, socket_path=RELAY_DAEMON_SOCKET, timeout=RELAY_DAEMON_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        # Eine Verbindung pro Thread (Flask-Dev-Server ist multithreaded)
+        self._local = threading.local()
+
+    def _connect(self):
+        """Verbindet mit dem Daemon, startet ihn bei Bedarf"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            if not ensure_relay_daemon(self.socket_path):
+                raise
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+        self._local.sock = sock
+        self._local.rfile = sock.makefile('rb')
+        return sock
+
+    def _disconnect(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock:
+            try:
+                self._local.rfile.close()
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def _request(self, cmd, args):
+        """
+        Sendet einen Befehl an den Daemon und liefert die rohe Antwort
+
+        Returns:
+            Antwort-Dictionary {ok, result} / {ok, error} oder None wenn nicht erreichbar
+        """
+        payload = json.dumps({'cmd': cmd, 'args': list(args)}).encode('utf-8') + b'\n'
+        timeout = LONG_RUNNING_COMMANDS.get(cmd, self.timeout)
+
+        for attempt in range(2):
+            try:
+                sock = getattr(self._local, 'sock', None) or self._connect()
+                sock.settimeout(timeout)
+                sock.sendall(payload)
+                line = self._local.rfile.readline()
+                if not line:
+                    raise ConnectionError('Verbindung vom Daemon geschlossen')
+                return json.loads(line)
+
+            except (OSError, ConnectionError, ValueError) as e:
+                self._disconnect()
+                if attempt == 0 and not isinstance(e, socket.timeout):
+                    continue
+                log.error(f"❌ Relais-Daemon nicht erreichbar ({cmd}): {e}")
+                return None
+
+    def _call(self, cmd, *args, default=None):
+        """
+        Sendet einen Befehl an den Daemon
+
+        Args:
+            cmd: Befehlsname
+            *args: Argumente (JSON-serialisierbar)
+            default: Rückgabewert bei Kommunikations- oder Befehlsfehler
+
+        Returns:
+            Ergebnis des Befehls oder default
+        """
+        response = self._request(cmd, args)
+        if response is None:
+            return default
+        if not response.get('ok'):
+            log.error(f"❌ Relais-Daemon meldet Fehler bei '{cmd}': {response.get('error')}")
+            return default
+        return response.get('result')
+
+    # --- RelayController-Schnittstelle ---
+
+    def set_relay(self, relay_num, state):
+        return self._call('set_relay', relay_num, state, default=False)
+
+    def set_multiple_relays(self, relay_states_dict):
+        result = self._call('set_multiple_relays', relay_states_dict,
+                            default=[0, list(relay_states_dict.keys())])
+        return tuple(result)
+
+    def apply_scene(self, target_relays, force=False):
+        relays = list(target_relays)
+        result = self._call('apply_scene', relays, force, default=[[], relays])
+        return tuple(result)
+
+    def reset_all_relays(self):
+        return self._call('reset_all_relays', default=False)
+
+    def emergency_off(self, edge_time=None):
+        """Notaus: alle Relais sofort aus (am Befehls-Queue vorbei)"""
+        return self._call('emergency_off', edge_time)
+
+    def emergency_release(self):
+        return self._call('emergency_release', default=False)
+
+    def get_emergency_status(self):
+        return self._call('get_emergency_status', default={'active': False, 'history': []})
+
+    def get_bus_metrics(self):
+        """Modbus-Zähler und Latenzen pro Bus/Slave/Funktionscode (siehe bus_pool.BusPool.metrics_snapshot)"""
+        return self._call('get_metrics')
+
+    def reset_bus_metrics(self):
+        return self._call('reset_metrics', default=False)
+
+    def get_daemon_log(self, limit=200, level='DEBUG', logger=None):
+        """Einträge aus dem Log-Ringpuffer des Daemons (siehe log_buffer.dump_log)"""
+        return self._call('get_log', limit, level, logger)
+
+    # --- Hintergrund-Jobs ---
+
+    def submit_job(self, job_type, params=None):
+        """
+        Startet einen Job im Daemon
+
+        Returns:
+            (job_dict, None, None) oder (None, Fehlermeldung, Fehlerart) mit Fehlerart
+            'unknown_type', 'busy' (siehe relay_jobs.JobError) oder 'unreachable'
+        """
+        response = self._request('job_submit', [job_type, params or {}])
+        if response is None:
+            return None, 'Relais-Daemon nicht erreichbar', 'unreachable'
+        if not response.get('ok'):
+            return None, response.get('error'), response.get('code', 'error')
+        return response.get('result'), None, None
+
+    def get_job(self, job_id, since=0):
+        return self._call('job_status', job_id, since)
+
+    def wait_job(self, job_id, since=0, timeout=15.0):
+        """Wartet im Daemon auf neue Ereignisse (Long-Poll)"""
+        return self._call('job_wait', job_id, since, timeout)
+
+    def cancel_job(self, job_id):
+        return self._call('job_cancel', job_id, default=False)
+
+    def list_jobs(self):
+        return self._call('job_list', default=[])
+
+    def read_all_relay_status(self):
+        return _int_keys(self._call('read_all_relay_status'))
+
+    def read_relay_state(self):
+        mask = self._call('read_relay_mask')
+        return RelayState(mask) if mask is not None else None
+
+    def get_relay_snapshot(self, max_age=RELAY_SNAPSHOT_MAX_AGE):
+        """
+        Letzter Hardware-Snapshot des Daemons, frisch gelesen falls älter als max_age
+
+        Returns:
+            (RelayState, timestamp, age) oder None bei Fehler
+        """
+        snapshot = self._call('get_snapshot', max_age)
+        if not snapshot:
+            return None
+        return RelayState(snapshot['mask']), snapshot['timestamp'], snapshot['age']
+
+    def test_all_relays(self):
+        return self._call('test_all_relays', default=False)
+
+    def get_active_relays(self):
+        return self._call('get_active_relays', default=[])
+
+    def get_active_relays_normalized(self):
+        return self._call('get_active_relays_normalized', default=[])
+
+    def normalize_relay_to_group_representative(self, relay_num):
+        return self._call('normalize_relay_to_group_representative', relay_num, default=relay_num)
+
+    def get_relay_state(self, relay_num):
+        return self._call('get_relay_state', relay_num)
+
+    def get_all_relay_states(self):
+        return _int_keys(self._call('get_all_relay_states', default={}))
+
+    @property
+    def state(self):
+        """Zuletzt geschriebener Relais-Zustand als RelayState (aus dem Daemon-Cache)"""
+        return RelayState(self._call('get_state', default={}).get('relay_mask', 0))
+
+    @property
+    def active(self):
+        """Aktive Gruppen-Repräsentanten als RelayState"""
+        return RelayState(self._call('get_state', default={}).get('active_mask', 0))
+
+    @property
+    def active_relays(self):
+        return self.active.to_list()
+
+    @property
+    def relay_states(self):
+        state = self.state
+        return {module.index: state.to_bools(module.base_addr, module.num_coils)
+                for module in RELAY_LAYOUT.modules}
+
+
+# ==================== PROZESS-VERWALTUNG ====================
+
+_daemon_process = None
+
+
+def is_relay_daemon_running(socket_path=RELAY_DAEMON_SOCKET):
+    """Prüft per Ping, ob ein Daemon auf dem Socket antwortet"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1.0)
+            sock.connect(socket_path)
+            sock.sendall(b'{"cmd": "ping"}\n')
+            return sock.makefile('rb').readline().strip() != b''
+    except OSError:
+        return False
+
+
+def ensure_relay_daemon(socket_path=RELAY_DAEMON_SOCKET, startup_timeout=10.0):
+    """
+    Startet den Daemon, falls noch keiner läuft.
+    Ein Dateilock verhindert, dass mehrere Worker gleichzeitig einen Daemon starten.
+
+    Returns:
+        True wenn der Daemon erreichbar ist
+    """
+    global _daemon_process
+
+    if is_relay_daemon_running(socket_path):
+        return True
+
+    with open(socket_path + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Ein anderer Worker könnte ihn inzwischen gestartet haben
+            if is_relay_daemon_running(socket_path):
+                return True
+
+            log.info(f"🚀 Starte Relais-Daemon ({socket_path})...")
+            script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'relay_daemon.py')
+            _daemon_process = subprocess.Popen(
+                [sys.executable, script, '--socket', socket_path],
+                start_new_session=True
+            )
+
+            deadline = time.time() + startup_timeout
+            while time.time() < deadline:
+                if is_relay_daemon_running(socket_path):
+                    return True
+                if _daemon_process.poll() is not None:
+                    log.error(f"❌ Relais-Daemon beendet mit Code {_daemon_process.returncode}")
+                    return False
+                time.sleep(0.05)
+
+            log.error("❌ Relais-Daemon antwortet nicht")
+            return False
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def stop_relay_daemon():
+    """Beendet den Daemon, falls er von diesem Prozess gestartet wurde"""
+    global _daemon_process
+
+    if _daemon_process is not None and _daemon_process.poll() is None:
+        _daemon_process.terminate()
+        try:
+            _daemon_process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            _daemon_process.kill()
+        log.info("✅ Relais-Daemon gestoppt")
+    _daemon_process = None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VDE Messwand Relais-Daemon (Bus-Owner)')
+    parser.add_argument('--socket', default=RELAY_DAEMON_SOCKET, help='Pfad des Unix-Sockets')
+    args = parser.parse_args()
+
+    # SIGTERM sauber in SystemExit umwandeln, damit shutdown() läuft
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    daemon = RelayDaemon(socket_path=args.socket)
+    try:
+        daemon.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+
+if __name__ == '__main__':
+    main()
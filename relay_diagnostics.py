@@ -0,0 +1,146 @@
+"""
+VDE Messwand - Schnelle Relais-Diagnose mit Testmustern
+Statt jedes Relais einzeln zu schalten, werden ganze Muster per FC15 geschrieben und
+mit einem FC01 pro Modul zurückgelesen:
+
+- Walking-One:  je Schritt genau ein Coil pro Modul EIN  -> hängt AUS, Querverbindung
+- Walking-Zero: je Schritt genau ein Coil pro Modul AUS  -> hängt EIN, Querverbindung
+- Schachbrett:  0101... und 1010...                      -> benachbarte Coils
+
+Die Module werden parallel durchlaufen (Coil k auf allen Modulen gleichzeitig), weil
+sie unabhängige Geräte sind. Querverbindungen werden daher innerhalb eines Moduls zugeordnet.
+"""
+from relay_state import RelayState
+
+
+def _module_field(base_addr, num_coils):
+    return ((1 << num_coils) - 1) << base_addr
+
+
+def build_test_patterns(modules):
+    """
+    Erzeugt die Testmuster für alle Module
+
+    Args:
+        modules: Liste von (base_addr, num_coils) - globale Start-Adresse und Coils jedes Moduls
+
+    Returns:
+        Liste von (name, mask, kind, coil) - kind/coil nur bei Walking-Mustern gesetzt
+    """
+    all_on = 0
+    for base_addr, num_coils in modules:
+        all_on |= _module_field(base_addr, num_coils)
+    max_coils = max((num_coils for base_addr, num_coils in modules), default=0)
+
+    patterns = [('Alle AUS', 0, None, None), ('Alle EIN', all_on, None, None)]
+
+    # Kleinere Module sind ab ihrer letzten Coil in Walking-Mustern einfach AUS bzw. EIN
+    for coil in range(max_coils):
+        mask = 0
+        for base_addr, num_coils in modules:
+            if coil < num_coils:
+                mask |= 1 << (base_addr + coil)
+        patterns.append((f'Walking-One {coil}', mask, 'one', coil))
+
+    for coil in range(max_coils):
+        mask = all_on
+        for base_addr, num_coils in modules:
+            if coil < num_coils:
+                mask &= ~(1 << (base_addr + coil))
+        patterns.append((f'Walking-Zero {coil}', mask, 'zero', coil))
+
+    checker = int('01' * ((max_coils + 1) // 2), 2) if max_coils else 0
+    for name, bits in (('Schachbrett 0101', checker), ('Schachbrett 1010', ~checker)):
+        mask = 0
+        for base_addr, num_coils in modules:
+            mask |= (bits & ((1 << num_coils) - 1)) << base_addr
+        patterns.append((name, mask, None, None))
+
+    return patterns
+
+
+def analyze_results(results, modules):
+    """
+    Wertet die Rücklese-Ergebnisse aus und lokalisiert Fehler
+
+    Args:
+        results: Liste von (pattern, read_mask) mit pattern aus build_test_patterns()
+                 und read_mask = None wenn das Modul nicht lesbar war
+        modules: Liste von (base_addr, num_coils) wie bei build_test_patterns()
+
+    Returns:
+        dict mit stuck_on, stuck_off, cross_wired, mismatched_patterns, unreadable_patterns
+        und mismatches (pro abweichendem Muster: Name und abweichende Relais)
+    """
+    all_bits = 0
+    for base_addr, num_coils in modules:
+        all_bits |= _module_field(base_addr, num_coils)
+
+    # Pro Relais: wurde es je als 0 bzw. 1 geschrieben, und stimmte es dann jeweils nicht?
+    written_off = written_on = 0
+    read_wrong_off = all_bits  # Bit bleibt gesetzt, solange das Relais bei jedem "AUS" EIN war
+    read_wrong_on = all_bits   # Bit bleibt gesetzt, solange das Relais bei jedem "EIN" AUS war
+    mismatched = 0
+    mismatches = []
+    unreadable = 0
+
+    for (name, mask, kind, coil), read_mask in results:
+        if read_mask is None:
+            unreadable += 1
+            continue
+        if read_mask != mask:
+            mismatched += 1
+            mismatches.append({'pattern': name, 'relays': RelayState((mask ^ read_mask) & all_bits).to_list()})
+        off_bits = all_bits & ~mask
+        written_off |= off_bits
+        written_on |= mask
+        # Relais, die diesmal korrekt waren, sind nicht "immer falsch"
+        read_wrong_off &= ~(off_bits & ~read_mask)
+        read_wrong_on &= ~(mask & read_mask)
+
+    stuck_on = read_wrong_off & written_off
+    stuck_off = read_wrong_on & written_on
+
+    # Querverbindungen aus den Walking-Mustern: Abweichungen, die nicht durch Hängen erklärt sind
+    cross = {}
+    for (name, mask, kind, coil), read_mask in results:
+        if read_mask is None or kind is None:
+            continue
+        for base_addr, num_coils in modules:
+            if coil >= num_coils:
+                continue
+            field = _module_field(base_addr, num_coils)
+            driven = base_addr + coil
+            if kind == 'one':
+                # Andere Coils des Moduls wurden mit eingeschaltet
+                extra = read_mask & field & ~mask & ~stuck_on
+            else:
+                # Andere Coils des Moduls wurden mit ausgeschaltet
+                extra = ~read_mask & field & mask & ~stuck_off
+            if driven in RelayState(stuck_on | stuck_off):
+                continue
+            for affected in RelayState(extra):
+                cross.setdefault(driven, set()).add(affected)
+
+    return {
+        'stuck_on': RelayState(stuck_on).to_list(),
+        'stuck_off': RelayState(stuck_off).to_list(),
+        'cross_wired': [{'relay': relay, 'affects': sorted(affected)}
+                        for relay, affected in sorted(cross.items())],
+        'mismatched_patterns': mismatched,
+        'mismatches': mismatches,
+        'unreadable_patterns': unreadable,
+    }
+
+
+def report_to_failed_relays(report):
+    """Fehlerliste im Format des Testmodus: [{'relay': n, 'error': text}]"""
+    failed = []
+    for relay in report['stuck_on']:
+        failed.append({'relay': relay, 'error': 'Hängt EIN (lässt sich nicht ausschalten)'})
+    for relay in report['stuck_off']:
+        failed.append({'relay': relay, 'error': 'Hängt AUS (lässt sich nicht einschalten)'})
+    for entry in report['cross_wired']:
+        affected = ', '.join(str(relay) for relay in entry['affects'])
+        failed.append({'relay': entry['relay'], 'error': f'Querverbindung: schaltet Relais {affected} mit'})
+    return sorted(failed, key=lambda entry: entry['relay'])
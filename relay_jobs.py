@@ -0,0 +1,346 @@
+"""
+VDE Messwand - Hintergrund-Jobs im Relais-Daemon
+Lange Abläufe (z.B. Relais-Selbsttest) laufen im Bus-Owner-Prozess in einem eigenen Thread.
+Jeder Busbefehl eines Jobs geht einzeln durch die Befehls-Queue des Daemons, andere
+Befehle kommen also zwischen zwei Schritten dran. Web-Worker starten den Job und
+fragen danach nur noch Fortschritt/Ereignisse ab.
+"""
+import threading
+import time
+import uuid
+
+from relay_layout import RELAY_LAYOUT
+from relay_state import RelayState
+from relay_diagnostics import build_test_patterns, analyze_results, report_to_failed_relays
+from log_buffer import get_logger
+
+log = get_logger(__name__)
+
+# Anzahl abgeschlossener Jobs, die zum Abfragen aufgehoben werden
+JOB_HISTORY = 10
+
+# Endzustände eines Jobs
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+
+class JobError(Exception):
+    """Job kann nicht gestartet werden (unbekannter Typ, Bus belegt)"""
+    # Fehlerart für Aufrufer außerhalb des Daemons (wird mit der Antwort übertragen)
+    code = 'error'
+
+
+class UnknownJobType(JobError):
+    """Job-Typ ist nicht in JOB_TYPES"""
+    code = 'unknown_type'
+
+
+class JobBusy(JobError):
+    """Es läuft bereits ein Job"""
+    code = 'busy'
+
+
+class JobCancelled(Exception):
+    """Wird im Job-Thread ausgelöst, wenn der Job abgebrochen wurde"""
+
+
+class Job:
+    """Ein Hintergrund-Job mit fortlaufend nummerierten Ereignissen"""
+
+    def __init__(self, job_type, params, condition):
+        self.id = uuid.uuid4().hex[:8]
+        self.type = job_type
+        self.params = params or {}
+        self.state = 'queued'
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        # Gemeinsame Condition des JobManagers - weckt wartende Stream-Clients
+        self.condition = condition
+
+    def emit(self, event):
+        """Hängt ein Ereignis an (z.B. {'type': 'progress', ...}) und weckt Wartende"""
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def sleep(self, seconds):
+        """Abbrechbare Pause - löst JobCancelled aus, wenn der Job abgebrochen wurde"""
+        if self.cancel_event.wait(seconds):
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    @property
+    def is_finished(self):
+        return self.state in FINISHED_STATES
+
+    def to_dict(self, since=0):
+        """
+        Status für die API
+
+        Args:
+            since: Index des ersten Ereignisses, das mitgeliefert wird
+        """
+        return {
+            'id': self.id,
+            'type': self.type,
+            'params': self.params,
+            'state': self.state,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'result': self.result,
+            'error': self.error,
+            'events': self.events[since:],
+            'next': len(self.events),
+        }
+
+
+class JobManager:
+    """Startet Jobs, hält ihren Status und erlaubt Warten auf neue Ereignisse"""
+
+    def __init__(self, bus_call):
+        """
+        Args:
+            bus_call: bus_call(cmd, *args) führt einen RelayController-Befehl über die
+                      Daemon-Queue aus und gibt das Ergebnis zurück (RuntimeError bei Fehler)
+        """
+        self.bus_call = bus_call
+        self.jobs = {}
+        self.condition = threading.Condition()
+
+    def submit(self, job_type, params=None):
+        """
+        Startet einen neuen Job
+
+        Returns:
+            Job
+
+        Raises:
+            UnknownJobType: Unbekannter Typ
+            JobBusy: Es läuft bereits ein Job
+        """
+        runner = JOB_TYPES.get(job_type)
+        if runner is None:
+            raise UnknownJobType(f'Unbekannter Job-Typ: {job_type}')
+
+        with self.condition:
+            for job in self.jobs.values():
+                if not job.is_finished:
+                    raise JobBusy(f'Es läuft bereits ein Job ({job.type}, {job.id})')
+
+            job = Job(job_type, params, self.condition)
+            self.jobs[job.id] = job
+            self._prune()
+
+        thread = threading.Thread(target=self._run, args=(job, runner), daemon=True)
+        thread.start()
+        return job
+
+    def _run(self, job, runner):
+        job.state = 'running'
+        job.started = time.time()
+        log.info(f"▶️ Job {job.id} ({job.type}) gestartet")
+
+        try:
+            job.result = runner(job, self.bus_call)
+            job.state = 'done'
+        except JobCancelled:
+            job.state = 'cancelled'
+            job.emit({'type': 'cancelled'})
+        except Exception as e:
+            log.error(f"❌ Job {job.id} ({job.type}) fehlgeschlagen: {e}")
+            job.state = 'failed'
+            job.error = str(e)
+            job.emit({'type': 'error', 'error': str(e)})
+        finally:
+            job.finished = time.time()
+            with self.condition:
+                self.condition.notify_all()
+            log.info(f"⏹️ Job {job.id} ({job.type}) beendet: {job.state}")
+
+    def _prune(self):
+        """Verwirft die ältesten abgeschlossenen Jobs über JOB_HISTORY hinaus"""
+        finished = sorted((job for job in self.jobs.values() if job.is_finished),
+                          key=lambda job: job.created)
+        for job in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Bricht einen laufenden Job ab - False wenn unbekannt oder schon beendet"""
+        job = self.jobs.get(job_id)
+        if job is None or job.is_finished:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def wait(self, job_id, since=0, timeout=15.0):
+        """
+        Wartet bis neue Ereignisse ab Index since vorliegen oder der Job beendet ist
+
+        Returns:
+            Job-Dictionary (ab since) oder None wenn der Job unbekannt ist
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        with self.condition:
+            self.condition.wait_for(lambda: len(job.events) > since or job.is_finished, timeout)
+            return job.to_dict(since)
+
+    def list(self):
+        return [job.to_dict(len(job.events)) for job in
+                sorted(self.jobs.values(), key=lambda job: job.created, reverse=True)]
+
+
+# ==================== JOB-TYPEN ====================
+
+def run_relay_test(job, bus_call):
+    """
+    Visueller Relais-Test: jedes Relais einzeln ein, Readback, aus, Readback.
+    Pausen wie bisher im Testmodus, damit man die Relais klicken hört und sieht.
+    Ereignisse entsprechen denen von /run_test_stream.
+    """
+    relays = RELAY_LAYOUT.relays()
+    total = len(relays)
+    failed_relays = []
+    job.emit({'type': 'start', 'total': total})
+
+    try:
+        for done, relay in enumerate(relays, 1):
+            job.check_cancelled()
+
+            # Relais einschalten
+            job.emit({'type': 'testing', 'relay': relay, 'action': 'on'})
+
+            if not bus_call('set_relay', relay, True):
+                failed_relays.append({'relay': relay, 'error': 'Konnte nicht einschalten'})
+                job.emit({'type': 'error', 'relay': relay, 'error': 'Einschalten fehlgeschlagen'})
+                continue
+
+            job.sleep(1.0)
+
+            # Modbus-Readback prüfen ob Relais AN ist
+            mask = bus_call('read_relay_mask')
+            modbus_ok = mask is not None and relay in RelayState(mask)
+
+            job.emit({'type': 'status', 'relay': relay, 'modbus_ok': modbus_ok, 'state': 'on'})
+
+            if not modbus_ok:
+                failed_relays.append({'relay': relay, 'error': 'Modbus: Relais nicht AN'})
+
+            job.sleep(1.5)  # Grüne Anzeige länger sichtbar
+
+            # Relais ausschalten
+            job.emit({'type': 'testing', 'relay': relay, 'action': 'off'})
+
+            if not bus_call('set_relay', relay, False):
+                failed_relays.append({'relay': relay, 'error': 'Konnte nicht ausschalten'})
+
+            job.sleep(0.5)
+
+            # Modbus-Readback prüfen ob ALLE Relais AUS sind
+            mask = bus_call('read_relay_mask')
+            active_relays = RelayState(mask).to_list() if mask is not None else []
+
+            all_off_ok = mask is not None and not active_relays
+            job.emit({'type': 'all_off', 'modbus_ok': all_off_ok, 'active_relays': active_relays})
+
+            if not all_off_ok:
+                failed_relays.append({'relay': relay, 'error': f'Modbus: Relais noch aktiv: {active_relays}'})
+
+            job.sleep(1.5)  # Blaue Anzeige länger sichtbar
+
+            # Fortschritt
+            job.emit({'type': 'progress', 'relay': relay, 'done': done, 'total': total})
+
+    except JobCancelled:
+        # Abbruch mitten im Test: nichts eingeschaltet lassen
+        bus_call('reset_all_relays')
+        raise
+
+    success = len(failed_relays) == 0
+    job.emit({'type': 'complete', 'success': success, 'failed': failed_relays})
+    return {'success': success, 'failed': failed_relays}
+
+
+def run_fast_relay_test(job, bus_call):
+    """
+    Schnelle Diagnose: Walking-One/-Zero und Schachbrett per FC15, je Muster ein FC01 pro Modul.
+    Lokalisiert hängende und quer verbundene Coils in wenigen Sekunden statt Minuten.
+
+    Job-Parameter:
+        settle: Wartezeit in Sekunden zwischen Schreiben und Rücklesen (Standard: 0)
+    """
+    settle = float(job.params.get('settle', 0))
+    modules = [(module.base_addr, module.num_coils) for module in RELAY_LAYOUT.modules]
+    patterns = build_test_patterns(modules)
+    total = len(patterns)
+    results = []
+
+    job.emit({'type': 'start', 'total': total, 'mode': 'fast'})
+    start = time.monotonic()
+
+    try:
+        for index, pattern in enumerate(patterns):
+            job.check_cancelled()
+            name, mask, kind, coil = pattern
+
+            failed_mask = bus_call('write_relay_mask', mask)
+            if settle:
+                job.sleep(settle)
+            read_mask = bus_call('read_relay_mask')
+
+            # Module, die nicht geschrieben werden konnten, zählen als nicht lesbar
+            results.append((pattern, read_mask if not failed_mask else None))
+            job.emit({
+                'type': 'pattern',
+                'name': name,
+                'written': RelayState(mask).to_hex(RELAY_LAYOUT.total_relays),
+                'read': RelayState(read_mask).to_hex(RELAY_LAYOUT.total_relays) if read_mask is not None else None,
+                'ok': not failed_mask and read_mask == mask,
+            })
+            job.emit({'type': 'progress', 'done': index + 1, 'total': total})
+    finally:
+        # Nach Abbruch oder Busfehler nichts eingeschaltet lassen
+        try:
+            bus_call('reset_all_relays')
+        except RuntimeError as e:
+            log.warning(f"⚠️ Schnelltest: Reset nach Test fehlgeschlagen: {e}")
+
+    report = analyze_results(results, modules)
+    report['duration'] = round(time.monotonic() - start, 2)
+    failed_relays = report_to_failed_relays(report)
+    if report['unreadable_patterns']:
+        failed_relays.append({'relay': '-', 'error': f"{report['unreadable_patterns']} Muster nicht schreib-/lesbar (Busfehler)"})
+
+    # Abweichungen, die kein hängendes oder quer verbundenes Relais erklärt (z.B. sporadische
+    # Fehler), sind ebenfalls Fehler - jedes abweichende Muster zählt
+    explained = set(report['stuck_on']) | set(report['stuck_off'])
+    for entry in report['cross_wired']:
+        explained.add(entry['relay'])
+        explained.update(entry['affects'])
+    for mismatch in report['mismatches']:
+        if set(mismatch['relays']) - explained:
+            relays = ', '.join(str(relay) for relay in mismatch['relays'])
+            failed_relays.append({'relay': '-', 'error': f"Muster {mismatch['pattern']}: Relais {relays} weichen ab"})
+
+    success = not failed_relays
+    job.emit({'type': 'complete', 'success': success, 'failed': failed_relays, 'report': report})
+    return {'success': success, 'failed': failed_relays, 'report': report}
+
+
+# Registrierte Job-Typen: Name -> runner(job, bus_call)
+JOB_TYPES = {
+    'relay_test': run_relay_test,
+    'relay_test_fast': run_fast_relay_test,
+}
@@ -0,0 +1,136 @@
+"""
+VDE Messwand - Relais-Adressraum
+Leitet aus MODBUS_MODULES ab, welche globalen Relais-Nummern es gibt und auf welchem
+Modul/Coil sie liegen. Die Zuordnung wird einmal beim Import als Tabelle aufgebaut,
+ein Lookup ist danach ein Tupel-Index - unabhängig von der Anzahl der Module.
+"""
+from config import MODBUS_MODULES, SERIAL_PORT, BAUD_RATE
+
+# Relais pro Modul, wenn in MODBUS_MODULES kein num_coils angegeben ist
+DEFAULT_COILS_PER_MODULE = 32
+
+
+class ModuleInfo:
+    """Ein Relais-Modul auf dem Bus"""
+
+    __slots__ = ('index', 'slave_id', 'base_addr', 'num_coils', 'name', 'port', 'baud_rate', 'field')
+
+    def __init__(self, index, slave_id, base_addr, num_coils, name, port=SERIAL_PORT, baud_rate=BAUD_RATE):
+        self.index = index
+        self.slave_id = slave_id
+        self.base_addr = base_addr
+        self.num_coils = num_coils
+        self.name = name
+        # Serielle Schnittstelle (Bus), an der das Modul hängt
+        self.port = port
+        self.baud_rate = baud_rate
+        # Bits dieses Moduls in der globalen Bitmaske
+        self.field = ((1 << num_coils) - 1) << base_addr
+
+    @property
+    def relays(self):
+        return range(self.base_addr, self.base_addr + self.num_coils)
+
+    def to_dict(self):
+        return {
+            'index': self.index,
+            'slave_id': self.slave_id,
+            'base_addr': self.base_addr,
+            'num_coils': self.num_coils,
+            'name': self.name,
+            'port': self.port,
+            'baud_rate': self.baud_rate,
+        }
+
+
+class RelayLayout:
+    """Globale Relais-Nummern <-> (Modul, Coil) für alle konfigurierten Module"""
+
+    def __init__(self, modules_config):
+        """
+        Args:
+            modules_config: MODBUS_MODULES-Format
+                {module_idx: {'slave_id', 'base_addr', 'num_coils', 'name', 'port', 'baud_rate'}}
+
+        Raises:
+            ValueError: Überlappende Module, doppelte Slave-ID oder unterschiedliche Baudraten auf einem Bus
+        """
+        self.modules = []
+        for module_idx, module in sorted(modules_config.items()):
+            self.modules.append(ModuleInfo(
+                module_idx,
+                module['slave_id'],
+                module['base_addr'],
+                module.get('num_coils', DEFAULT_COILS_PER_MODULE),
+                module.get('name', f'Modul {module_idx + 1}'),
+                module.get('port', SERIAL_PORT),
+                module.get('baud_rate', BAUD_RATE),
+            ))
+
+        self.by_index = {module.index: module for module in self.modules}
+
+        # Module pro Bus in Konfigurationsreihenfolge {port: [ModuleInfo]}
+        self.buses = {}
+        for module in self.modules:
+            bus = self.buses.setdefault(module.port, [])
+            for other in bus:
+                if other.slave_id == module.slave_id:
+                    raise ValueError(f"Slave-ID {module.slave_id} ist auf {module.port} doppelt vergeben "
+                                     f"(Modul {other.index} und Modul {module.index})")
+                if other.baud_rate != module.baud_rate:
+                    raise ValueError(f"Unterschiedliche Baudraten auf {module.port} "
+                                     f"(Modul {other.index} und Modul {module.index})")
+            bus.append(module)
+        self.total_relays = max((module.base_addr + module.num_coils for module in self.modules), default=0)
+
+        # Tabelle relay_num -> (module_idx, local_coil, slave_id), None für Lücken
+        lookup = [None] * self.total_relays
+        for module in self.modules:
+            for coil in range(module.num_coils):
+                relay = module.base_addr + coil
+                if lookup[relay] is not None:
+                    raise ValueError(f"Relais {relay} liegt auf Modul {lookup[relay][0]} und Modul {module.index}")
+                lookup[relay] = (module.index, coil, module.slave_id)
+        self.lookup = tuple(lookup)
+
+        # Alle existierenden Relais als Bitmaske, Nummern und Anzahl
+        self.all_mask = 0
+        for module in self.modules:
+            self.all_mask |= module.field
+        self.relay_numbers = tuple(relay for relay, entry in enumerate(self.lookup) if entry is not None)
+        self.relay_count = len(self.relay_numbers)
+
+    def is_valid(self, relay_num):
+        """True, wenn die Relais-Nummer auf einem Modul liegt"""
+        return 0 <= relay_num < self.total_relays and self.lookup[relay_num] is not None
+
+    def locate(self, relay_num):
+        """
+        Returns:
+            (module_idx, local_coil, slave_id) oder None bei ungültiger Nummer
+        """
+        if 0 <= relay_num < self.total_relays:
+            return self.lookup[relay_num]
+        return None
+
+    def relays(self):
+        """Alle existierenden Relais-Nummern aufsteigend"""
+        return self.relay_numbers
+
+    def module_of(self, relay_num):
+        entry = self.locate(relay_num)
+        return self.by_index[entry[0]] if entry else None
+
+    def to_dict(self):
+        return {
+            'total_relays': self.total_relays,
+            'relay_count': self.relay_count,
+            'ports': list(self.buses),
+            'modules': [module.to_dict() for module in self.modules],
+        }
+
+
+RELAY_LAYOUT = RelayLayout(MODBUS_MODULES)
+
+# Anzahl globaler Relais-Nummern (0 .. TOTAL_RELAYS-1), Bitbreite aller Relais-Masken
+TOTAL_RELAYS = RELAY_LAYOUT.total_relays
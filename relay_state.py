@@ -0,0 +1,142 @@
+"""
+VDE Messwand - Relais-Zustand als Bitmaske
+Bit n = Relais n (global), kompakt für Cache, IPC und API
+"""
+
+
+class RelayState:
+    """
+    Unveränderlicher Relais-Zustand als Integer-Bitmaske.
+    Alle Operationen liefern neue Objekte, Vergleiche und Zählen sind O(1) bzw. O(Wortlänge).
+    """
+
+    __slots__ = ('mask',)
+
+    def __init__(self, mask=0):
+        self.mask = int(mask)
+
+    # --- Erzeugen ---
+
+    @classmethod
+    def from_relays(cls, relays):
+        """Aus Iterable von Relais-Nummern"""
+        mask = 0
+        for relay in relays:
+            mask |= 1 << relay
+        return cls(mask)
+
+    @classmethod
+    def from_bools(cls, states, offset=0):
+        """Aus Liste von Booleans (Index 0 = Relais offset)"""
+        mask = 0
+        for idx, state in enumerate(states):
+            if state:
+                mask |= 1 << idx
+        return cls(mask << offset)
+
+    @classmethod
+    def from_hex(cls, text):
+        """Aus Hex-String (siehe to_hex)"""
+        return cls(int(text, 16) if text else 0)
+
+    # --- Abfragen ---
+
+    def __contains__(self, relay):
+        return bool((self.mask >> relay) & 1)
+
+    def __iter__(self):
+        """Iteriert aufsteigend über die gesetzten Relais (nur gesetzte Bits)"""
+        mask = self.mask
+        while mask:
+            lowest = mask & -mask
+            yield lowest.bit_length() - 1
+            mask ^= lowest
+
+    def __len__(self):
+        return self.mask.bit_count()
+
+    def count(self):
+        """Anzahl aktiver Relais (Popcount)"""
+        return self.mask.bit_count()
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __eq__(self, other):
+        if isinstance(other, RelayState):
+            return self.mask == other.mask
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __repr__(self):
+        return f"RelayState({self.to_list()})"
+
+    # --- Verknüpfen ---
+
+    def __or__(self, other):
+        return RelayState(self.mask | other.mask)
+
+    def __and__(self, other):
+        return RelayState(self.mask & other.mask)
+
+    def __xor__(self, other):
+        return RelayState(self.mask ^ other.mask)
+
+    def __sub__(self, other):
+        return RelayState(self.mask & ~other.mask)
+
+    def with_relay(self, relay, state):
+        """Kopie mit einem geänderten Relais"""
+        if state:
+            return RelayState(self.mask | (1 << relay))
+        return RelayState(self.mask & ~(1 << relay))
+
+    def diff(self, previous):
+        """
+        Änderungen gegenüber einem vorherigen Zustand
+
+        Returns:
+            (turned_on, turned_off) als RelayState
+        """
+        changed = self.mask ^ previous.mask
+        return RelayState(changed & self.mask), RelayState(changed & previous.mask)
+
+    # --- Module ---
+
+    def module_mask(self, base_addr, num_coils):
+        """Bits eines Moduls (Coil 0 = Bit 0)"""
+        return (self.mask >> base_addr) & ((1 << num_coils) - 1)
+
+    def with_module_mask(self, base_addr, num_coils, bits):
+        """Kopie, in der die Bits eines Moduls ersetzt sind"""
+        field = ((1 << num_coils) - 1) << base_addr
+        return RelayState((self.mask & ~field) | ((bits << base_addr) & field))
+
+    # --- Ausgabe ---
+
+    def to_list(self):
+        """Sortierte Liste der aktiven Relais"""
+        return list(self)
+
+    def to_dict(self, total):
+        """Ausführliches Format {relay_num: state} für total Relais"""
+        mask = self.mask
+        return {relay: bool((mask >> relay) & 1) for relay in range(total)}
+
+    def to_bools(self, base_addr, num_coils):
+        """Liste von Booleans für ein Modul"""
+        bits = self.module_mask(base_addr, num_coils)
+        return [bool((bits >> coil) & 1) for coil in range(num_coils)]
+
+    def to_hex(self, total=None):
+        """
+        Kompaktes Wire-Format: Hex-String, 1 Zeichen pro 4 Relais (Relais 0 = niedrigstes Bit)
+
+        Args:
+            total: Anzahl Relais für die feste Stellenzahl (None = so kurz wie möglich)
+        """
+        if total is None:
+            total = max(self.mask.bit_length(), 1)
+        return format(self.mask, f'0{(total + 3) // 4}x')
@@ -0,0 +1,207 @@
+"""
+VDE Messwand - Retry-Strategien für den Modbus-Bus
+ModbusRTU fragt vor und während jeder Anfrage die Strategie: darf gesendet werden,
+wie viele Versuche, welche Bearbeitungszeit (Timeout) und welche Pause vor einer Wiederholung.
+
+- FixedRetryPolicy:    bisheriges Verhalten (3 Versuche, 0.15 s * Versuch, festes Timeout)
+- AdaptiveRetryPolicy: Fehlerrate der letzten Versuche pro Slave steuert Timeout und Pausen;
+                       nach mehreren fehlgeschlagenen Anfragen in Folge wird der Slave
+                       gesperrt (Circuit Breaker) und Anfragen schlagen sofort fehl.
+"""
+import collections
+import threading
+import time
+
+from config import (MODBUS_TURNAROUND_TIMEOUT, MODBUS_RETRY_POLICY, MODBUS_RETRY_ATTEMPTS,
+                    MODBUS_HEALTH_WINDOW, MODBUS_TURNAROUND_MAX, MODBUS_RETRY_BACKOFF_MIN,
+                    MODBUS_RETRY_BACKOFF_MAX, MODBUS_CIRCUIT_FAILURES, MODBUS_CIRCUIT_COOLDOWN)
+from log_buffer import get_logger
+
+log = get_logger(__name__)
+
+# Zustände des Circuit Breakers
+CIRCUIT_CLOSED = 'closed'        # Normalbetrieb
+CIRCUIT_OPEN = 'open'            # Slave gesperrt, Anfragen schlagen sofort fehl
+CIRCUIT_HALF_OPEN = 'half_open'  # Cooldown abgelaufen, ein Probe-Versuch erlaubt
+
+
+class FixedRetryPolicy:
+    """Feste Versuche und linear wachsende Pausen, kein Circuit Breaker"""
+
+    def __init__(self, attempts=MODBUS_RETRY_ATTEMPTS, backoff_step=0.15, turnaround=MODBUS_TURNAROUND_TIMEOUT):
+        self.attempts_per_request = attempts
+        self.backoff_step = backoff_step
+        self.base_turnaround = turnaround
+
+    def allow_request(self, slave_id):
+        return True
+
+    def attempts(self, slave_id):
+        return self.attempts_per_request
+
+    def turnaround(self, slave_id):
+        return self.base_turnaround
+
+    def backoff(self, slave_id, attempt):
+        return self.backoff_step * (attempt + 1)
+
+    def record_attempt(self, slave_id, ok):
+        pass
+
+    def record_request(self, slave_id, ok):
+        pass
+
+    def abort_request(self, slave_id):
+        pass
+
+    def snapshot(self):
+        return {'policy': 'fixed', 'slaves': {}}
+
+
+class SlaveHealth:
+    """Fehlerhistorie und Circuit-Zustand eines Slaves"""
+
+    __slots__ = ('window', 'errors', 'consecutive_failures', 'state', 'opened_at', 'open_count')
+
+    def __init__(self, window_size):
+        # True = Versuch fehlgeschlagen; errors = Anzahl True im Fenster
+        self.window = collections.deque(maxlen=window_size)
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.state = CIRCUIT_CLOSED
+        self.opened_at = 0.0
+        self.open_count = 0
+
+    @property
+    def error_rate(self):
+        return self.errors / len(self.window) if self.window else 0.0
+
+
+class AdaptiveRetryPolicy:
+    """
+    Passt Timeouts und Pausen an die beobachtete Fehlerrate pro Slave an.
+
+    Gesund (keine Fehler im Fenster): Basis-Bearbeitungszeit und kurze Pausen, ein
+    verlorener Frame kostet kaum Zeit. Häufen sich Fehler (z.B. Störungen, lange Leitung),
+    wachsen Bearbeitungszeit und Pausen bis MODBUS_TURNAROUND_MAX bzw.
+    MODBUS_RETRY_BACKOFF_MAX, damit sich der Bus beruhigen kann.
+    """
+
+    def __init__(self, attempts=MODBUS_RETRY_ATTEMPTS, window=MODBUS_HEALTH_WINDOW,
+                 turnaround=MODBUS_TURNAROUND_TIMEOUT, turnaround_max=MODBUS_TURNAROUND_MAX,
+                 backoff_min=MODBUS_RETRY_BACKOFF_MIN, backoff_max=MODBUS_RETRY_BACKOFF_MAX,
+                 circuit_failures=MODBUS_CIRCUIT_FAILURES, circuit_cooldown=MODBUS_CIRCUIT_COOLDOWN):
+        self.attempts_per_request = attempts
+        self.window_size = window
+        self.base_turnaround = turnaround
+        self.turnaround_max = max(turnaround_max, turnaround)
+        self.backoff_min = backoff_min
+        self.backoff_max = max(backoff_max, backoff_min)
+        self.circuit_failures = circuit_failures
+        self.circuit_cooldown = circuit_cooldown
+        self.slaves = {}
+        self.lock = threading.Lock()
+
+    def _health(self, slave_id):
+        health = self.slaves.get(slave_id)
+        if health is None:
+            health = self.slaves[slave_id] = SlaveHealth(self.window_size)
+        return health
+
+    def _severity(self, slave_id):
+        """0.0 = gesund ... 1.0 = jeder zweite Versuch oder mehr schlägt fehl"""
+        health = self.slaves.get(slave_id)
+        if health is None:
+            return 0.0
+        return min(1.0, health.error_rate * 2)
+
+    def allow_request(self, slave_id):
+        """
+        False, solange der Slave gesperrt ist. Nach dem Cooldown wird genau ein
+        Probe-Versuch durchgelassen (half_open).
+        """
+        with self.lock:
+            health = self._health(slave_id)
+            if health.state == CIRCUIT_CLOSED:
+                return True
+            if health.state == CIRCUIT_OPEN and time.monotonic() - health.opened_at >= self.circuit_cooldown:
+                health.state = CIRCUIT_HALF_OPEN
+                return True
+            return False
+
+    def attempts(self, slave_id):
+        health = self.slaves.get(slave_id)
+        if health is not None and health.state == CIRCUIT_HALF_OPEN:
+            # Probe: ein einzelner Versuch, kein teures Retry gegen ein totes Modul
+            return 1
+        return self.attempts_per_request
+
+    def turnaround(self, slave_id):
+        severity = self._severity(slave_id)
+        return self.base_turnaround + (self.turnaround_max - self.base_turnaround) * severity
+
+    def backoff(self, slave_id, attempt):
+        severity = self._severity(slave_id)
+        return (self.backoff_min + (self.backoff_max - self.backoff_min) * severity) * (attempt + 1)
+
+    def record_attempt(self, slave_id, ok):
+        """Ergebnis eines einzelnen Sendeversuchs (Fehlerrate)"""
+        with self.lock:
+            health = self._health(slave_id)
+            if len(health.window) == health.window.maxlen and health.window[0]:
+                health.errors -= 1
+            health.window.append(not ok)
+            if not ok:
+                health.errors += 1
+
+    def record_request(self, slave_id, ok):
+        """Ergebnis einer Anfrage nach allen Versuchen (Circuit Breaker)"""
+        with self.lock:
+            health = self._health(slave_id)
+            if ok:
+                if health.state != CIRCUIT_CLOSED:
+                    log.warning(f"🟢 Slave {slave_id} antwortet wieder - Sperre aufgehoben")
+                health.consecutive_failures = 0
+                health.state = CIRCUIT_CLOSED
+                return
+
+            health.consecutive_failures += 1
+            if health.state == CIRCUIT_HALF_OPEN or health.consecutive_failures >= self.circuit_failures:
+                if health.state == CIRCUIT_CLOSED:
+                    health.open_count += 1
+                    log.warning(f"🔌 Slave {slave_id} nicht erreichbar ({health.consecutive_failures} Anfragen "
+                                f"fehlgeschlagen) - gesperrt für {self.circuit_cooldown:.0f} s")
+                health.state = CIRCUIT_OPEN
+                health.opened_at = time.monotonic()
+
+    def abort_request(self, slave_id):
+        """Anfrage ohne Ergebnis abgebrochen (Notaus) - ein laufender Probe-Versuch wird freigegeben"""
+        with self.lock:
+            health = self._health(slave_id)
+            if health.state == CIRCUIT_HALF_OPEN:
+                health.state = CIRCUIT_OPEN
+
+    def snapshot(self):
+        """Zustand pro Slave für Metriken/Admin-API"""
+        with self.lock:
+            slaves = {}
+            for slave_id, health in sorted(self.slaves.items()):
+                slaves[slave_id] = {
+                    'state': health.state,
+                    'error_rate': round(health.error_rate, 3),
+                    'consecutive_failures': health.consecutive_failures,
+                    'open_count': health.open_count,
+                    'retry_in': (round(max(0.0, self.circuit_cooldown - (time.monotonic() - health.opened_at)), 1)
+                                 if health.state == CIRCUIT_OPEN else None),
+                }
+        for slave_id, entry in slaves.items():
+            entry['turnaround'] = round(self.turnaround(slave_id), 3)
+            entry['backoff'] = round(self.backoff(slave_id, 0), 3)
+        return {'policy': 'adaptive', 'slaves': slaves}
+
+
+def create_retry_policy(name=MODBUS_RETRY_POLICY):
+    """Retry-Strategie nach Namen aus der Konfiguration ('adaptive' oder 'fixed')"""
+    if name == 'fixed':
+        return FixedRetryPolicy()
+    return AdaptiveRetryPolicy()
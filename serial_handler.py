@@ -37,30 +37,52 @@ def create_dummy_serial():
         SerialTimeoutException = Exception
         
         class Serial:
-            def __init__(self, port=None, baudrate=9600, **kwargs):
+            """Verbindet sich mit einem In-Process-Modbus-Simulator (modbus_simulator.py)"""
+
+            def __init__(self, port=None, baudrate=9600, timeout=None, **kwargs):
                 print(f"🔧 DummySerial: Simulating connection to {port} at {baudrate} baud")
+                # Import erst hier: modbus_simulator braucht modbus_controller, das dieses Modul importiert
+                from modbus_simulator import open_simulated_serial
                 self.port = port
                 self.baudrate = baudrate
-                self.is_open = True
-                self.in_waiting = 0
+                self.transport = open_simulated_serial(port or 'dummy', baudrate, timeout)
+
+            @property
+            def is_open(self):
+                return self.transport.is_open
+
+            @property
+            def timeout(self):
+                return self.transport.timeout
+
+            @timeout.setter
+            def timeout(self, value):
+                self.transport.timeout = value
+
+            @property
+            def in_waiting(self):
+                return self.transport.in_waiting
             
             def write(self, data):
-                return len(data) if data else 0
+                return self.transport.write(data) if data else 0
             
-            def read(self, size):
-                return b'\x01\x05\x00\x00\xFF\x00\x8C\x3A'[:size]
+            def read(self, size=1):
+                return self.transport.read(size)
+
+            def readinto(self, buffer):
+                return self.transport.readinto(buffer)
             
             def flush(self):
-                pass
+                self.transport.flush()
             
             def reset_input_buffer(self):
-                pass
+                self.transport.reset_input_buffer()
             
             def reset_output_buffer(self):
-                pass
+                self.transport.reset_output_buffer()
             
             def close(self):
-                self.is_open = False
+                self.transport.close()
     
     serial = DummySerial()
     SERIAL_AVAILABLE = False
@@ -2,10 +2,10 @@
 VDE Messwand - Einstellungs-Verwaltung
 Ermöglicht das Ändern von Admin-Code und anderen Einstellungen
 """
-import json
-import os
 from typing import Tuple
 
+from config_store import register_document
+
 SETTINGS_FILE = 'settings.json'
 
 def get_default_settings():
@@ -19,41 +19,34 @@ def get_default_settings():
         'exam_allowed_stromkreise': []  # Erlaubte Stromkreis-IDs (leer = alle)
     }
 
+def _with_defaults(settings):
+    """Sicherstellen, dass alle erforderlichen Keys existieren"""
+    for key, value in get_default_settings().items():
+        if key not in settings:
+            settings[key] = value
+    return settings
+
+_settings_document = register_document('settings', SETTINGS_FILE, default=get_default_settings,
+                                       normalize=_with_defaults)
+
 def load_settings():
-    """Lädt Einstellungen aus JSON-Datei"""
-    if os.path.exists(SETTINGS_FILE):
-        try:
-            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                settings = json.load(f)
-                # Sicherstellen, dass alle erforderlichen Keys existieren
-                defaults = get_default_settings()
-                for key, value in defaults.items():
-                    if key not in settings:
-                        settings[key] = value
-                return settings
-        except Exception as e:
-            print(f"Fehler beim Laden der Einstellungen: {e}")
-            return get_default_settings()
-    else:
+    """Lädt Einstellungen (aus dem Konfigurations-Speicher, Kopie zum Bearbeiten)"""
+    if not _settings_document.exists:
         # Erstelle Datei mit Standardwerten
-        settings = get_default_settings()
-        save_settings(settings)
-        return settings
+        save_settings(get_default_settings())
+    return _settings_document.copy()
 
 def save_settings(settings: dict) -> bool:
-    """Speichert Einstellungen in JSON-Datei"""
-    try:
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, indent=2, ensure_ascii=False)
-        return True
-    except Exception as e:
-        print(f"Fehler beim Speichern der Einstellungen: {e}")
-        return False
+    """Speichert Einstellungen in JSON-Datei (mit load_settings() in _settings_document.transaction())"""
+    return _settings_document.save(settings)
+
+def _setting(key, default):
+    """Einzelne Einstellung ohne Kopie des ganzen Dokuments"""
+    return _settings_document.get(key, default)
 
 def get_admin_code() -> str:
     """Gibt den aktuellen Admin-Code zurück"""
-    settings = load_settings()
-    return settings.get('admin_code', '1234')
+    return _setting('admin_code', '1234')
 
 def set_admin_code(new_code: str) -> Tuple[bool, str]:
     """
@@ -79,12 +72,13 @@ def set_admin_code(new_code: str) -> Tuple[bool, str]:
     if not new_code.isdigit():
         return False, "Code darf nur aus Ziffern bestehen"
 
-    # Einstellungen laden
-    settings = load_settings()
-    settings['admin_code'] = new_code
+    # Einstellungen laden und speichern (ohne Änderung eines anderen Workers dazwischen)
+    with _settings_document.transaction():
+        settings = load_settings()
+        settings['admin_code'] = new_code
+        saved = save_settings(settings)
 
-    # Speichern
-    if save_settings(settings):
+    if saved:
         return True, "Admin-Code erfolgreich geändert"
     else:
         return False, "Fehler beim Speichern des Codes"
@@ -105,8 +99,7 @@ def verify_admin_code(code: str) -> bool:
 
 def get_wallbox_installed() -> bool:
     """Gibt zurück ob eine Wallbox vorhanden/installiert ist"""
-    settings = load_settings()
-    return settings.get('wallbox_installed', False)
+    return _setting('wallbox_installed', False)
 
 
 def set_wallbox_installed(installed: bool) -> Tuple[bool, str]:
@@ -119,10 +112,12 @@ def set_wallbox_installed(installed: bool) -> Tuple[bool, str]:
     Returns:
         Tuple[bool, str]: (Erfolg, Nachricht)
     """
-    settings = load_settings()
-    settings['wallbox_installed'] = installed
+    with _settings_document.transaction():
+        settings = load_settings()
+        settings['wallbox_installed'] = installed
+        saved = save_settings(settings)
 
-    if save_settings(settings):
+    if saved:
         status = "vorhanden" if installed else "nicht vorhanden"
         return True, f"Wallbox als {status} markiert"
     else:
@@ -131,8 +126,7 @@ def set_wallbox_installed(installed: bool) -> Tuple[bool, str]:
 
 def get_wallbox_enabled() -> bool:
     """Gibt zurück ob der Wallbox-Stromkreis aktiviert ist"""
-    settings = load_settings()
-    return settings.get('wallbox_enabled', True)
+    return _setting('wallbox_enabled', True)
 
 
 def set_wallbox_enabled(enabled: bool) -> Tuple[bool, str]:
@@ -145,10 +139,12 @@ def set_wallbox_enabled(enabled: bool) -> Tuple[bool, str]:
     Returns:
         Tuple[bool, str]: (Erfolg, Nachricht)
     """
-    settings = load_settings()
-    settings['wallbox_enabled'] = enabled
+    with _settings_document.transaction():
+        settings = load_settings()
+        settings['wallbox_enabled'] = enabled
+        saved = save_settings(settings)
 
-    if save_settings(settings):
+    if saved:
         status = "aktiviert" if enabled else "deaktiviert"
         return True, f"Wallbox-Stromkreis {status}"
     else:
@@ -157,11 +153,10 @@ def set_wallbox_enabled(enabled: bool) -> Tuple[bool, str]:
 
 def get_exam_settings() -> dict:
     """Gibt alle Prüfungs-Einstellungen zurück"""
-    settings = load_settings()
     return {
-        'exam_error_count': settings.get('exam_error_count', 3),
-        'exam_duration_minutes': settings.get('exam_duration_minutes', 20),
-        'exam_allowed_stromkreise': settings.get('exam_allowed_stromkreise', [])
+        'exam_error_count': _setting('exam_error_count', 3),
+        'exam_duration_minutes': _setting('exam_duration_minutes', 20),
+        'exam_allowed_stromkreise': list(_setting('exam_allowed_stromkreise', []))
     }
 
 
@@ -172,12 +167,14 @@ def set_exam_settings(error_count: int, duration_minutes: int, allowed_stromkrei
     if duration_minutes < 1:
         return False, "Mindestens 1 Minute erforderlich"
 
-    settings = load_settings()
-    settings['exam_error_count'] = int(error_count)
-    settings['exam_duration_minutes'] = int(duration_minutes)
-    settings['exam_allowed_stromkreise'] = [str(s) for s in allowed_stromkreise]
+    with _settings_document.transaction():
+        settings = load_settings()
+        settings['exam_error_count'] = int(error_count)
+        settings['exam_duration_minutes'] = int(duration_minutes)
+        settings['exam_allowed_stromkreise'] = [str(s) for s in allowed_stromkreise]
+        saved = save_settings(settings)
 
-    if save_settings(settings):
+    if saved:
         return True, "Prüfungs-Einstellungen gespeichert"
     else:
         return False, "Fehler beim Speichern"
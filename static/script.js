@@ -232,7 +232,7 @@ function runTest() {
     })
     .then(data => {
         if (data.success) {
-            showMessage('Relais-Test erfolgreich abgeschlossen!', 'success');
+            showMessage(`Relais-Test läuft im Hintergrund (Job ${data.job_id})`, 'success');
         } else {
             showMessage(`Fehler beim Test: ${data.error}`, 'error');
         }
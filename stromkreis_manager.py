@@ -1,36 +1,99 @@
 """
 VDE Messwand - Stromkreis-Verwaltung
 Backend-Funktionen für dynamische Stromkreis-Verwaltung
+Stromkreise und Kategorien liegen in den Tabellen stromkreise und kategorien,
+stromkreise.json / kategorien.json sind Import-Quelle und Backup (siehe config_db).
 """
 import json
-import os
+
+from config_db import register_table
+from config_store import register_document
+from relay_layout import RELAY_LAYOUT
 
 STROMKREISE_FILE = 'stromkreise.json'
 KATEGORIEN_FILE = 'kategorien.json'
 
+STROMKREISE_SCHEMA = [
+    # relays: alte Relais-Zuordnung als JSON-Liste (nur Rückwärtskompatibilität, sonst NULL)
+    '''
+    CREATE TABLE IF NOT EXISTS stromkreise (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        description TEXT NOT NULL DEFAULT '',
+        relays TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_stromkreise_name ON stromkreise (name COLLATE NOCASE)',
+]
+
+KATEGORIEN_SCHEMA = [
+    # position: Reihenfolge wie in kategorien.json
+    '''
+    CREATE TABLE IF NOT EXISTS kategorien (
+        position INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''',
+]
+
+
+def _import_stromkreise(conn, stromkreise):
+    """Übernimmt stromkreise.json in die Tabelle"""
+    conn.executemany('INSERT OR REPLACE INTO stromkreise (id, name, description, relays) VALUES (?, ?, ?, ?)',
+                     [(int(sk_id), sk_data.get('name', '').strip(), sk_data.get('description', ''),
+                       json.dumps(sk_data['relays']) if 'relays' in sk_data else None)
+                      for sk_id, sk_data in stromkreise.items()])
+
+
+def _read_stromkreise(conn):
+    """Alle Stromkreise {id: {name, description[, relays]}} (int-Keys)"""
+    stromkreise = {}
+    for sk_id, name, description, relays in conn.execute(
+            'SELECT id, name, description, relays FROM stromkreise ORDER BY id'):
+        stromkreise[sk_id] = {'name': name, 'description': description}
+        if relays is not None:
+            stromkreise[sk_id]['relays'] = json.loads(relays)
+    return stromkreise
+
+
+def _export_stromkreise(conn):
+    """Tabelle im Format von stromkreise.json (String-Keys)"""
+    return {str(sk_id): sk_data for sk_id, sk_data in _read_stromkreise(conn).items()}
+
+
+def _import_kategorien(conn, kategorien):
+    """Übernimmt kategorien.json in die Tabelle (doppelte Namen einmal)"""
+    conn.executemany('INSERT OR IGNORE INTO kategorien (name) VALUES (?)', [(name,) for name in kategorien])
+
+
+def _export_kategorien(conn):
+    """Tabelle im Format von kategorien.json (Liste in Original-Reihenfolge)"""
+    return [name for name, in conn.execute('SELECT name FROM kategorien ORDER BY position')]
+
+
+# JSON-Dateien: Import-Quelle beim ersten Start und Backup jeder Änderung
+_stromkreise_document = register_document('stromkreise', STROMKREISE_FILE)
+_kategorien_document = register_document('kategorien', KATEGORIEN_FILE, default=list)
+_stromkreise_table = register_table(_stromkreise_document, STROMKREISE_SCHEMA,
+                                    _import_stromkreise, _export_stromkreise)
+_kategorien_table = register_table(_kategorien_document, KATEGORIEN_SCHEMA,
+                                   _import_kategorien, _export_kategorien)
+
 
 def load_stromkreise_from_file():
     """
-    Lädt Stromkreise aus JSON-Datei
+    Lädt Stromkreise aus der Datenbank
 
     Returns:
         Dictionary mit Stromkreisen (int-Keys)
     """
-    if os.path.exists(STROMKREISE_FILE):
-        try:
-            with open(STROMKREISE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # String-Keys aus JSON zu int konvertieren
-                return {int(k): v for k, v in data.items()}
-        except Exception as e:
-            print(f"Error loading stromkreise: {e}")
-            return {}
-    return {}
+    with _stromkreise_table.transaction() as conn:
+        return _read_stromkreise(conn)
 
 
 def save_stromkreise_to_file(stromkreise):
     """
-    Speichert Stromkreise in JSON-Datei
+    Ersetzt alle Stromkreise (eine Transaktion)
 
     Args:
         stromkreise: Dictionary mit Stromkreisen
@@ -39,9 +102,10 @@ def save_stromkreise_to_file(stromkreise):
         True bei Erfolg, False bei Fehler
     """
     try:
-        with open(STROMKREISE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(stromkreise, f, indent=2, ensure_ascii=False)
-        print(f"✓ Stromkreise saved to {STROMKREISE_FILE}")
+        with _stromkreise_table.transaction(write=True) as conn:
+            conn.execute('DELETE FROM stromkreise')
+            _import_stromkreise(conn, stromkreise)
+        print(f"✓ Stromkreise saved ({len(stromkreise)} Einträge)")
         return True
     except Exception as e:
         print(f"Error saving stromkreise: {e}")
@@ -50,7 +114,7 @@ def save_stromkreise_to_file(stromkreise):
 
 def get_all_stromkreise():
     """
-    Gibt alle definierten Stromkreise zurück (aus stromkreise.json)
+    Gibt alle definierten Stromkreise zurück
 
     Returns:
         Dictionary mit allen Stromkreisen
@@ -72,33 +136,29 @@ def add_stromkreis(name, description=''):
     if not name or not name.strip():
         return False, "Name darf nicht leer sein", None
 
-    # Lade bestehende File-Stromkreise
-    stromkreise = load_stromkreise_from_file()
-
-    # Prüfe ob Name bereits vergeben
-    for sk_data in stromkreise.values():
-        if sk_data['name'].strip().lower() == name.strip().lower():
-            return False, f"Stromkreis '{name}' existiert bereits", None
-
-    # Finde nächste freie ID
-    existing_ids = set(stromkreise.keys())
-
-    new_id = 1
-    while new_id in existing_ids:
-        new_id += 1
-
-    # Füge neuen Stromkreis hinzu
-    stromkreise[new_id] = {
-        'name': name.strip(),
-        'description': description.strip()
-    }
-
-    # Speichern
-    if save_stromkreise_to_file(stromkreise):
-        return True, f"Stromkreis '{name}' erfolgreich erstellt", new_id
-    else:
+    try:
+        with _stromkreise_table.transaction(write=True) as conn:
+            # Prüfe ob Name bereits vergeben (Index mit NOCASE)
+            if conn.execute('SELECT 1 FROM stromkreise WHERE name = ? COLLATE NOCASE',
+                            (name.strip(),)).fetchone():
+                return False, f"Stromkreis '{name}' existiert bereits", None
+
+            # Finde nächste freie ID
+            existing_ids = {sk_id for sk_id, in conn.execute('SELECT id FROM stromkreise')}
+
+            new_id = 1
+            while new_id in existing_ids:
+                new_id += 1
+
+            # Füge neuen Stromkreis hinzu
+            conn.execute('INSERT INTO stromkreise (id, name, description) VALUES (?, ?, ?)',
+                         (new_id, name.strip(), description.strip()))
+    except Exception as e:
+        print(f"Error adding stromkreis: {e}")
         return False, "Fehler beim Speichern", None
 
+    return True, f"Stromkreis '{name}' erfolgreich erstellt", new_id
+
 
 def update_stromkreis(stromkreis_id, name, description=''):
     """
@@ -112,30 +172,27 @@ def update_stromkreis(stromkreis_id, name, description=''):
     Returns:
         (success, message)
     """
-    stromkreise = load_stromkreise_from_file()
-
     try:
         stromkreis_id = int(stromkreis_id)
     except:
         return False, "Ungültige Stromkreis-ID"
 
-    if stromkreis_id not in stromkreise:
-        return False, "Stromkreis nicht gefunden"
-
     if not name or not name.strip():
         return False, "Name darf nicht leer sein"
 
-    # Update (relays-Feld beibehalten falls vorhanden, für Rückwärtskompatibilität)
-    stromkreise[stromkreis_id] = {
-        'name': name.strip(),
-        'description': description.strip()
-    }
-
-    if save_stromkreise_to_file(stromkreise):
-        return True, f"Stromkreis '{name}' erfolgreich aktualisiert"
-    else:
+    try:
+        with _stromkreise_table.transaction(write=True) as conn:
+            # Update (relays-Feld beibehalten falls vorhanden, für Rückwärtskompatibilität)
+            cursor = conn.execute('UPDATE stromkreise SET name = ?, description = ? WHERE id = ?',
+                                  (name.strip(), description.strip(), stromkreis_id))
+            if cursor.rowcount == 0:
+                return False, "Stromkreis nicht gefunden"
+    except Exception as e:
+        print(f"Error updating stromkreis: {e}")
         return False, "Fehler beim Speichern"
 
+    return True, f"Stromkreis '{name}' erfolgreich aktualisiert"
+
 
 def delete_stromkreis(stromkreis_id):
     """
@@ -147,24 +204,24 @@ def delete_stromkreis(stromkreis_id):
     Returns:
         (success, message)
     """
-    stromkreise = load_stromkreise_from_file()
-
     try:
         stromkreis_id = int(stromkreis_id)
     except:
         return False, "Ungültige Stromkreis-ID"
 
-    if stromkreis_id not in stromkreise:
-        return False, "Stromkreis nicht gefunden"
-
-    stromkreis_name = stromkreise[stromkreis_id]['name']
-    del stromkreise[stromkreis_id]
-
-    if save_stromkreise_to_file(stromkreise):
-        return True, f"Stromkreis '{stromkreis_name}' erfolgreich gelöscht"
-    else:
+    try:
+        with _stromkreise_table.transaction(write=True) as conn:
+            row = conn.execute('SELECT name FROM stromkreise WHERE id = ?', (stromkreis_id,)).fetchone()
+            if row is None:
+                return False, "Stromkreis nicht gefunden"
+            stromkreis_name = row[0]
+            conn.execute('DELETE FROM stromkreise WHERE id = ?', (stromkreis_id,))
+    except Exception as e:
+        print(f"Error deleting stromkreis: {e}")
         return False, "Fehler beim Speichern"
 
+    return True, f"Stromkreis '{stromkreis_name}' erfolgreich gelöscht"
+
 
 def get_stromkreis_statistics():
     """
@@ -186,7 +243,7 @@ def get_stromkreis_statistics():
         'total_stromkreise': len(stromkreise),
         'total_relay_assignments': total_relays,
         'unique_covered_relays': len(covered_relays),
-        'uncovered_relays': 64 - len(covered_relays),
+        'uncovered_relays': RELAY_LAYOUT.relay_count - len(covered_relays),
         'stromkreise': stromkreise
     }
 
@@ -195,24 +252,17 @@ def get_stromkreis_statistics():
 
 def load_kategorien_from_file():
     """
-    Lädt Kategorien aus JSON-Datei
+    Lädt Kategorien aus der Datenbank
 
     Returns:
         Liste von Kategorien
     """
-    if os.path.exists(KATEGORIEN_FILE):
-        try:
-            with open(KATEGORIEN_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading kategorien: {e}")
-            return []
-    return []
+    return _kategorien_table.export()
 
 
 def save_kategorien_to_file(kategorien):
     """
-    Speichert Kategorien in JSON-Datei
+    Ersetzt alle Kategorien (eine Transaktion)
 
     Args:
         kategorien: Liste von Kategorien
@@ -221,9 +271,10 @@ def save_kategorien_to_file(kategorien):
         True bei Erfolg, False bei Fehler
     """
     try:
-        with open(KATEGORIEN_FILE, 'w', encoding='utf-8') as f:
-            json.dump(kategorien, f, indent=2, ensure_ascii=False)
-        print(f"✓ Kategorien saved to {KATEGORIEN_FILE}")
+        with _kategorien_table.transaction(write=True) as conn:
+            conn.execute('DELETE FROM kategorien')
+            _import_kategorien(conn, kategorien)
+        print(f"✓ Kategorien saved ({len(kategorien)} Einträge)")
         return True
     except Exception as e:
         print(f"Error saving kategorien: {e}")
@@ -232,14 +283,13 @@ def save_kategorien_to_file(kategorien):
 
 def get_all_kategorien():
     """
-    Gibt alle verfügbaren Kategorien zurück (aus kategorien.json)
+    Gibt alle verfügbaren Kategorien zurück
 
     Returns:
         Liste von Kategorien
     """
-    kategorien = load_kategorien_from_file()
-    kategorien.sort()
-    return kategorien
+    with _kategorien_table.transaction() as conn:
+        return [name for name, in conn.execute('SELECT name FROM kategorien ORDER BY name')]
 
 
 def add_kategorie(name):
@@ -257,20 +307,18 @@ def add_kategorie(name):
 
     name = name.strip()
 
-    # Prüfe ob bereits vorhanden
-    all_kategorien = get_all_kategorien()
-    if name in all_kategorien:
-        return False, f"Kategorie '{name}' existiert bereits"
-
-    # Lade custom kategorien
-    kategorien = load_kategorien_from_file()
-    kategorien.append(name)
-
-    if save_kategorien_to_file(kategorien):
-        return True, f"Kategorie '{name}' erfolgreich erstellt"
-    else:
+    try:
+        with _kategorien_table.transaction(write=True) as conn:
+            # Prüfe ob bereits vorhanden (UNIQUE-Index)
+            if conn.execute('SELECT 1 FROM kategorien WHERE name = ?', (name,)).fetchone():
+                return False, f"Kategorie '{name}' existiert bereits"
+            conn.execute('INSERT INTO kategorien (name) VALUES (?)', (name,))
+    except Exception as e:
+        print(f"Error adding kategorie: {e}")
         return False, "Fehler beim Speichern"
 
+    return True, f"Kategorie '{name}' erfolgreich erstellt"
+
 
 def delete_kategorie(name):
     """
@@ -282,14 +330,12 @@ def delete_kategorie(name):
     Returns:
         (success, message)
     """
-    kategorien = load_kategorien_from_file()
-
-    if name not in kategorien:
-        return False, "Kategorie nicht gefunden"
-
-    kategorien.remove(name)
-
-    if save_kategorien_to_file(kategorien):
-        return True, f"Kategorie '{name}' erfolgreich gelöscht"
-    else:
+    try:
+        with _kategorien_table.transaction(write=True) as conn:
+            if conn.execute('DELETE FROM kategorien WHERE name = ?', (name,)).rowcount == 0:
+                return False, "Kategorie nicht gefunden"
+    except Exception as e:
+        print(f"Error deleting kategorie: {e}")
         return False, "Fehler beim Speichern"
+
+    return True, f"Kategorie '{name}' erfolgreich gelöscht"
@@ -0,0 +1,72 @@
+"""
+Gemeinsame Fixtures der Tests - alle Busse laufen über den In-Process-Simulator (sim://)
+"""
+import itertools
+import os
+import sys
+
+import pytest
+
+# Module liegen flach im Projektverzeichnis
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from relay_layout import RelayLayout, RELAY_LAYOUT  # noqa: E402
+
+# Schnell getakteter, fehlerfreier Simulator: 115200 Baud, Slaves ohne Bearbeitungszeit
+TEST_BAUDRATE = 115200
+_port_numbers = itertools.count()
+
+
+def _reset_config_cache():
+    """Verbindung, Tabellen-Import, geladene Dokumente und abgeleitete Stände verwerfen (nach Verzeichniswechsel)"""
+    import config_db
+    from config_store import CONFIG_STORE
+
+    conn = getattr(config_db._local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        config_db._local.conn = None
+    for table in config_db.get_tables().values():
+        table._ready_pid = None
+    for document in CONFIG_STORE.documents.values():
+        document.invalidate()
+    # Abgeleitete Stände (ConfigWatcher) beim nächsten Zugriff neu aufbauen
+    CONFIG_STORE.changes += 1
+
+
+@pytest.fixture(autouse=True)
+def config_dir(tmp_path, monkeypatch):
+    """JSON-Dateien und DATABASE_PATH (relative Pfade) im Temp-Verzeichnis statt im Projekt"""
+    from config_store import flush_config
+
+    flush_config()
+    monkeypatch.chdir(tmp_path)
+    _reset_config_cache()
+    yield tmp_path
+    flush_config()
+    _reset_config_cache()
+
+
+@pytest.fixture
+def sim_port(request):
+    """Eigene simulierte Schnittstelle pro Test (get_simulator hält den Zustand pro Port)"""
+    return f'sim://{request.node.name}-{next(_port_numbers)}?turnaround=0'
+
+
+@pytest.fixture
+def sim_layout(sim_port):
+    """Relais-Layout wie MODBUS_MODULES, alle Module am simulierten Bus"""
+    return RelayLayout({
+        module.index: {'slave_id': module.slave_id, 'base_addr': module.base_addr,
+                       'num_coils': module.num_coils, 'port': sim_port, 'baud_rate': TEST_BAUDRATE}
+        for module in RELAY_LAYOUT.modules
+    })
+
+
+@pytest.fixture
+def controller(sim_layout):
+    from relay_controller import RelayController
+
+    relay_controller = RelayController(sim_layout)
+    yield relay_controller
+    relay_controller.buses.close()
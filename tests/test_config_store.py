@@ -0,0 +1,48 @@
+"""
+ConfigDocument: verzögertes Schreiben und Lesen-Ändern-Schreiben über mehrere Prozesse
+"""
+import json
+import multiprocessing
+import time
+
+from config_store import ConfigDocument
+
+WRITE_DELAY = 0.3
+
+
+def _document():
+    return ConfigDocument('test', 'test.json', write_delay=WRITE_DELAY, max_delay=1.0)
+
+
+def _set_key(key, value, delay=0.0):
+    time.sleep(delay)
+    document = _document()
+    saved, _ = document.update(lambda data: data.__setitem__(key, value))
+    # Verzögertes Schreiben abwarten (multiprocessing beendet den Prozess ohne atexit)
+    time.sleep(WRITE_DELAY * 2)
+    document.flush()
+    return saved
+
+
+def test_update_visible_before_delayed_write(config_dir):
+    document = _document()
+    document.update(lambda data: data.__setitem__('a', 1))
+    assert document.read() == {'a': 1}
+    assert not (config_dir / 'test.json').exists()
+
+    document.flush()
+    assert json.loads((config_dir / 'test.json').read_text()) == {'a': 1}
+
+
+def test_delayed_edit_not_overwritten_by_other_process(config_dir):
+    """Zweiter Prozess ändert, während die Änderung des ersten noch nicht geschrieben ist"""
+    context = multiprocessing.get_context('fork')
+    first = context.Process(target=_set_key, args=('1', 'Relais 1'))
+    second = context.Process(target=_set_key, args=('2', 'Relais 2', 0.1))
+    first.start()
+    second.start()
+    first.join(5)
+    second.join(5)
+
+    assert (first.exitcode, second.exitcode) == (0, 0)
+    assert json.loads((config_dir / 'test.json').read_text()) == {'1': 'Relais 1', '2': 'Relais 2'}
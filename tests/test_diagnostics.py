@@ -0,0 +1,116 @@
+"""
+Schnelle Relais-Diagnose über den Simulator: hängende, quer verbundene und sporadisch
+fehlerhafte Relais in einem simulierten Modul
+"""
+import threading
+
+import pytest
+
+from modbus_simulator import SimulatedModule, get_simulator
+from relay_diagnostics import build_test_patterns
+from relay_jobs import Job, run_fast_relay_test
+from relay_layout import RELAY_LAYOUT
+
+from conftest import TEST_BAUDRATE
+
+
+class FaultyModule(SimulatedModule):
+    """Simuliertes Modul mit Verdrahtungsfehlern (lokale Coil-Nummern)"""
+
+    def __init__(self, slave_id, num_coils=32, stuck_on=(), stuck_off=(), cross=None, flip=None):
+        """
+        Args:
+            stuck_on / stuck_off: Coils, die immer EIN bzw. AUS sind
+            cross: {treibende Coil: mitgeschaltete Coil} - ist die treibende EIN, ist die andere auch EIN
+            flip: (n, coil) - beim n-ten Schreiben (ab 1) landet coil invertiert
+        """
+        super().__init__(slave_id, num_coils)
+        self.stuck_on = stuck_on
+        self.stuck_off = stuck_off
+        self.cross = cross or {}
+        self.flip = flip
+        self.writes = 0
+
+    def write(self, start, count, bits):
+        super().write(start, count, bits)
+        self.writes += 1
+        if self.flip and self.flip[0] == self.writes:
+            self.coils ^= 1 << self.flip[1]
+        for driver, affected in self.cross.items():
+            if self.coils >> driver & 1:
+                self.coils |= 1 << affected
+        for coil in self.stuck_on:
+            self.coils |= 1 << coil
+        for coil in self.stuck_off:
+            self.coils &= ~(1 << coil)
+
+
+def _pattern_index(name):
+    modules = [(module.base_addr, module.num_coils) for module in RELAY_LAYOUT.modules]
+    return [pattern[0] for pattern in build_test_patterns(modules)].index(name)
+
+
+@pytest.fixture
+def fast_test(controller, sim_port):
+    """Führt den Schnelltest mit den angegebenen Fehlern am zweiten Modul aus"""
+    module = RELAY_LAYOUT.modules[1]
+
+    def run(**faults):
+        simulator = get_simulator(sim_port, TEST_BAUDRATE)
+        simulator.modules[module.slave_id] = FaultyModule(module.slave_id, module.num_coils, **faults)
+
+        def bus_call(cmd, *args):
+            if cmd == 'read_relay_mask':
+                state = controller.read_relay_state()
+                return state.mask if state is not None else None
+            return getattr(controller, cmd)(*args)
+
+        job = Job('relay_test_fast', {}, threading.Condition())
+        return run_fast_relay_test(job, bus_call)
+
+    run.base = module.base_addr
+    return run
+
+
+def test_healthy_modules_pass(fast_test):
+    result = fast_test()
+
+    assert result['success']
+    assert result['failed'] == []
+    assert result['report']['mismatched_patterns'] == 0
+
+
+def test_stuck_relays(fast_test):
+    base = fast_test.base
+    result = fast_test(stuck_on=(5,), stuck_off=(12,))
+    report = result['report']
+
+    assert report['stuck_on'] == [base + 5]
+    assert report['stuck_off'] == [base + 12]
+    assert report['cross_wired'] == []
+    assert not result['success']
+    assert {entry['relay'] for entry in result['failed']} == {base + 5, base + 12}
+
+
+def test_cross_wired_relays(fast_test):
+    base = fast_test.base
+    result = fast_test(cross={2: 7})
+    report = result['report']
+
+    assert report['stuck_on'] == [] and report['stuck_off'] == []
+    assert report['cross_wired'] == [{'relay': base + 2, 'affects': [base + 7]}]
+    assert not result['success']
+    assert [entry['relay'] for entry in result['failed']] == [base + 2]
+
+
+def test_intermittent_mismatch_fails(fast_test):
+    """Einmalige Abweichung im Schachbrett-Muster: nicht lokalisierbar, aber ein Fehler"""
+    base = fast_test.base
+    result = fast_test(flip=(_pattern_index('Schachbrett 1010') + 1, 9))
+    report = result['report']
+
+    assert report['stuck_on'] == [] and report['stuck_off'] == [] and report['cross_wired'] == []
+    assert report['mismatches'] == [{'pattern': 'Schachbrett 1010', 'relays': [base + 9]}]
+    assert not result['success']
+    assert len(result['failed']) == 1
+    assert 'Schachbrett 1010' in result['failed'][0]['error']
@@ -0,0 +1,126 @@
+"""
+Notaus: Schreibsperre nach send_emergency_off und verworfene Ergebnisse laufender Schreibbefehle
+"""
+import threading
+import time
+
+from modbus_controller import ModbusRTU
+from modbus_simulator import get_simulator
+from relay_daemon import RelayDaemon
+from relay_state import RelayState
+
+from conftest import TEST_BAUDRATE
+
+SLAVE_ID = 1
+NUM_COILS = 32
+
+
+def _modbus(port):
+    modbus = ModbusRTU(port, TEST_BAUDRATE, timeout=0.2)
+    modbus.prebuild_frames([(SLAVE_ID, NUM_COILS)])
+    return modbus
+
+
+def test_writes_rejected_after_emergency_off(sim_port):
+    modbus = _modbus(sim_port)
+    simulator = get_simulator(sim_port)
+
+    assert modbus.write_single_coil(SLAVE_ID, 3, True)
+    assert simulator.coils(SLAVE_ID) == 1 << 3
+
+    success, first_tx_time, done_time = modbus.send_emergency_off([SLAVE_ID])
+    assert success
+    assert simulator.coils(SLAVE_ID) == 0
+
+    requests = simulator.stats['requests']
+    assert not modbus.write_single_coil(SLAVE_ID, 3, True)
+    assert not modbus.write_coil_mask(SLAVE_ID, 0, NUM_COILS, 0xFF)
+    # Verworfene Schreibbefehle erreichen den Bus gar nicht
+    assert simulator.stats['requests'] == requests
+    assert simulator.coils(SLAVE_ID) == 0
+
+    # Lesen bleibt erlaubt, Schreiben erst nach der Freigabe
+    assert modbus.read_coil_mask(SLAVE_ID, 0, NUM_COILS) == 0
+    modbus.release_emergency()
+    assert modbus.write_single_coil(SLAVE_ID, 5, True)
+    assert simulator.coils(SLAVE_ID) == 1 << 5
+    modbus.close()
+
+
+def test_write_waiting_for_bus_is_dropped_after_emergency_off(sim_port):
+    """Schreibbefehl hat die Notaus-Prüfung schon passiert und wartet auf den Bus-Lock"""
+    modbus = _modbus(sim_port)
+    simulator = get_simulator(sim_port)
+    modbus.connect()
+    results = {}
+
+    modbus.bus_lock.acquire()
+    writer = threading.Thread(target=lambda: results.setdefault(
+        'write', modbus.write_single_coil(SLAVE_ID, 3, True)))
+    writer.start()
+    # Writer blockiert jetzt in _transaction vor dem Bus-Lock
+    time.sleep(0.05)
+    emergency = threading.Thread(target=lambda: results.setdefault(
+        'emergency', modbus.send_emergency_off([SLAVE_ID])))
+    emergency.start()
+    deadline = time.monotonic() + 1.0
+    while not modbus.emergency.is_set() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    modbus.bus_lock.release()
+    writer.join(2.0)
+    emergency.join(2.0)
+
+    # Egal wer den Bus zuerst bekommt: der Schreibbefehl wird nicht mehr gesendet
+    assert results['write'] is False
+    assert results['emergency'][0]
+    assert simulator.coils(SLAVE_ID) == 0
+    modbus.close()
+
+
+def test_controller_discards_results_of_interrupted_write(controller):
+    """Notaus kommt, während ein Szenenwechsel die Module schreibt"""
+    run = controller.buses.run
+
+    def run_with_emergency(fn, *args):
+        results = run(fn, *args)
+        controller.emergency_off()
+        return results
+
+    controller.buses.run = run_with_emergency
+    activated, failed = controller.apply_scene([1, 2, 40])
+    controller.buses.run = run
+
+    assert activated == []
+    assert failed == [1, 2, 40]
+    assert controller.state == RelayState()
+    assert controller.active == RelayState()
+    assert not any(controller.module_synced.values())
+    assert controller.read_relay_state() == RelayState()
+
+    # Nach der Freigabe wird wieder geschrieben (nichts gilt als bereits synchron)
+    controller.emergency_release()
+    activated, failed = controller.apply_scene([1, 2])
+    assert activated == [1, 2]
+    assert all(controller.module_synced.values())
+    assert controller.read_relay_state() == RelayState.from_relays([1, 2])
+
+
+def test_daemon_allows_all_off_during_emergency(controller, sim_port):
+    """Schaltende Befehle werden im Notaus abgewiesen, Alle-AUS sendet die Notaus-Frames erneut"""
+    simulator = get_simulator(sim_port)
+    daemon = RelayDaemon(socket_path=None, controller=controller)
+    worker = threading.Thread(target=daemon._worker_loop, daemon=True)
+    worker.start()
+
+    assert daemon.submit('set_relay', [1, True])['ok']
+    assert daemon.emergency_off()['success']
+
+    reply = daemon.submit('set_relay', [1, True])
+    assert not reply['ok'] and 'Notaus' in reply['error']
+    requests = simulator.stats['requests']
+    assert daemon.submit('reset_all_relays', []) == {'ok': True, 'result': True}
+    assert simulator.stats['requests'] > requests
+    assert controller.read_relay_state() == RelayState()
+
+    daemon.command_queue.put(None)
+    worker.join(2.0)
@@ -0,0 +1,109 @@
+"""
+GPIO-Status über Prozessgrenzen: der Monitor-Prozess schreibt den Status-Block und weckt
+Event-Streams in anderen Prozessen, die nur während eines offenen Streams mitlesen
+"""
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import gpio_monitor
+from gpio_monitor import GPIOMonitor, StatusNotifier, StatusSubscription
+
+
+@pytest.fixture
+def gpio_paths(tmp_path, monkeypatch):
+    """Status-Block und Socket-Verzeichnis im Temp-Verzeichnis, Worker-Zustand zurückgesetzt"""
+    monkeypatch.setattr(gpio_monitor, 'GPIO_STATUS_FILE', str(tmp_path / 'gpio_status'))
+    monkeypatch.setattr(gpio_monitor, 'GPIO_NOTIFY_DIR', str(tmp_path / 'gpio_notify'))
+    monkeypatch.setattr(gpio_monitor, 'gpio_monitor', None)
+    monkeypatch.setattr(gpio_monitor, '_shared_reader', None)
+    return tmp_path
+
+
+def _run_monitor(ready, step):
+    """Monitor-Prozess: Notaus nach step auslösen, danach wieder öffnen"""
+    monitor = GPIOMonitor()
+    ready.set()
+    step.wait(5)
+    monitor.is_active = True
+    monitor.notaus_start_time = time.time()
+    monitor.publish_status()
+    time.sleep(0.3)
+    monitor.cleanup()
+
+
+def _wait_for(predicate, last_seq, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        last_seq, status = gpio_monitor.wait_for_gpio_status(last_seq, timeout=deadline - time.monotonic())
+        if status and predicate(status):
+            return last_seq, status
+    pytest.fail("Status nicht rechtzeitig angekommen")
+
+
+def test_notifier_wakes_subscribers_and_removes_stale_sockets(gpio_paths):
+    directory = str(gpio_paths / 'gpio_notify')
+    notifier = StatusNotifier(directory)
+    assert notifier.notify() == 0
+
+    subscription = StatusSubscription(directory)
+    stale = StatusSubscription(directory)
+    # Worker beendet, Socket-Datei bleibt liegen
+    stale.sock.close()
+
+    assert notifier.notify() == 1
+    subscription.wait()
+    assert not os.path.exists(stale.path)
+
+    subscription.close()
+    notifier.close()
+    assert os.listdir(directory) == []
+
+
+def test_stream_in_other_process_receives_changes(gpio_paths):
+    context = multiprocessing.get_context('fork')
+    ready, step = context.Event(), context.Event()
+    monitor = context.Process(target=_run_monitor, args=(ready, step))
+    monitor.start()
+    assert ready.wait(5)
+
+    with gpio_monitor.gpio_status_stream():
+        seq, status = _wait_for(lambda status: status['monitoring'] is False and not status['active'], None)
+        step.set()
+        started = time.monotonic()
+        seq, status = _wait_for(lambda status: status['active'], seq)
+        # Geweckt statt gepollt: der Status ist ohne Intervall-Verzögerung da
+        assert time.monotonic() - started < 0.2
+        assert status['shutdown_pending']
+        assert len(os.listdir(gpio_paths / 'gpio_notify')) == 1
+    monitor.join(5)
+    assert monitor.exitcode == 0
+
+    # Ohne offenen Stream beendet sich der Watcher und meldet seinen Socket ab
+    deadline = time.monotonic() + 2.0
+    while gpio_monitor._shared_watcher is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert gpio_monitor._shared_watcher is None
+    assert os.listdir(gpio_paths / 'gpio_notify') == []
+
+
+def test_stream_falls_back_to_interval_without_notify_dir(gpio_paths, monkeypatch):
+    """Socket-Verzeichnis nicht anlegbar: der Stream liest im Ersatz-Intervall statt stehenzubleiben"""
+    (gpio_paths / 'blocked').write_text('')
+    monkeypatch.setattr(gpio_monitor, 'GPIO_NOTIFY_DIR', str(gpio_paths / 'blocked' / 'gpio_notify'))
+    monkeypatch.setattr(gpio_monitor, 'GPIO_NOTIFY_FALLBACK_INTERVAL', 0.05)
+    context = multiprocessing.get_context('fork')
+    ready, step = context.Event(), context.Event()
+    monitor = context.Process(target=_run_monitor, args=(ready, step))
+    monitor.start()
+    assert ready.wait(5)
+
+    with gpio_monitor.gpio_status_stream():
+        assert isinstance(gpio_monitor._shared_watcher, gpio_monitor.PolledSubscription)
+        seq, status = _wait_for(lambda status: not status['active'], None)
+        step.set()
+        _wait_for(lambda status: status['active'], seq)
+    monitor.join(5)
+    assert monitor.exitcode == 0
@@ -0,0 +1,148 @@
+"""
+GroupBatch: Überschneidungsprüfung über den Rückwärts-Index, Rollback und ein Schreiben pro Datei
+"""
+import json
+import multiprocessing
+import time
+
+import pytest
+
+import group_manager
+from group_manager import GroupBatch
+from config_store import flush_config
+
+
+@pytest.fixture
+def documents():
+    return group_manager._groups_document, group_manager._relay_names_document
+
+
+def _read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _slow_batch(relay_num, name, hold):
+    """Benennt ein Relais in einem GroupBatch, der hold Sekunden offen bleibt"""
+    with GroupBatch() as batch:
+        assert batch.set_relay_name(relay_num, name)[0]
+        time.sleep(hold)
+        assert batch.commit()
+    # multiprocessing beendet den Prozess ohne atexit
+    assert flush_config()
+
+
+def _set_name_later(relay_num, name, delay):
+    time.sleep(delay)
+    assert group_manager.set_relay_name(relay_num, name)[0]
+    assert flush_config()
+
+
+def test_overlap_with_existing_group_rejected():
+    assert group_manager.add_group('licht', 'Licht', [1, 2, 3]) == (True, "Gruppe 'Licht' erfolgreich erstellt")
+
+    success, message = group_manager.add_group('steckdose', 'Steckdose', [3, 4])
+    assert not success
+    assert "Gruppe 'Licht'" in message
+    assert set(group_manager.get_all_groups()) == {'licht'}
+
+
+def test_overlap_checked_against_changes_of_same_batch():
+    with GroupBatch() as batch:
+        assert batch.add_group('a', 'A', [10, 11])[0]
+        success, message = batch.add_group('b', 'B', [11, 12])
+        assert not success and "Gruppe 'A'" in message
+
+        # Nach dem Verkleinern von A ist Relais 11 frei, das alte Relais 10 nicht mehr belegt
+        assert batch.update_group('a', 'A', [10, 13])[0]
+        assert batch.add_group('b', 'B', [11, 12])[0]
+        assert batch.group_of(10) == 'a' and batch.group_of(11) == 'b'
+
+        assert batch.delete_group('a')[0]
+        assert batch.group_of(13) is None
+        assert batch.add_group('c', 'C', [10, 13])[0]
+        assert batch.commit()
+
+    groups = group_manager.get_all_groups()
+    assert groups['b']['relays'] == [11, 12]
+    assert groups['c']['relays'] == [10, 13]
+    assert 'a' not in groups
+
+
+def test_group_members_cannot_be_named():
+    group_manager.add_group('licht', 'Licht', [1, 2])
+
+    success, message = group_manager.set_relay_name(2, 'Lampe')
+    assert not success and "Gruppe 'Licht'" in message
+    assert group_manager.set_relay_name(5, 'Lampe')[0]
+    assert group_manager.get_all_relay_names()[5]['name'] == 'Lampe'
+
+
+def test_rollback_discards_changes(documents):
+    groups_document, names_document = documents
+    saves = groups_document.saves, names_document.saves
+
+    with GroupBatch() as batch:
+        assert batch.add_group('licht', 'Licht', [1, 2])[0]
+        assert batch.set_relay_name(5, 'Lampe')[0]
+        batch.rollback()
+
+    assert (groups_document.saves, names_document.saves) == saves
+    assert group_manager.get_all_groups() == {}
+    assert group_manager.get_all_relay_names() == {}
+
+
+def test_failed_operation_rolls_back():
+    group_manager.add_group('licht', 'Licht', [1, 2])
+
+    assert not group_manager.update_group('licht', 'Licht', [1])[0]
+    assert group_manager.get_all_groups()['licht']['relays'] == [1, 2]
+
+
+def test_commit_writes_each_file_once(documents, config_dir):
+    groups_document, names_document = documents
+    saves = groups_document.saves, names_document.saves
+    writes = groups_document.writes, names_document.writes
+
+    with GroupBatch() as batch:
+        assert batch.add_group('licht', 'Licht', [1, 2])[0]
+        assert batch.add_group('steckdose', 'Steckdose', [3, 4])[0]
+        for relay_num in range(10, 42):
+            assert batch.set_relay_name(relay_num, f'Relais {relay_num}')[0]
+        assert batch.commit()
+    flush_config()
+
+    assert (groups_document.saves - saves[0], names_document.saves - saves[1]) == (1, 1)
+    assert (groups_document.writes - writes[0], names_document.writes - writes[1]) == (1, 1)
+    assert set(_read_json(config_dir / group_manager.GROUPS_FILE)) == {'licht', 'steckdose'}
+    assert len(_read_json(config_dir / group_manager.RELAY_NAMES_FILE)) == 32
+
+
+def test_bulk_names_single_save(documents):
+    groups_document, names_document = documents
+    group_manager.add_group('licht', 'Licht', [1, 2])
+    saves = groups_document.saves, names_document.saves
+
+    success, message, failed = group_manager.bulk_set_relay_names(
+        {str(relay_num): {'name': f'R{relay_num}', 'category': 'Licht'} for relay_num in range(0, 8)})
+
+    assert success and message == "6 Relais benannt"
+    assert sorted(relay_num for relay_num, error in failed) == [1, 2]
+    assert (groups_document.saves - saves[0], names_document.saves - saves[1]) == (0, 1)
+
+
+def test_batches_of_two_processes_keep_both_changes(config_dir):
+    """Ein zweiter Worker benennt ein Relais, während der Batch des ersten noch offen ist"""
+    context = multiprocessing.get_context('fork')
+    first = context.Process(target=_slow_batch, args=(1, 'Lampe', 0.3))
+    second = context.Process(target=_set_name_later, args=(2, 'Heizung', 0.1))
+    first.start()
+    second.start()
+    first.join(5)
+    second.join(5)
+
+    assert (first.exitcode, second.exitcode) == (0, 0)
+    names = _read_json(config_dir / group_manager.RELAY_NAMES_FILE)
+    assert {relay_num: data['name'] for relay_num, data in names.items()} == {'1': 'Lampe', '2': 'Heizung'}
+    assert {relay_num: data['name'] for relay_num, data in group_manager.get_all_relay_names().items()
+            if relay_num in (1, 2)} == {1: 'Lampe', 2: 'Heizung'}
@@ -0,0 +1,35 @@
+"""
+Gruppen-Zugehörigkeit im Schaltpfad: In-Memory-Index aus relais_config, neu aufgebaut nur
+nach einer Konfigurationsänderung
+"""
+import contextlib
+
+import relais_manager
+from relais_manager import update_relay_config
+
+
+def _forbid_database(monkeypatch):
+    @contextlib.contextmanager
+    def transaction(write=False):
+        raise AssertionError("Datenbankzugriff im Schaltpfad")
+        yield
+
+    monkeypatch.setattr(relais_manager._relais_table, 'transaction', transaction)
+
+
+def test_group_lookup_without_database(controller, monkeypatch):
+    assert update_relay_config(1, group_number=5, name='Licht')[0]
+    assert update_relay_config(2, group_number=5)[0]
+    assert controller.get_relay_group(1) == ('Gruppe_5', [1, 2])
+
+    # Solange sich keine Konfiguration ändert, beantwortet der Index alle Anfragen
+    with monkeypatch.context() as patch:
+        _forbid_database(patch)
+        assert controller.get_relay_group(2) == ('Gruppe_5', [1, 2])
+        assert controller.get_relay_group(3) == (None, [3])
+        assert relais_manager.get_relay_group_info(1) == (5, 'Licht', [1, 2])
+
+    assert update_relay_config(3, group_number=5)[0]
+    assert controller.get_relay_group(1) == ('Gruppe_5', [1, 2, 3])
+    assert update_relay_config(1, group_number=0)[0]
+    assert controller.get_relay_group(1) == (None, [1])
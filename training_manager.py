@@ -1,16 +1,50 @@
 """
 VDE Messwand - Übungsmodus-Verwaltung
 Konfiguration welche Relais bei welcher Übung/Kategorie geschaltet werden
+Die Zuordnungen liegen in der Tabelle training_config (eine Zeile pro Relais),
+training_config.json ist Import-Quelle und Backup (siehe config_db).
 """
-import json
-import os
+from config_db import register_table
+from config_store import register_document
+from relay_layout import RELAY_LAYOUT
 
 TRAINING_CONFIG_FILE = 'training_config.json'
 
+TRAINING_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS training_config (
+        category TEXT NOT NULL,
+        page_id TEXT NOT NULL,
+        relay_num INTEGER NOT NULL,
+        PRIMARY KEY (category, page_id, relay_num)
+    ) WITHOUT ROWID
+    ''',
+    # Rückwärts-Suche Seite -> Kategorien
+    'CREATE INDEX IF NOT EXISTS idx_training_page ON training_config (page_id, category)',
+]
+
+
+def _import_training(conn, config):
+    """Übernimmt training_config.json (category -> page_id -> [relais]) in die Tabelle"""
+    conn.executemany('INSERT OR IGNORE INTO training_config (category, page_id, relay_num) VALUES (?, ?, ?)',
+                     [(category, page_id, int(relay_num))
+                      for category, pages in config.items()
+                      for page_id, relais_list in pages.items()
+                      for relay_num in relais_list])
+
+
+def _export_training(conn):
+    """Tabelle im Format von training_config.json"""
+    config = {}
+    for category, page_id, relay_num in conn.execute(
+            'SELECT category, page_id, relay_num FROM training_config ORDER BY category, page_id, relay_num'):
+        config.setdefault(category, {}).setdefault(page_id, []).append(relay_num)
+    return config
+
 
 def load_training_config():
     """
-    Lädt Übungsmodus-Konfiguration aus JSON-Datei
+    Lädt Übungsmodus-Konfiguration aus der Datenbank
 
     Returns:
         Dictionary mit Training-Konfiguration
@@ -25,26 +59,22 @@ def load_training_config():
             }
         }
     """
-    if os.path.exists(TRAINING_CONFIG_FILE):
-        try:
-            with open(TRAINING_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-
-                # Prüfe ob alte Struktur (page → category)
-                # Alte Struktur: Keys sind page_ids wie "fluke", "benning"
-                # Neue Struktur: Keys sind Kategorien wie "RISO", "Zi"
-                if config:
-                    first_key = list(config.keys())[0]
-                    # Wenn erster Key eine bekannte Seite ist, alte Struktur
-                    if first_key in ['fluke', 'benning', 'gossen', 'general']:
-                        print("⚠ Alte Training-Config Struktur erkannt, konvertiere...")
-                        return convert_old_to_new_structure(config)
-
-                return config
-        except Exception as e:
-            print(f"Error loading training config: {e}")
-            return {}
-    return {}
+    return _training_table.export()
+
+
+def _migrate_training_config(config):
+    """
+    Prüft ob alte Struktur (page → category) vorliegt und liefert dann die neue, sonst None.
+    Alte Struktur: Keys sind page_ids wie "fluke", "benning"
+    Neue Struktur: Keys sind Kategorien wie "RISO", "Zi"
+    """
+    if config:
+        first_key = list(config.keys())[0]
+        # Wenn erster Key eine bekannte Seite ist, alte Struktur
+        if first_key in ['fluke', 'benning', 'gossen', 'general']:
+            print("⚠ Alte Training-Config Struktur erkannt, konvertiere...")
+            return convert_old_to_new_structure(config)
+    return None
 
 
 def convert_old_to_new_structure(old_config):
@@ -56,7 +86,7 @@ def convert_old_to_new_structure(old_config):
         old_config: Alte Struktur
 
     Returns:
-        Neue Struktur
+        Neue Struktur (wird vor dem Import in die Datenbank zurückgeschrieben)
     """
     new_config = {}
 
@@ -66,16 +96,19 @@ def convert_old_to_new_structure(old_config):
                 new_config[category] = {}
             new_config[category][page_id] = relais_list
 
-    # Speichere neue Struktur
-    save_training_config(new_config)
     print("✓ Training-Config erfolgreich konvertiert")
 
     return new_config
 
 
+# training_config.json: Import-Quelle beim ersten Start (alte Struktur wird migriert) und Backup
+_training_document = register_document('training_config', TRAINING_CONFIG_FILE, migrate=_migrate_training_config)
+_training_table = register_table(_training_document, TRAINING_SCHEMA, _import_training, _export_training)
+
+
 def save_training_config(config):
     """
-    Speichert Übungsmodus-Konfiguration in JSON-Datei
+    Ersetzt die komplette Übungsmodus-Konfiguration (eine Transaktion)
 
     Args:
         config: Dictionary mit Training-Konfiguration
@@ -84,9 +117,10 @@ def save_training_config(config):
         True bei Erfolg, False bei Fehler
     """
     try:
-        with open(TRAINING_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        print(f"✓ Training config saved to {TRAINING_CONFIG_FILE}")
+        with _training_table.transaction(write=True) as conn:
+            conn.execute('DELETE FROM training_config')
+            _import_training(conn, config)
+        print(f"✓ Training config saved ({len(config)} Kategorien)")
         return True
     except Exception as e:
         print(f"Error saving training config: {e}")
@@ -117,16 +151,11 @@ def get_relais_for_training(page_id, category):
     Returns:
         Liste von Relais-Nummern
     """
-    config = load_training_config()
-
-    # NEUE STRUKTUR: config[category][page_id]
-    if category not in config:
-        return []
-
-    if page_id not in config[category]:
-        return []
-
-    return config[category][page_id]
+    # NEUE STRUKTUR: (category, page_id) ist der Anfang des Primärschlüssels
+    with _training_table.transaction() as conn:
+        return [relay_num for relay_num, in conn.execute(
+            'SELECT relay_num FROM training_config WHERE category = ? AND page_id = ? ORDER BY relay_num',
+            (category, page_id))]
 
 
 def update_training_mapping(category, page_id, relais_list):
@@ -142,8 +171,6 @@ def update_training_mapping(category, page_id, relais_list):
     Returns:
         (success, message)
     """
-    config = load_training_config()
-
     # Validiere page_id
     valid_pages = [p['page_id'] for p in get_training_pages()]
     if page_id not in valid_pages:
@@ -154,31 +181,21 @@ def update_training_mapping(category, page_id, relais_list):
         return False, "Relais-Liste muss ein Array sein"
 
     for relay_num in relais_list:
-        if not isinstance(relay_num, int) or not 0 <= relay_num <= 63:
+        if not isinstance(relay_num, int) or not RELAY_LAYOUT.is_valid(relay_num):
             return False, f"Ungültige Relais-Nummer: {relay_num}"
 
-    # NEUE STRUKTUR: config[category][page_id]
-    # Erstelle Kategorie-Eintrag falls nicht vorhanden
-    if category not in config:
-        config[category] = {}
-
-    # Setze oder lösche Seiten-Mapping
-    if relais_list:
-        config[category][page_id] = sorted(relais_list)
-    else:
-        # Leere Liste = Mapping löschen
-        if page_id in config[category]:
-            del config[category][page_id]
-
-        # Wenn Kategorie leer, lösche sie
-        if not config[category]:
-            del config[category]
-
-    if save_training_config(config):
-        return True, f"Mapping für {category}/{page_id} aktualisiert"
-    else:
+    # Seiten-Mapping ersetzen; leere Liste = Mapping löschen (eine Kategorie ohne Zeilen gibt es nicht)
+    try:
+        with _training_table.transaction(write=True) as conn:
+            conn.execute('DELETE FROM training_config WHERE category = ? AND page_id = ?', (category, page_id))
+            conn.executemany('INSERT OR IGNORE INTO training_config (category, page_id, relay_num) VALUES (?, ?, ?)',
+                             [(category, page_id, relay_num) for relay_num in relais_list])
+    except Exception as e:
+        print(f"Error updating training mapping: {e}")
         return False, "Fehler beim Speichern"
 
+    return True, f"Mapping für {category}/{page_id} aktualisiert"
+
 
 def delete_training_mapping(category, page_id):
     """
@@ -204,8 +221,13 @@ def get_all_mappings_for_category(category):
     Returns:
         Dictionary {page_id: [relais]}
     """
-    config = load_training_config()
-    return config.get(category, {})
+    mappings = {}
+    with _training_table.transaction() as conn:
+        for page_id, relay_num in conn.execute(
+                'SELECT page_id, relay_num FROM training_config WHERE category = ? ORDER BY page_id, relay_num',
+                (category,)):
+            mappings.setdefault(page_id, []).append(relay_num)
+    return mappings
 
 
 def get_all_mappings_for_page(page_id):
@@ -219,12 +241,12 @@ def get_all_mappings_for_page(page_id):
     Returns:
         Dictionary {category: [relais]}
     """
-    config = load_training_config()
     result = {}
-
-    for category, pages in config.items():
-        if page_id in pages:
-            result[category] = pages[page_id]
+    with _training_table.transaction() as conn:
+        for category, relay_num in conn.execute(
+                'SELECT category, relay_num FROM training_config WHERE page_id = ? ORDER BY category, relay_num',
+                (page_id,)):
+            result.setdefault(category, []).append(relay_num)
 
     return result
 
@@ -247,24 +269,19 @@ def get_statistics():
     Returns:
         Dictionary mit Statistiken
     """
-    config = load_training_config()
-
-    total_mappings = 0
-    configured_categories = len(config)
-    pages_used = set()
-
-    # NEUE STRUKTUR: category → pages
-    for category, pages in config.items():
-        if pages:
-            total_mappings += len(pages)
-            pages_used.update(pages.keys())
+    with _training_table.transaction() as conn:
+        categories = [category for category, in conn.execute(
+            'SELECT DISTINCT category FROM training_config ORDER BY category')]
+        configured_pages = conn.execute('SELECT COUNT(DISTINCT page_id) FROM training_config').fetchone()[0]
+        total_mappings = conn.execute(
+            'SELECT COUNT(*) FROM (SELECT DISTINCT category, page_id FROM training_config)').fetchone()[0]
 
     return {
-        'total_categories': configured_categories,
+        'total_categories': len(categories),
         'total_pages': len(get_training_pages()),
-        'configured_pages': len(pages_used),
+        'configured_pages': configured_pages,
         'total_mappings': total_mappings,
-        'categories_list': sorted(config.keys())
+        'categories_list': categories
     }
 
 